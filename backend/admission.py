@@ -0,0 +1,178 @@
+"""
+Admission control for new calls.
+A call is admitted only while this replica has a free call slot, its
+inference backlog (utterances waiting between pipeline stages) is below
+ADMISSION_MAX_BACKLOG, and the cluster holds fewer than MAX_CONCURRENT_CALLS.
+
+The cluster-wide count is a Redis sorted set of call leases scored by expiry.
+Each replica renews the leases of its own calls, so calls on a replica that
+died drop out after ADMISSION_LEASE_SECONDS instead of leaking slots. If
+Redis is unreachable, admission falls back to the local limits.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Optional, Set
+
+import redis.asyncio as redis
+
+from config import settings
+from metrics import admission_cluster_calls, admission_decisions, admission_saturation
+
+logger = logging.getLogger(__name__)
+
+_LEASES_KEY = "admission:calls"
+
+# Expire stale leases, then take a lease if the cluster has room. Returns the
+# cluster call count, -1 when full, or -2 when the call already holds a lease.
+# KEYS[1] lease set; ARGV: now, lease expiry, call id, cluster limit
+_ADMIT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) then
+    return -2
+end
+local count = redis.call('ZCARD', KEYS[1])
+if count >= tonumber(ARGV[4]) then
+    return -1
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+return count + 1
+"""
+
+
+class AdmissionRejected(Exception):
+    """A new call was turned away; retry_after is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"call rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Tracks this replica's call slots and leases them against the cluster-wide limit."""
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis],
+        backlog: Callable[[], int] = lambda: 0,
+        max_calls: int = None,
+        replica_max_calls: int = None,
+        max_backlog: int = None,
+        lease_seconds: float = None,
+        retry_after: int = None,
+    ):
+        self.redis = redis_client
+        self.backlog = backlog
+        self.max_calls = max_calls or settings.MAX_CONCURRENT_CALLS
+        self.replica_max_calls = replica_max_calls or settings.REPLICA_MAX_CALLS or self.max_calls
+        self.max_backlog = settings.ADMISSION_MAX_BACKLOG if max_backlog is None else max_backlog
+        self.lease_seconds = lease_seconds or settings.ADMISSION_LEASE_SECONDS
+        self.retry_after = retry_after or settings.ADMISSION_RETRY_AFTER_SECONDS
+        self.calls: Set[str] = set()
+        self.cluster_calls = 0
+        self._admit_script = redis_client.register_script(_ADMIT_SCRIPT) if redis_client else None
+
+    @property
+    def saturation(self) -> float:
+        """Load against the tightest limit: 1.0 means new calls are being turned away."""
+        levels = [len(self.calls) / self.replica_max_calls, self.cluster_calls / self.max_calls]
+        if self.max_backlog:
+            levels.append(self.backlog() / self.max_backlog)
+        return max(levels)
+
+    def check(self):
+        """Raise AdmissionRejected if a new call would be turned away right now; takes nothing."""
+        reason = self._local_reason()
+        if reason is None and self.cluster_calls >= self.max_calls:
+            reason = "cluster"
+        if reason:
+            self._reject(reason)
+
+    async def admit(self, call_id: str):
+        """Take a call slot and cluster lease for call_id, or raise AdmissionRejected.
+
+        A call_id that is already admitted is rejected as a duplicate: two
+        connections sharing one slot would free it when the first one ends.
+        """
+        if call_id in self.calls:
+            self._reject("duplicate")
+        reason = self._local_reason()
+        if reason:
+            self._reject(reason)
+        # Hold the slot while Redis answers, so concurrent admits cannot overshoot it
+        self.calls.add(call_id)
+        if self._admit_script is not None:
+            try:
+                now = time.time()
+                count = await self._admit_script(
+                    keys=[_LEASES_KEY], args=[now, now + self.lease_seconds, call_id, self.max_calls]
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Cluster admission unavailable, using local limits for {call_id}: {e}")
+            except asyncio.CancelledError:
+                self.calls.discard(call_id)
+                raise
+            else:
+                if count == -2:
+                    self.calls.discard(call_id)
+                    self._reject("duplicate")
+                if count < 0:
+                    self.calls.discard(call_id)
+                    self.cluster_calls = self.max_calls
+                    self._reject("cluster")
+                self.cluster_calls = count
+        admission_decisions.labels(result="admitted").inc()
+        self._export()
+
+    async def release(self, call_id: str):
+        """Give back the call's slot and lease."""
+        if call_id not in self.calls:
+            return
+        self.calls.discard(call_id)
+        self._export()
+        if self.redis is None:
+            return
+        try:
+            await self.redis.zrem(_LEASES_KEY, call_id)
+        except redis.RedisError as e:
+            logger.warning(f"Could not release admission lease for {call_id}: {e}")
+
+    async def run(self):
+        """Renew this replica's leases and refresh the cluster count until cancelled."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self.renew()
+
+    async def renew(self):
+        if self.redis is None:
+            self._export()
+            return
+        try:
+            now = time.time()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if self.calls:
+                    pipe.zadd(_LEASES_KEY, {call_id: now + self.lease_seconds for call_id in self.calls})
+                pipe.zremrangebyscore(_LEASES_KEY, "-inf", now)
+                pipe.zcard(_LEASES_KEY)
+                results = await pipe.execute()
+            self.cluster_calls = results[-1]
+        except redis.RedisError as e:
+            logger.warning(f"Admission lease renewal failed: {e}")
+        self._export()
+
+    def _local_reason(self) -> Optional[str]:
+        if len(self.calls) >= self.replica_max_calls:
+            return "replica"
+        if self.max_backlog and self.backlog() >= self.max_backlog:
+            return "backlog"
+        return None
+
+    def _reject(self, reason: str):
+        admission_decisions.labels(result=f"rejected_{reason}").inc()
+        self._export()
+        raise AdmissionRejected(reason, self.retry_after)
+
+    def _export(self):
+        admission_saturation.set(self.saturation)
+        admission_cluster_calls.set(self.cluster_calls)
@@ -0,0 +1,190 @@
+"""
+Per-call inbound audio buffering.
+AudioRingBuffer is a fixed, preallocated byte ring between the socket reader
+and the pipeline: writes copy once into it, reads hand out zero-copy views.
+When the pipeline falls behind, the overflow policy decides what is lost —
+the oldest audio, the newest audio, or nothing (the socket reader waits).
+PCMScratch converts int16 PCM to float32 into a reused buffer.
+"""
+import asyncio
+import time
+from typing import Optional, Union
+
+import numpy as np
+
+from metrics import audio_buffer_backpressure_seconds
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BACKPRESSURE = "backpressure"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, BACKPRESSURE)
+
+_BYTES_PER_SAMPLE = 2
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class BufferClosed(Exception):
+    """The stream was closed and all of its audio has been read."""
+
+
+class AudioRingBuffer:
+    """
+    Byte ring of int16 PCM for one call. Every write and read is whole
+    samples, so a view never splits a sample. A view returned by read() or
+    get() points into the ring and stays valid until the caller next awaits;
+    consume or copy it before that.
+    """
+
+    def __init__(self, capacity: int, policy: str = DROP_OLDEST, backpressure_timeout: float = 0.5):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r}")
+        self.capacity = capacity - capacity % _BYTES_PER_SAMPLE
+        if self.capacity <= 0:
+            raise ValueError("ring buffer capacity must hold at least one sample")
+        self.policy = policy
+        self.backpressure_timeout = backpressure_timeout
+        self.dropped_bytes = 0
+        self._data = bytearray(self.capacity)
+        self._view = memoryview(self._data)
+        # Absolute positions; size is their difference, the ring offset their remainder
+        self._read = 0
+        self._write = 0
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return self._write - self._read
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def free(self) -> int:
+        return self.capacity - len(self)
+
+    def write(self, data: Buffer) -> int:
+        """
+        Copy data in, applying the overflow policy (backpressure counts as
+        drop-newest here; use put() to wait instead). Returns bytes dropped.
+        """
+        data = memoryview(data).cast("B")
+        # A trailing half sample cannot be played; it counts as dropped
+        dropped = len(data) % _BYTES_PER_SAMPLE
+        data = data[:len(data) - dropped]
+        if len(data) > self.free:
+            if self.policy == DROP_OLDEST:
+                if len(data) > self.capacity:
+                    dropped += len(data) - self.capacity
+                    data = data[len(data) - self.capacity:]
+                excess = len(data) - self.free
+                self._read += excess
+                dropped += excess
+            else:
+                dropped += len(data) - self.free
+                data = data[:self.free]
+        self._copy_in(data)
+        self.dropped_bytes += dropped
+        return dropped
+
+    async def put(self, data: Buffer) -> int:
+        """
+        Write data. Under the backpressure policy, wait (up to
+        backpressure_timeout) for the reader to make room instead of
+        dropping, which holds off the socket reader. Returns bytes dropped.
+        """
+        if self.policy != BACKPRESSURE or len(data) <= self.free:
+            return self.write(data)
+        data = memoryview(data).cast("B")
+        started = time.perf_counter()
+        deadline = started + self.backpressure_timeout
+        try:
+            while not self._closed:
+                room = self.free
+                if room:
+                    # Accept what fits now, so data larger than the ring still gets through
+                    self.write(data[:room])
+                    data = data[room:]
+                    if not data:
+                        return 0
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._writable.clear()
+                try:
+                    await asyncio.wait_for(self._writable.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            audio_buffer_backpressure_seconds.observe(time.perf_counter() - started)
+        dropped = len(data)
+        self.dropped_bytes += dropped
+        return dropped
+
+    def read(self, max_bytes: int = None) -> Optional[memoryview]:
+        """Consume up to max_bytes of contiguous audio as a view into the ring; None when empty."""
+        size = len(self)
+        if not size:
+            return None
+        offset = self._read % self.capacity
+        count = min(size, self.capacity - offset)
+        if max_bytes is not None:
+            count = min(count, max_bytes - max_bytes % _BYTES_PER_SAMPLE)
+        self._read += count
+        if not len(self):
+            self._readable.clear()
+        self._writable.set()
+        return self._view[offset:offset + count]
+
+    async def get(self, timeout: float, max_bytes: int = None) -> Optional[memoryview]:
+        """
+        Wait up to timeout for audio, then read(); None on timeout. Raises
+        BufferClosed once the buffer is closed and drained, so readers stop.
+        """
+        if not len(self) and not self._closed:
+            try:
+                await asyncio.wait_for(self._readable.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        view = self.read(max_bytes)
+        if view is None and self._closed:
+            raise BufferClosed()
+        return view
+
+    def close(self):
+        """Wake any waiting reader and writer; buffered audio can still be read."""
+        self._closed = True
+        self._readable.set()
+        self._writable.set()
+
+    def _copy_in(self, data: memoryview):
+        count = len(data)
+        if not count:
+            return
+        offset = self._write % self.capacity
+        first = min(count, self.capacity - offset)
+        self._view[offset:offset + first] = data[:first]
+        self._view[:count - first] = data[first:]
+        self._write += count
+        self._readable.set()
+
+
+class PCMScratch:
+    """
+    int16 PCM → float32 in [-1, 1) into a buffer reused across calls to
+    floats(). The returned array is overwritten by the next conversion, so
+    each user that keeps one alive while awaiting needs its own scratch.
+    """
+
+    def __init__(self):
+        self._buffer = np.zeros(0, dtype=np.float32)
+
+    def floats(self, pcm: Buffer) -> np.ndarray:
+        samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // _BYTES_PER_SAMPLE)
+        if len(self._buffer) < len(samples):
+            self._buffer = np.zeros(max(len(samples), 2 * len(self._buffer)), dtype=np.float32)
+        out = self._buffer[:len(samples)]
+        np.multiply(samples, 1 / 32768, out=out, casting="unsafe")
+        return out
@@ -0,0 +1,283 @@
+"""
+Codecs and sample-rate conversion between call legs, the pipeline and TTS.
+G.711 µ-law / A-law go through lookup tables (256 entries to decode, 65536
+to encode); rate changes use a streaming polyphase FIR resampler. Both work
+on whole frames with NumPy and reuse their work buffers, so there is no
+per-sample Python code on the audio path. Opus is available for WebSocket
+clients when opuslib (and libopus) is installed.
+"""
+from functools import lru_cache
+from math import gcd
+from typing import List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import settings
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+CODECS = ("pcm", "ulaw", "alaw", "opus")
+_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+_OPUS_FRAME_MS = 20
+
+# Taps per polyphase branch; ~70 dB stopband with the Kaiser window below
+_TAPS_PER_PHASE = 24
+_KAISER_BETA = 8.0
+_CUTOFF = 0.9
+# Frames up to this many input samples (20 ms at 48 kHz) use a cached frame matrix
+_MATRIX_MAX_INPUT = 960
+
+
+# ── G.711 ─────────────────────────────────────────────────────────────────────
+
+def _ulaw_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _alaw_decode_table() -> np.ndarray:
+    codes = np.arange(256, dtype=np.int32) ^ 0x55
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = np.where(
+        exponent == 0, (mantissa << 4) + 8, ((mantissa << 4) + 0x108) << np.maximum(exponent - 1, 0)
+    )
+    return np.where(codes & 0x80, magnitude, -magnitude).astype(np.int16)
+
+
+def _ulaw_encode_table() -> np.ndarray:
+    """Indexed by the int16 sample reinterpreted as uint16."""
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(pcm), 8159) + (0x84 >> 2)
+    segment = np.searchsorted(np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), magnitude)
+    code = (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    return ((np.where(segment >= 8, 0x7F, code) ^ mask) & 0xFF).astype(np.uint8)
+
+
+def _alaw_encode_table() -> np.ndarray:
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    magnitude = np.where(pcm >= 0, pcm, -pcm - 1)
+    segment = np.searchsorted(np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF]), magnitude)
+    shift = np.where(segment < 2, 1, segment)
+    code = (segment << 4) | ((magnitude >> shift) & 0x0F)
+    return ((np.where(segment >= 8, 0x7F, code) ^ mask) & 0xFF).astype(np.uint8)
+
+
+_DECODE_TABLES = {"ulaw": _ulaw_decode_table(), "alaw": _alaw_decode_table()}
+_ENCODE_TABLES = {"ulaw": _ulaw_encode_table(), "alaw": _alaw_encode_table()}
+
+
+def g711_decode(codec: str, data: bytes, out: np.ndarray = None) -> np.ndarray:
+    """Decode µ-law/A-law bytes to int16 samples (into out when given)."""
+    codes = np.frombuffer(data, dtype=np.uint8)
+    if out is None:
+        out = np.empty(len(codes), dtype=np.int16)
+    return np.take(_DECODE_TABLES[codec], codes, out=out[:len(codes)])
+
+
+def g711_encode(codec: str, samples: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """Encode int16 samples to µ-law/A-law codes (into out when given)."""
+    if out is None:
+        out = np.empty(len(samples), dtype=np.uint8)
+    return np.take(_ENCODE_TABLES[codec], samples.view(np.uint16), out=out[:len(samples)])
+
+
+# ── Resampling ────────────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=None)
+def _polyphase_bank(up: int, down: int, taps: int) -> np.ndarray:
+    """Windowed-sinc lowpass split into `up` branches, each reversed to match a sliding window."""
+    length = up * taps
+    cutoff = _CUTOFF * 0.5 / max(up, down)
+    n = np.arange(length) - (length - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, _KAISER_BETA) * up
+    return np.ascontiguousarray(h.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+
+
+def _frame_taps(up: int, down: int, taps: int, time: int, count_in: int):
+    """Window start and filter branch of every output sample a frame produces."""
+    history = taps - 1
+    count = max(0, -(-((history + count_in) * up - time) // down))
+    times = time + np.arange(count, dtype=np.int64) * down
+    return times // up - history, times % up
+
+
+@lru_cache(maxsize=256)
+def _frame_matrix(up: int, down: int, taps: int, time: int, count_in: int) -> np.ndarray:
+    """
+    The whole frame as one (outputs × inputs) matrix, so a frame costs a
+    single matrix-vector product. Streams with the same rates and frame size
+    land on the same few phases and share these.
+    """
+    starts, phases = _frame_taps(up, down, taps, time, count_in)
+    matrix = np.zeros((len(starts), taps - 1 + count_in), dtype=np.float32)
+    rows = np.arange(len(starts))[:, None]
+    matrix[rows, starts[:, None] + np.arange(taps)] = _polyphase_bank(up, down, taps)[phases]
+    return matrix
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler for int16 mono audio at a rational ratio.
+    Filter history and output phase carry over between frames, so frame
+    boundaries are seamless. process() returns a view into a reused buffer
+    that is valid until the next call.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, taps: int = _TAPS_PER_PHASE):
+        divisor = gcd(src_rate, dst_rate)
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.up = dst_rate // divisor
+        self.down = src_rate // divisor
+        self.taps = taps
+        self._history = taps - 1
+        self._input = np.zeros(self._history, dtype=np.float32)
+        self._acc = np.zeros(0, dtype=np.float32)
+        self._output = np.zeros(0, dtype=np.int16)
+        # Position of the next output sample, in upsampled units from the start of _input
+        self._time = self._history * self.up
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return samples
+        count_in = len(samples)
+        total = self._history + count_in
+        if len(self._input) < total:
+            grown = np.zeros(total, dtype=np.float32)
+            grown[:self._history] = self._input[:self._history]
+            self._input = grown
+        self._input[self._history:total] = samples
+
+        if count_in <= _MATRIX_MAX_INPUT:
+            matrix = _frame_matrix(self.up, self.down, self.taps, self._time, count_in)
+            count = len(matrix)
+            acc = np.matmul(matrix, self._input[:total], out=self._reserve(count))
+        else:
+            # Long TTS chunks: gather the windows instead of building a huge matrix
+            starts, phases = _frame_taps(self.up, self.down, self.taps, self._time, count_in)
+            count = len(starts)
+            windows = sliding_window_view(self._input[:total], self.taps)
+            bank = _polyphase_bank(self.up, self.down, self.taps)
+            acc = np.einsum("ij,ij->i", windows[starts], bank[phases], out=self._reserve(count))
+        np.rint(acc, out=acc)
+        np.maximum(acc, -32768, out=acc)
+        np.minimum(acc, 32767, out=acc)
+        out = self._output[:count]
+        np.copyto(out, acc, casting="unsafe")
+
+        self._time += count * self.down - count_in * self.up
+        self._input[:self._history] = self._input[count_in:total]
+        return out
+
+    def _reserve(self, count: int) -> np.ndarray:
+        if len(self._acc) < count:
+            self._acc = np.zeros(count, dtype=np.float32)
+            self._output = np.zeros(count, dtype=np.int16)
+        return self._acc[:count]
+
+
+# ── Per-call transcoding ──────────────────────────────────────────────────────
+
+class AudioTranscoder:
+    """
+    Converts one call leg's audio format to and from the pipeline's.
+    decode(): leg frames → int16 PCM at the pipeline rate.
+    encode(): TTS PCM at the model rate → leg packets at the negotiated output rate.
+    """
+
+    def __init__(
+        self,
+        codec: str = "pcm",
+        sample_rate: int = None,
+        output_rate: int = None,
+        tts_sample_rate: int = None,
+        pipeline_rate: int = None,
+    ):
+        if codec not in CODECS:
+            raise ValueError(f"unsupported codec {codec!r}")
+        pipeline_rate = pipeline_rate or settings.AUDIO_SAMPLE_RATE
+        tts_sample_rate = tts_sample_rate or pipeline_rate
+        if codec in ("ulaw", "alaw"):
+            sample_rate = output_rate = 8000
+        sample_rate = sample_rate or pipeline_rate
+        output_rate = output_rate or (tts_sample_rate if codec == "pcm" else sample_rate)
+        if codec == "opus":
+            if opuslib is None:
+                raise ValueError("opus requested but opuslib is not installed")
+            if sample_rate not in _OPUS_RATES or output_rate not in _OPUS_RATES:
+                raise ValueError(f"opus needs one of {_OPUS_RATES} Hz")
+            self._opus_decoder = opuslib.Decoder(sample_rate, 1)
+            self._opus_encoder = opuslib.Encoder(output_rate, 1, opuslib.APPLICATION_VOIP)
+            self._opus_frame = output_rate * _OPUS_FRAME_MS // 1000
+            self._opus_pending = np.zeros(0, dtype=np.int16)
+
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.output_rate = output_rate
+        self._inbound = Resampler(sample_rate, pipeline_rate)
+        self._outbound = Resampler(tts_sample_rate, output_rate)
+        self._samples = np.zeros(0, dtype=np.int16)
+        self._codes = np.zeros(0, dtype=np.uint8)
+
+    @property
+    def passthrough(self) -> bool:
+        """True when frames already match the pipeline and TTS output needs no conversion."""
+        return (
+            self.codec == "pcm"
+            and self._inbound.up == self._inbound.down
+            and self._outbound.up == self._outbound.down
+        )
+
+    def decode(self, frame: bytes) -> bytes:
+        if self.codec in ("ulaw", "alaw"):
+            if len(self._samples) < len(frame):
+                self._samples = np.zeros(len(frame), dtype=np.int16)
+            samples = g711_decode(self.codec, frame, out=self._samples)
+        elif self.codec == "opus":
+            samples = np.frombuffer(self._opus_decoder.decode(bytes(frame), self.sample_rate * 120 // 1000), np.int16)
+        else:
+            samples = np.frombuffer(frame, dtype=np.int16, count=len(frame) // 2)
+        return self._inbound.process(samples).tobytes()
+
+    def encode(self, pcm) -> List[bytes]:
+        samples = self._outbound.process(np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2))
+        if self.codec in ("ulaw", "alaw"):
+            if len(self._codes) < len(samples):
+                self._codes = np.zeros(len(samples), dtype=np.uint8)
+            return [g711_encode(self.codec, samples, out=self._codes).tobytes()]
+        if self.codec == "opus":
+            return self._encode_opus(samples)
+        return [samples.tobytes()]
+
+    def _encode_opus(self, samples: np.ndarray) -> List[bytes]:
+        # Opus only takes whole frames; the remainder waits for the next chunk
+        pending = np.concatenate((self._opus_pending, samples))
+        whole = len(pending) - len(pending) % self._opus_frame
+        packets = [
+            self._opus_encoder.encode(pending[i:i + self._opus_frame].tobytes(), self._opus_frame)
+            for i in range(0, whole, self._opus_frame)
+        ]
+        self._opus_pending = pending[whole:]
+        return packets
+
+
+def negotiate(
+    codec: Optional[str], sample_rate: Optional[int], output_rate: Optional[int], tts_sample_rate: int
+) -> AudioTranscoder:
+    """Build the transcoder for a client's requested format; raises ValueError if unsupported."""
+    return AudioTranscoder(
+        codec=(codec or "pcm").lower(),
+        sample_rate=sample_rate,
+        output_rate=output_rate,
+        tts_sample_rate=tts_sample_rate,
+    )
@@ -0,0 +1,106 @@
+"""
+Dynamic cross-call batching.
+Collects requests from all active calls for a short window and hands them to a
+synchronous batch function in one executor hop, resolving each caller's future
+with its own result.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DynamicBatcher:
+    """
+    Groups submitted items by key and flushes a group when it reaches
+    max_batch_size or when its oldest item has waited max_wait_ms.
+
+    process_batch(key, items) runs in an executor (the given EngineExecutor, or
+    the loop's default one) and must return one result per item, in order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[Hashable, List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_concurrent_batches: int = 1,
+        batch_size_metric=None,
+        queue_wait_metric=None,
+        executor=None,
+    ):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.batch_size_metric = batch_size_metric
+        self.queue_wait_metric = queue_wait_metric
+        self.executor = executor
+
+        self._max_concurrent_batches = max(1, max_concurrent_batches)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future, float]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+
+    @property
+    def pending(self) -> int:
+        return sum(len(group) for group in self._pending.values())
+
+    async def submit(self, item: Any, key: Hashable = None) -> Any:
+        """Queue one item and wait for its individual result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = self._pending.setdefault(key, [])
+        group.append((item, future, time.perf_counter()))
+
+        if len(group) >= self.max_batch_size:
+            self._dispatch(key)
+        elif len(group) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._dispatch, key)
+
+        return await future
+
+    def _dispatch(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future, float]]):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_concurrent_batches)
+
+        async with self._slots:
+            started = time.perf_counter()
+            if self.queue_wait_metric:
+                for _, _, queued_at in batch:
+                    self.queue_wait_metric.observe(started - queued_at)
+            if self.batch_size_metric:
+                self.batch_size_metric.observe(len(batch))
+
+            items = [item for item, _, _ in batch]
+            try:
+                if self.executor is not None:
+                    results = await self.executor.run(self.process_batch, key, items)
+                else:
+                    loop = asyncio.get_running_loop()
+                    results = await loop.run_in_executor(None, self.process_batch, key, items)
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(items)} failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
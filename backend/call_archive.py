@@ -0,0 +1,326 @@
+"""
+Archival of finished calls to PostgreSQL.
+When a call is terminated its hash and transcript are read from Redis and
+batched in memory; batches are bulk-loaded with COPY over a pooled asyncpg
+connection. If Postgres is slow or down, batches spill to JSONL files and
+are replayed later. Archived calls get a short Redis TTL, so Redis only
+holds recent history and history queries go to Postgres.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from config import settings
+from metrics import archive_calls, archive_flush_seconds, archive_pending
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS call_archive (
+    call_id          TEXT PRIMARY KEY,
+    caller_id        TEXT,
+    destination      TEXT,
+    source_language  TEXT,
+    target_language  TEXT,
+    status           TEXT,
+    start_time       TIMESTAMPTZ,
+    end_time         TIMESTAMPTZ,
+    duration_seconds INTEGER,
+    stats            JSONB,
+    archived_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS call_transcript_archive (
+    call_id          TEXT NOT NULL,
+    entry_id         TEXT NOT NULL,
+    created_at       TIMESTAMPTZ,
+    source_text      TEXT,
+    source_language  TEXT,
+    translation      TEXT,
+    target_language  TEXT,
+    timings          JSONB,
+    PRIMARY KEY (call_id, entry_id)
+);
+CREATE INDEX IF NOT EXISTS call_archive_start_time_idx ON call_archive (start_time);
+"""
+
+# COPY cannot skip duplicates, so batches load into temp tables and are merged;
+# a replayed spill file is then harmless.
+_STAGE_SQL = """
+CREATE TEMP TABLE call_archive_stage (LIKE call_archive INCLUDING DEFAULTS) ON COMMIT DROP;
+CREATE TEMP TABLE call_transcript_stage (LIKE call_transcript_archive) ON COMMIT DROP;
+"""
+_MERGE_SQL = """
+INSERT INTO call_archive SELECT * FROM call_archive_stage ON CONFLICT (call_id) DO NOTHING;
+INSERT INTO call_transcript_archive SELECT * FROM call_transcript_stage ON CONFLICT (call_id, entry_id) DO NOTHING;
+"""
+
+_CALL_COLUMNS = (
+    "call_id", "caller_id", "destination", "source_language", "target_language",
+    "status", "start_time", "end_time", "duration_seconds", "stats",
+)
+_TRANSCRIPT_COLUMNS = (
+    "call_id", "entry_id", "created_at", "source_text", "source_language",
+    "translation", "target_language", "timings",
+)
+# Hash fields with their own column; every other field is a counter and goes into stats
+_CALL_FIELDS = {
+    "call_id", "caller_id", "destination", "source_language", "target_language",
+    "status", "created_at", "start_time", "end_time", "duration",
+}
+
+_SPILL_PREFIX = "archive-"
+_SPILL_SUFFIX = ".jsonl"
+
+
+class CallArchiver:
+    """
+    Batches finished calls and bulk-loads them into Postgres.
+    submit() is the CallHandler termination listener and never blocks.
+    settle (CallHandler.settle) is awaited before calls are read, so counters
+    and transcript entries still buffered in the handler reach Redis first.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        dsn: str = None,
+        batch_size: int = None,
+        flush_interval_ms: int = None,
+        flush_timeout: float = None,
+        max_pending: int = None,
+        spill_dir: str = None,
+        redis_retention: int = None,
+        settle: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.redis = redis_client
+        self.settle = settle
+        # asyncpg takes a plain postgresql:// DSN
+        self.dsn = dsn or settings.database_url.replace("postgresql+asyncpg://", "postgresql://")
+        self.batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        self.flush_interval = (flush_interval_ms or settings.ARCHIVE_FLUSH_INTERVAL_MS) / 1000
+        self.flush_timeout = flush_timeout or settings.ARCHIVE_FLUSH_TIMEOUT_SECONDS
+        self.max_pending = max_pending or settings.ARCHIVE_MAX_PENDING
+        self.spill_dir = spill_dir or settings.ARCHIVE_SPILL_DIR
+        self.redis_retention = redis_retention or settings.ARCHIVE_REDIS_RETENTION_SECONDS
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._batch: List[Dict[str, Any]] = []
+        self._pool: Optional[asyncpg.Pool] = None
+        # Spill files are written and read on one thread, off the event loop
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive-spill")
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    def submit(self, call_id: str):
+        self._queue.put_nowait(call_id)
+        archive_pending.inc()
+
+    async def run(self):
+        """Collect, batch and flush until cancelled; whatever is left is spilled."""
+        try:
+            while True:
+                try:
+                    await self._collect()
+                    if self._batch:
+                        await self._flush()
+                    elif self._queue.empty():
+                        await self._replay_spill()
+                except Exception as e:
+                    # One bad round must not end archival for the life of the process
+                    logger.error(f"Call archiver error, retrying: {e!r}")
+                    await asyncio.sleep(self.flush_interval)
+        finally:
+            if self._batch:
+                await self._spill(self._batch)
+                self._batch = []
+            if self._pool is not None:
+                await self._pool.close()
+            self._io.shutdown(wait=False)
+
+    async def _collect(self):
+        """Wait up to the flush interval for a batch worth of finished calls."""
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return
+            try:
+                call_id = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return
+            call_ids = [call_id]
+            while len(call_ids) < self.batch_size - len(self._batch) and not self._queue.empty():
+                call_ids.append(self._queue.get_nowait())
+            archive_pending.dec(len(call_ids))
+            try:
+                if self.settle is not None:
+                    await self.settle()
+                records = await self._load(call_ids)
+            except Exception as e:
+                logger.error(f"Could not read {len(call_ids)} finished calls from Redis, will retry: {e!r}")
+                for call_id in call_ids:
+                    self.submit(call_id)
+                await asyncio.sleep(self.flush_interval)
+                return
+            self._batch.extend(records)
+
+    async def _load(self, call_ids: List[str]) -> List[Dict[str, Any]]:
+        """Read call hashes and transcripts for a group of calls in one pipeline."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for call_id in call_ids:
+                pipe.hgetall(f"call:{call_id}")
+                pipe.xrange(f"call:{call_id}:transcript")
+            results = await pipe.execute()
+        records = []
+        for i, call_id in enumerate(call_ids):
+            call, transcript = results[2 * i], results[2 * i + 1]
+            if not call:
+                logger.warning(f"Call {call_id} expired before it could be archived")
+                archive_calls.labels(result="missing").inc()
+                continue
+            records.append({"call": call, "transcript": [[entry_id, fields] for entry_id, fields in transcript]})
+        return records
+
+    async def _flush(self):
+        batch, self._batch = self._batch, []
+        # Backpressure: with a backlog this deep, don't wait on the database
+        if self._queue.qsize() > self.max_pending:
+            logger.warning(f"Archive backlog of {self._queue.qsize()} calls, spilling batch to disk")
+            await self._spill(batch)
+            return
+        try:
+            await asyncio.wait_for(self._write(batch), self.flush_timeout)
+        except Exception as e:
+            logger.error(f"Archiving {len(batch)} calls failed, spilling to disk: {e!r}")
+            await self._spill(batch)
+            return
+        archive_calls.labels(result="archived").inc(len(batch))
+        await self._shorten_retention(batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        t0 = time.perf_counter()
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=settings.ARCHIVE_POOL_SIZE)
+            async with self._pool.acquire() as conn:
+                await conn.execute(_SCHEMA)
+            logger.info("Call archive connected to PostgreSQL")
+
+        call_rows = [_call_row(record["call"]) for record in batch]
+        transcript_rows = [
+            row for record in batch for row in _transcript_rows(record["call"]["call_id"], record["transcript"])
+        ]
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(_STAGE_SQL)
+                await conn.copy_records_to_table("call_archive_stage", records=call_rows, columns=_CALL_COLUMNS)
+                if transcript_rows:
+                    await conn.copy_records_to_table(
+                        "call_transcript_stage", records=transcript_rows, columns=_TRANSCRIPT_COLUMNS
+                    )
+                await conn.execute(_MERGE_SQL)
+        archive_flush_seconds.observe(time.perf_counter() - t0)
+        logger.info(f"Archived {len(call_rows)} calls, {len(transcript_rows)} transcript entries")
+
+    async def _shorten_retention(self, batch: List[Dict[str, Any]]):
+        """Archived calls only need to stay in Redis briefly."""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for record in batch:
+                    call_id = record["call"]["call_id"]
+                    pipe.expire(f"call:{call_id}", self.redis_retention)
+                    pipe.expire(f"call:{call_id}:transcript", self.redis_retention)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not shorten Redis retention for archived calls: {e}")
+
+    async def _spill(self, batch: List[Dict[str, Any]]):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._io, self._write_spill, batch)
+            archive_calls.labels(result="spilled").inc(len(batch))
+        except OSError as e:
+            logger.error(f"Archive spill failed, {len(batch)} calls lost: {e}")
+            archive_calls.labels(result="lost").inc(len(batch))
+
+    def _write_spill(self, batch: List[Dict[str, Any]]):
+        path = os.path.join(self.spill_dir, f"{_SPILL_PREFIX}{time.time_ns()}-{os.getpid()}{_SPILL_SUFFIX}")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            for record in batch:
+                f.write(json.dumps(record) + "\n")
+        os.replace(f"{path}.tmp", path)
+
+    async def _replay_spill(self):
+        """Load the oldest spill file once the database keeps up again."""
+        loop = asyncio.get_running_loop()
+        spilled = await loop.run_in_executor(self._io, self._read_oldest_spill)
+        if spilled is None:
+            return
+        path, batch = spilled
+        try:
+            await asyncio.wait_for(self._write(batch), self.flush_timeout)
+        except Exception as e:
+            logger.debug(f"Archive spill replay deferred: {e!r}")
+            return
+        await loop.run_in_executor(self._io, os.unlink, path)
+        archive_calls.labels(result="archived").inc(len(batch))
+        await self._shorten_retention(batch)
+        logger.info(f"Replayed {len(batch)} spilled calls from {os.path.basename(path)}")
+
+    def _read_oldest_spill(self) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """Oldest readable spill file and its calls; unreadable files are moved aside as .bad."""
+        names = sorted(
+            name for name in os.listdir(self.spill_dir)
+            if name.startswith(_SPILL_PREFIX) and name.endswith(_SPILL_SUFFIX)
+        )
+        for name in names:
+            path = os.path.join(self.spill_dir, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    return path, [json.loads(line) for line in f if line.strip()]
+            except ValueError as e:
+                logger.error(f"Archive spill file {name} is corrupt, moving it aside: {e}")
+                os.replace(path, f"{path}.bad")
+        return None
+
+
+def _timestamp(epoch: Optional[str]) -> Optional[datetime]:
+    return datetime.fromtimestamp(int(epoch), tz=timezone.utc) if epoch else None
+
+
+def _call_row(call: Dict[str, str]) -> tuple:
+    stats = {field: value for field, value in call.items() if field not in _CALL_FIELDS}
+    return (
+        call["call_id"],
+        call.get("caller_id"),
+        call.get("destination"),
+        call.get("source_language"),
+        call.get("target_language"),
+        call.get("status"),
+        _timestamp(call.get("start_time")),
+        _timestamp(call.get("end_time")),
+        int(call["duration"]) if call.get("duration") else None,
+        json.dumps(stats),
+    )
+
+
+def _transcript_rows(call_id: str, entries: List[list]) -> List[tuple]:
+    rows = []
+    for entry_id, fields in entries:
+        created_ms = int(entry_id.split("-", 1)[0])
+        rows.append((
+            call_id,
+            entry_id,
+            datetime.fromtimestamp(created_ms / 1000, tz=timezone.utc),
+            fields.get("source_text"),
+            fields.get("source_language"),
+            fields.get("translation"),
+            fields.get("target_language"),
+            fields.get("timings"),
+        ))
+    return rows
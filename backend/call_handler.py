@@ -1,26 +1,102 @@
 """
 Call Handler - Manages call lifecycle and state in Redis.
+
+Call hashes are read through a small in-process cache. Every write publishes
+an event on CALL_EVENTS_CHANNEL; each replica's listener drops the cached
+entry and, for terminations, sets the call's asyncio termination event so
+a running pipeline stops without polling Redis.
+
+Each lifecycle write is one atomic round trip (MULTI pipeline or Lua script).
+Per-packet counters go through CallStatsAggregator, which buffers them in
+memory and flushes them in batches.
+
+Calls are indexed in two sorted sets, calls:active (by start time) and
+calls:terminated (by end time), maintained by the same atomic writes, so
+listing and stats never scan the keyspace.
+
+Each call's transcript is a capped Redis Stream (call:{id}:transcript), one
+entry per utterance, appended fire-and-forget from the pipeline.
 """
+import asyncio
 import time
 import uuid
 import json
 import logging
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import AsyncIterator, Callable, Optional, Dict, Any, List, Tuple
 
 import redis.asyncio as redis
 
 from config import settings
+from metrics import call_state_cache_requests, call_stats_flush_size
 
 logger = logging.getLogger(__name__)
 
+_MAX_RESUBSCRIBE_BACKOFF = 30
+_CALL_TTL_SECONDS = 3600
+
+_ACTIVE_INDEX = "calls:active"
+_TERMINATED_INDEX = "calls:terminated"
+_STATS_KEY = "calls:stats"
+_MAX_PAGE_SIZE = 500
+_TRANSCRIPT_TAIL_BLOCK_MS = 5000
+
+# Mark a call terminated, record its duration and move it between the
+# indexes, once; always announce it. Returns 1 only for the first termination.
+# KEYS: call hash, active index, terminated index, stats hash
+# ARGV: now, call id, events channel, event message, terminated retention seconds
+_TERMINATE_SCRIPT = """
+local fields = redis.call('HMGET', KEYS[1], 'start_time', 'status')
+local first = fields[1] and fields[2] ~= 'terminated'
+redis.call('ZREM', KEYS[2], ARGV[2])
+if first then
+    redis.call('HSET', KEYS[1], 'status', 'terminated', 'end_time', ARGV[1],
+               'duration', tostring(tonumber(ARGV[1]) - tonumber(fields[1])))
+    redis.call('ZADD', KEYS[3], ARGV[1], ARGV[2])
+    redis.call('HINCRBY', KEYS[4], 'terminated', 1)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[5]))
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return first and 1 or 0
+"""
+
+# Add buffered counters to a call hash without resurrecting an expired one.
+# KEYS[1] call hash; ARGV: field, amount pairs (amounts with a '.' are floats)
+_INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    if string.find(ARGV[i + 1], '.', 1, true) then
+        redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1])
+    else
+        redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
 
 class CallHandler:
     """Manages call state in Redis."""
 
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(self, redis_client: redis.Redis, cache_ttl: float = None, cache_max_entries: int = None):
         self.redis = redis_client
         self.call_prefix = "call:"
+        self.events_channel = settings.CALL_EVENTS_CHANNEL
+        # TTL is a safety net for missed events (e.g. the hash expiring in Redis)
+        self.cache_ttl = cache_ttl if cache_ttl is not None else settings.CALL_STATE_CACHE_TTL_SECONDS
+        self.cache_max_entries = cache_max_entries or settings.CALL_STATE_CACHE_MAX_ENTRIES
+
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, str]]]" = OrderedDict()
+        # Bumped on every invalidation so a read racing a write never caches stale data
+        self._generation = 0
+        self._terminated: Dict[str, asyncio.Event] = {}
+        self._pending_writes: set = set()
+        self._termination_listeners: List[Callable[[str], None]] = []
+        self._terminate_script = redis_client.register_script(_TERMINATE_SCRIPT)
+        self.stats = CallStatsAggregator(redis_client, self.call_prefix)
 
     async def create_call(
         self,
@@ -30,7 +106,6 @@ class CallHandler:
         call_id: Optional[str] = None,
     ) -> str:
         call_id = call_id or str(uuid.uuid4())
-        call_key = f"{self.call_prefix}{call_id}"
         call_data = {
             "call_id": call_id,
             "caller_id": caller_id,
@@ -43,28 +118,45 @@ class CallHandler:
             "audio_packets": "0",
             "transcription_count": "0",
         }
-        await self.redis.hset(call_key, mapping=call_data)
-        await self.redis.expire(call_key, 3600)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._queue_write(pipe, call_id, call_data)
+            pipe.zadd(_ACTIVE_INDEX, {call_id: int(call_data["start_time"])})
+            pipe.hincrby(_STATS_KEY, "created", 1)
+            await pipe.execute()
+        self._apply_event(call_id, "updated")
         logger.info(f"Call created: {call_id}")
         return call_id
 
     async def update_call(self, call_id: str, updates: Dict[str, Any]) -> bool:
-        call_key = f"{self.call_prefix}{call_id}"
         try:
-            await self.redis.hset(call_key, mapping=updates)
-            await self.redis.expire(call_key, 3600)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_write(pipe, call_id, updates)
+                await pipe.execute()
+            # Applied locally right away; our own echo from the channel is a no-op
+            self._apply_event(call_id, "updated")
             return True
         except Exception as e:
             logger.error(f"Error updating call {call_id}: {e}")
             return False
 
     async def get_call(self, call_id: str) -> Optional[Dict[str, str]]:
+        cached = self._cache.get(call_id)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            self._cache.move_to_end(call_id)
+            call_state_cache_requests.labels(result="hit").inc()
+            return dict(cached[1])
+        call_state_cache_requests.labels(result="miss").inc()
+
         call_key = f"{self.call_prefix}{call_id}"
+        generation = self._generation
         try:
-            return await self.redis.hgetall(call_key)
+            data = await self.redis.hgetall(call_key)
         except Exception as e:
             logger.error(f"Error retrieving call {call_id}: {e}")
             return None
+        if data and generation == self._generation:
+            self._store(call_id, data)
+        return data
 
     async def get_call_status(self, call_id: str) -> Dict:
         data = await self.get_call(call_id)
@@ -72,18 +164,20 @@ class CallHandler:
 
     async def terminate_call(self, call_id: str) -> bool:
         try:
-            call_key = f"{self.call_prefix}{call_id}"
-            call_data = await self.redis.hgetall(call_key)
-            if call_data and "start_time" in call_data:
-                duration = int(time.time()) - int(call_data["start_time"])
-                await self.redis.hset(
-                    call_key,
-                    mapping={
-                        "status": "terminated",
-                        "end_time": str(int(time.time())),
-                        "duration": str(duration),
-                    },
-                )
+            first = await self._terminate_script(
+                keys=[f"{self.call_prefix}{call_id}", _ACTIVE_INDEX, _TERMINATED_INDEX, _STATS_KEY],
+                args=[
+                    int(time.time()),
+                    call_id,
+                    self.events_channel,
+                    _event_message(call_id, "terminated"),
+                    _CALL_TTL_SECONDS,
+                ],
+            )
+            self._apply_event(call_id, "terminated")
+            if first:
+                for listener in self._termination_listeners:
+                    listener(call_id)
             logger.info(f"Call terminated: {call_id}")
             return True
         except Exception as e:
@@ -93,13 +187,314 @@ class CallHandler:
     async def hangup_call(self, call_id: str) -> bool:
         return await self.terminate_call(call_id)
 
-    async def get_call_transcript(self, call_id: str) -> List[Dict]:
+    def append_transcript(self, call_id: str, entry: Dict[str, Any]):
+        """Append one utterance to the call's transcript stream without blocking the caller."""
+        task = asyncio.ensure_future(self._append_transcript(call_id, entry))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def settle(self):
+        """Flush buffered counters and wait for in-flight transcript appends, so Redis holds every call's final state."""
+        await self.stats.flush()
+        if self._pending_writes:
+            await asyncio.gather(*list(self._pending_writes), return_exceptions=True)
+
+    async def _append_transcript(self, call_id: str, entry: Dict[str, Any]):
+        key = f"{self.call_prefix}{call_id}:transcript"
+        fields = {k: json.dumps(v) if isinstance(v, dict) else str(v) for k, v in entry.items() if v is not None}
         try:
-            entries = await self.redis.lrange(f"{self.call_prefix}{call_id}:transcript", 0, -1)
-            return [json.loads(e) for e in entries]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.xadd(key, fields, maxlen=settings.TRANSCRIPT_MAX_ENTRIES, approximate=True)
+                pipe.expire(key, _CALL_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error appending transcript for {call_id}: {e}")
+
+    async def get_call_transcript(
+        self,
+        call_id: str,
+        cursor: Optional[str] = None,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+        limit: int = 100,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        One page of transcript entries, oldest first.
+        cursor is the last entry id already seen; start_ms/end_ms bound the
+        entries by append time. Returns (entries, next cursor or None).
+        """
+        key = f"{self.call_prefix}{call_id}:transcript"
+        limit = max(1, min(limit, _MAX_PAGE_SIZE))
+        if cursor:
+            lower = f"({cursor}"
+        else:
+            lower = str(start_ms) if start_ms is not None else "-"
+        upper = str(end_ms) if end_ms is not None else "+"
+        try:
+            entries = await self.redis.xrange(key, min=lower, max=upper, count=limit)
         except Exception as e:
             logger.error(f"Error retrieving transcript for {call_id}: {e}")
-            return []
+            return [], None
+        next_cursor = entries[-1][0] if len(entries) == limit else None
+        return [_transcript_entry(entry_id, fields) for entry_id, fields in entries], next_cursor
+
+    async def tail_transcript(self, call_id: str, after: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Yield transcript entries as they are appended until the call ends.
+        Reads always resume from a concrete entry id ("$" would skip anything
+        appended between two blocking reads).
+        """
+        key = f"{self.call_prefix}{call_id}:transcript"
+        last_id = after
+        if last_id is None:
+            latest = await self.redis.xrevrange(key, "+", "-", count=1)
+            last_id = latest[0][0] if latest else "0-0"
+        while True:
+            response = await self.redis.xread({key: last_id}, count=_MAX_PAGE_SIZE, block=_TRANSCRIPT_TAIL_BLOCK_MS)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    yield _transcript_entry(entry_id, fields)
+            if not response:
+                call = await self.get_call(call_id)
+                if not call or call.get("status") == "terminated":
+                    return
 
     async def update_language(self, call_id: str, language: str) -> bool:
         return await self.update_call(call_id, {"source_language": language})
+
+    async def list_calls(
+        self, status: str = "active", cursor: Optional[str] = None, limit: int = 50
+    ) -> Tuple[List[Dict[str, str]], Optional[str], int]:
+        """
+        One page of calls, newest first, from the status index.
+        Returns (calls, next cursor or None, total in the index). The cursor is
+        "<score>:<offset>" — the last score seen and how many calls with that
+        score were already returned — so ties in start time page correctly.
+        Index entries whose hash has expired are pruned as they are met.
+        """
+        key = _TERMINATED_INDEX if status == "terminated" else _ACTIVE_INDEX
+        limit = max(1, min(limit, _MAX_PAGE_SIZE))
+        max_score, skip = "+inf", 0
+        if cursor:
+            score, _, offset = cursor.partition(":")
+            max_score, skip = float(score), int(offset)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrangebyscore(key, max_score, "-inf", start=skip, num=limit, withscores=True)
+            pipe.zcard(key)
+            entries, total = await pipe.execute()
+        if not entries:
+            return [], None, total
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for call_id, _ in entries:
+                pipe.hgetall(f"{self.call_prefix}{call_id}")
+            hashes = await pipe.execute()
+
+        calls, stale = [], []
+        last_score = entries[-1][1]
+        next_skip = skip if last_score == max_score else 0
+        for (call_id, score), data in zip(entries, hashes):
+            if not data:
+                stale.append(call_id)
+                continue
+            calls.append(data)
+            if score == last_score:
+                next_skip += 1
+        if stale:
+            await self.redis.zrem(key, *stale)
+            total -= len(stale)
+
+        next_cursor = f"{int(last_score)}:{next_skip}" if len(entries) == limit else None
+        return calls, next_cursor, total
+
+    async def get_stats(self) -> Dict[str, int]:
+        """Call counts from the indexes and counters; O(1) apart from pruning expired entries."""
+        now = int(time.time())
+        async with self.redis.pipeline(transaction=False) as pipe:
+            # Nothing stays active past the call timeout; entries left by a crash age out here
+            pipe.zremrangebyscore(_ACTIVE_INDEX, "-inf", now - settings.CALL_TIMEOUT_SECONDS)
+            pipe.zremrangebyscore(_TERMINATED_INDEX, "-inf", now - _CALL_TTL_SECONDS)
+            pipe.zcard(_ACTIVE_INDEX)
+            pipe.zcard(_TERMINATED_INDEX)
+            pipe.hgetall(_STATS_KEY)
+            _, _, active, terminated, counters = await pipe.execute()
+        return {
+            "active_calls": active,
+            "terminated_calls": terminated,
+            "calls_created": int(counters.get("created", 0)),
+            "calls_terminated": int(counters.get("terminated", 0)),
+        }
+
+    def record_stat(self, call_id: str, field: str, amount: float = 1):
+        """Buffer a counter increment; written to the call hash on the next stats flush."""
+        self.stats.increment(call_id, field, amount)
+
+    # ── Call events ───────────────────────────────────────────────────────────
+
+    def add_termination_listener(self, listener: Callable[[str], None]):
+        """
+        Register a non-blocking callback run once per call, on the replica whose
+        terminate_call actually ended it (e.g. to hand the call to archival).
+        """
+        self._termination_listeners.append(listener)
+
+    def termination_event(self, call_id: str) -> asyncio.Event:
+        """Event set when the call is terminated by any replica. Call release() when done."""
+        event = self._terminated.get(call_id)
+        if event is None:
+            event = asyncio.Event()
+            self._terminated[call_id] = event
+        return event
+
+    def release(self, call_id: str):
+        """Forget local state for a call this replica no longer serves."""
+        self._terminated.pop(call_id, None)
+        self._invalidate(call_id)
+
+    async def listen_for_events(self):
+        """Apply call events published by every replica. Runs for the app's lifetime."""
+        backoff = 1
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.events_channel)
+                # Events may have been missed while unsubscribed
+                self._cache.clear()
+                self._generation += 1
+                await self._recheck_watched()
+                backoff = 1
+                logger.info(f"Subscribed to call events on {self.events_channel}")
+                async for message in pubsub.listen():
+                    self._handle_message(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Call event subscription lost: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, _MAX_RESUBSCRIBE_BACKOFF)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def _queue_write(self, pipe, call_id: str, fields: Dict[str, Any]):
+        """Queue HSET + EXPIRE + PUBLISH on a MULTI pipeline."""
+        call_key = f"{self.call_prefix}{call_id}"
+        pipe.hset(call_key, mapping=fields)
+        pipe.expire(call_key, _CALL_TTL_SECONDS)
+        pipe.publish(self.events_channel, _event_message(call_id, "updated"))
+
+    def _handle_message(self, data):
+        try:
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            message = json.loads(data)
+            self._apply_event(message["call_id"], message["event"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed call event {data!r}: {e}")
+
+    def _apply_event(self, call_id: str, event: str):
+        self._invalidate(call_id)
+        if event == "terminated":
+            waiter = self._terminated.get(call_id)
+            if waiter is not None:
+                waiter.set()
+
+    async def _recheck_watched(self):
+        """After (re)subscribing, catch terminations that happened while unsubscribed."""
+        for call_id, waiter in list(self._terminated.items()):
+            if waiter.is_set():
+                continue
+            data = await self.redis.hgetall(f"{self.call_prefix}{call_id}")
+            if not data or data.get("status") == "terminated":
+                waiter.set()
+
+    def _invalidate(self, call_id: str):
+        self._generation += 1
+        self._cache.pop(call_id, None)
+
+    def _store(self, call_id: str, data: Dict[str, str]):
+        self._cache[call_id] = (time.monotonic(), dict(data))
+        self._cache.move_to_end(call_id)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+
+def _event_message(call_id: str, event: str) -> str:
+    return json.dumps({"call_id": call_id, "event": event})
+
+
+def _transcript_entry(entry_id: str, fields: Dict[str, str]) -> Dict[str, Any]:
+    entry: Dict[str, Any] = dict(fields)
+    if "timings" in entry:
+        entry["timings"] = json.loads(entry["timings"])
+    entry["id"] = entry_id
+    entry["timestamp_ms"] = int(entry_id.split("-", 1)[0])
+    return entry
+
+
+class CallStatsAggregator:
+    """
+    Write-behind per-call counters.
+    increment() only touches an in-memory dict; run() flushes everything
+    buffered every CALL_STATS_FLUSH_INTERVAL_MS as one pipeline of scripted
+    HINCRBYs, so the call hash has real counts without per-packet Redis traffic.
+    """
+
+    def __init__(self, redis_client: redis.Redis, call_prefix: str = "call:", flush_interval_ms: int = None):
+        self.redis = redis_client
+        self.call_prefix = call_prefix
+        self.flush_interval = (flush_interval_ms or settings.CALL_STATS_FLUSH_INTERVAL_MS) / 1000
+        self._pending: Dict[str, Dict[str, float]] = {}
+        self._increment_script = redis_client.register_script(_INCREMENT_SCRIPT)
+
+    def increment(self, call_id: str, field: str, amount: float = 1):
+        counters = self._pending.setdefault(call_id, {})
+        counters[field] = counters.get(field, 0) + amount
+
+    async def run(self):
+        """Flush on an interval until cancelled, then flush what is left."""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        # MULTI/EXEC: nothing is applied unless EXEC runs, and then each call's
+        # result says whether its increments landed, so only failures are retried
+        failed = batch
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for call_id, counters in batch.items():
+                    args = []
+                    for field, amount in counters.items():
+                        args += [field, _format_amount(amount)]
+                    await self._increment_script(keys=[f"{self.call_prefix}{call_id}"], args=args, client=pipe)
+                results = await pipe.execute(raise_on_error=False)
+            errors = {
+                call_id: result for call_id, result in zip(batch, results) if isinstance(result, Exception)
+            }
+            failed = {call_id: batch[call_id] for call_id in errors}
+            for call_id, error in errors.items():
+                logger.error(f"Call stats for {call_id} not applied: {error}")
+            call_stats_flush_size.observe(len(batch))
+        except Exception as e:
+            logger.error(f"Error flushing call stats for {len(batch)} calls: {e}")
+        # Keep the counts that did not land for the next flush
+        for call_id, counters in failed.items():
+            for field, amount in counters.items():
+                self.increment(call_id, field, amount)
+
+
+def _format_amount(amount: float) -> str:
+    if isinstance(amount, int):
+        return str(amount)
+    return f"{amount:.6f}"
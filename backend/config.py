@@ -44,6 +44,14 @@ class Settings(BaseSettings):
     REDIS_PORT: int = Field(default=6379)
     REDIS_DB: int = Field(default=0)
     REDIS_PASSWORD: str = Field(default="")
+    # Local read-through cache of call hashes, invalidated over pub/sub
+    CALL_EVENTS_CHANNEL: str = Field(default="call-events")
+    CALL_STATE_CACHE_TTL_SECONDS: float = Field(default=30.0)
+    CALL_STATE_CACHE_MAX_ENTRIES: int = Field(default=10000)
+    # Write-behind per-call counters (packets, transcriptions, stage seconds)
+    CALL_STATS_FLUSH_INTERVAL_MS: int = Field(default=1000)
+    # Per-call transcript stream cap (approximate MAXLEN)
+    TRANSCRIPT_MAX_ENTRIES: int = Field(default=1000)
 
     @property
     def redis_url(self) -> str:
@@ -61,12 +69,35 @@ class Settings(BaseSettings):
     def database_url(self) -> str:
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    # Archival of terminated calls: batched COPY, spill to disk when the DB lags
+    ARCHIVE_ENABLED: bool = Field(default=True)
+    ARCHIVE_BATCH_SIZE: int = Field(default=100)
+    ARCHIVE_FLUSH_INTERVAL_MS: int = Field(default=2000)
+    ARCHIVE_FLUSH_TIMEOUT_SECONDS: float = Field(default=10.0)
+    ARCHIVE_MAX_PENDING: int = Field(default=5000)
+    ARCHIVE_POOL_SIZE: int = Field(default=4)
+    ARCHIVE_SPILL_DIR: str = Field(default="/app/.cache/archive-spill")
+    # Archived calls stay in Redis this long for the live API
+    ARCHIVE_REDIS_RETENTION_SECONDS: int = Field(default=300)
+
     # ── FreeSWITCH ────────────────────────────────────────────────────────────
     FREESWITCH_HOST: str = Field(default="localhost")
     FREESWITCH_PORT: int = Field(default=8021)
     FREESWITCH_PASSWORD: str = Field(default="ClueCon")
     # Stored as plain string; use .freeswitch_events property for list
     FREESWITCH_EVENTS: str = Field(default="CHANNEL_CREATE,CHANNEL_ANSWER,CHANNEL_HANGUP")
+    # "json" or "plain"; see scripts/bench_esl_parser.py
+    FREESWITCH_EVENT_FORMAT: str = Field(default="json")
+    # bgapi command pool, separate from the event connection
+    FREESWITCH_COMMAND_CONNECTIONS: int = Field(default=2)
+    FREESWITCH_COMMAND_TIMEOUT_SECONDS: float = Field(default=10.0)
+    FREESWITCH_COMMAND_MAX_IN_FLIGHT: int = Field(default=100)
+    # Media: on CHANNEL_ANSWER FreeSWITCH is told to stream the leg to
+    # {FREESWITCH_MEDIA_STREAM_URL}/{uuid} (uuid_audio_stream); empty disables it
+    FREESWITCH_MEDIA_STREAM_URL: str = Field(default="ws://backend:8000/ws/freeswitch")
+    FREESWITCH_MEDIA_SAMPLE_RATE: int = Field(default=8000)
+    # "binary" (raw L16 frames) or "json" (mod_audio_stream streamAudio messages)
+    FREESWITCH_MEDIA_PLAYBACK: str = Field(default="binary")
 
     @property
     def freeswitch_events(self) -> List[str]:
@@ -80,7 +111,19 @@ class Settings(BaseSettings):
     KAFKA_BOOTSTRAP_SERVERS: str = Field(default="localhost:9092")
     KAFKA_TOPIC_CALLS: str = Field(default="voice-calls")
     KAFKA_TOPIC_EVENTS: str = Field(default="voice-events")
+    # Events the gateway itself publishes (call.terminated, ...); never consumed
+    # by the gateway, so a replica does not re-apply its own events
+    KAFKA_TOPIC_GATEWAY_EVENTS: str = Field(default="voice-gateway-events")
     KAFKA_CONSUMER_GROUP: str = Field(default="voice-gateway")
+    KAFKA_CONSUMER_WORKERS: int = Field(default=8)
+    KAFKA_CONSUMER_MAX_RECORDS: int = Field(default=500)
+    KAFKA_CONSUMER_FETCH_TIMEOUT_MS: int = Field(default=1000)
+    KAFKA_PRODUCER_LINGER_MS: int = Field(default=20)
+    KAFKA_PRODUCER_MAX_BATCH_BYTES: int = Field(default=65536)
+    # gzip needs no extra package; lz4 / zstd need python-lz4 / zstandard
+    KAFKA_PRODUCER_COMPRESSION: str = Field(default="gzip")
+    # Events buffered before the producer drops the oldest ones
+    KAFKA_PRODUCER_MAX_BUFFERED: int = Field(default=10000)
 
     @property
     def kafka_servers(self) -> List[str]:
@@ -91,6 +134,31 @@ class Settings(BaseSettings):
     STT_DEVICE: str = Field(default="cpu")
     STT_COMPUTE_TYPE: str = Field(default="int8")
     VAD_THRESHOLD: float = Field(default=0.5)
+    # Streaming endpointer (see vad.py) — frames are classified every VAD_FRAME_MS
+    VAD_FRAME_MS: int = Field(default=30)
+    VAD_ENERGY_THRESHOLD_DB: float = Field(default=-45.0)
+    VAD_HANGOVER_MS: int = Field(default=300)
+    VAD_MIN_SPEECH_MS: int = Field(default=250)
+    VAD_MAX_SPEECH_MS: int = Field(default=8000)
+    # Cross-call batching window for the STT scheduler
+    STT_BATCH_MAX_SIZE: int = Field(default=8)
+    STT_BATCH_MAX_WAIT_MS: int = Field(default=30)
+    # Incremental transcription: partials every interval, committed text as prompt
+    STT_STREAMING: bool = Field(default=False)
+    STT_PARTIAL_INTERVAL_MS: int = Field(default=500)
+    STT_PROMPT_MAX_CHARS: int = Field(default=200)
+    # Utterances at least this long stream Whisper segments downstream as they decode
+    STT_SEGMENT_STREAM_SECONDS: float = Field(default=4.0)
+
+    # ── Language resolution ───────────────────────────────────────────────────
+    # Whisper language probability below this falls back to fastText on the text
+    LANGUAGE_MIN_CONFIDENCE: float = Field(default=0.6)
+    # Per-call hysteresis: weight of each new segment, lead a new language needs
+    LANGUAGE_SMOOTHING: float = Field(default=0.5)
+    LANGUAGE_SWITCH_MARGIN: float = Field(default=0.25)
+    # Agreeing segments before STT is pinned to the call language; re-check interval (0 = never)
+    LANGUAGE_PIN_AFTER: int = Field(default=3)
+    LANGUAGE_RECHECK_EVERY: int = Field(default=20)
 
     # ── Translation ───────────────────────────────────────────────────────────
     TRANSLATION_MODEL: str = Field(default="facebook/nllb-200-distilled-600M")
@@ -98,6 +166,13 @@ class Settings(BaseSettings):
     TARGET_LANGUAGE: str = Field(default="hin_Deva")
     # Stored as plain string; use .supported_languages property for list
     SUPPORTED_LANGUAGES: str = Field(default="tam_Taml,tel_Telu,kan_Knda,mar_Deva,hin_Deva")
+    # Cross-call coalescing window for batched NLLB generate
+    TRANSLATION_BATCH_MAX_SIZE: int = Field(default=16)
+    TRANSLATION_BATCH_MAX_WAIT_MS: int = Field(default=20)
+    # Two-tier cache: in-process LRU budget + shared Redis TTL
+    TRANSLATION_CACHE_MAX_ENTRIES: int = Field(default=10000)
+    TRANSLATION_CACHE_MAX_BYTES: int = Field(default=16 * 1024 * 1024)
+    TRANSLATION_CACHE_TTL_SECONDS: int = Field(default=86400)
 
     @property
     def supported_languages(self) -> List[str]:
@@ -107,6 +182,17 @@ class Settings(BaseSettings):
     TTS_ENGINE: str = Field(default="glowTTS")
     TTS_DEVICE: str = Field(default="cpu")
     TTS_SPEAKER_ID: int = Field(default=0)
+    # Disk-backed synthesized-audio cache (memory-mapped on hit)
+    TTS_CACHE_DIR: str = Field(default="/app/.cache/tts")
+    TTS_CACHE_MAX_BYTES: int = Field(default=512 * 1024 * 1024)
+    # Known prompts synthesized at startup; JSON array or comma-separated
+    TTS_PRESYNTH_PROMPTS: str = Field(
+        default='["Hello, thank you for calling IT support.", "Please hold while we connect you."]'
+    )
+
+    @property
+    def tts_presynth_prompts(self) -> List[str]:
+        return _split_csv(self.TTS_PRESYNTH_PROMPTS)
 
     # ── Audio ─────────────────────────────────────────────────────────────────
     AUDIO_SAMPLE_RATE: int = Field(default=16000)
@@ -123,10 +209,42 @@ class Settings(BaseSettings):
     WEBSOCKET_AUTH_TOKEN: str = Field(default="")
 
     # ── Performance ───────────────────────────────────────────────────────────
+    # Cluster-wide limit, enforced through call leases in Redis
     MAX_CONCURRENT_CALLS: int = Field(default=100)
+    # Calls one replica takes on; 0 → MAX_CONCURRENT_CALLS
+    REPLICA_MAX_CALLS: int = Field(default=0)
+    # Shed new calls once this many utterances wait between pipeline stages; 0 disables
+    ADMISSION_MAX_BACKLOG: int = Field(default=50)
+    ADMISSION_LEASE_SECONDS: int = Field(default=30)
+    ADMISSION_RETRY_AFTER_SECONDS: int = Field(default=5)
     CALL_TIMEOUT_SECONDS: int = Field(default=3600)
+    # Per-call inbound ring buffer in bytes (65536 = 2 s of 16 kHz PCM)
     STREAM_BUFFER_SIZE: int = Field(default=65536)
+    # drop_oldest | drop_newest | backpressure (stop reading the socket until there is room)
+    STREAM_OVERFLOW_POLICY: str = Field(default="drop_oldest")
+    # Backpressure gives up and drops the frame after waiting this long
+    STREAM_BACKPRESSURE_TIMEOUT_MS: int = Field(default=500)
+    # Max utterances waiting between two per-call pipeline stages
+    PIPELINE_STAGE_QUEUE_SIZE: int = Field(default=8)
+    # After hangup, time the pipeline gets to finish the last utterance before it is cancelled
+    PIPELINE_DRAIN_TIMEOUT_SECONDS: float = Field(default=10.0)
     WORKER_THREADS: int = Field(default=4)
+    # Dedicated executor per engine; 0 workers → WORKER_THREADS, 0 in-flight → 2× workers
+    STT_EXECUTOR_WORKERS: int = Field(default=0)
+    STT_MAX_IN_FLIGHT: int = Field(default=0)
+    DETECTOR_EXECUTOR_WORKERS: int = Field(default=1)
+    DETECTOR_MAX_IN_FLIGHT: int = Field(default=0)
+    TRANSLATION_EXECUTOR_WORKERS: int = Field(default=0)
+    TRANSLATION_MAX_IN_FLIGHT: int = Field(default=0)
+    TTS_EXECUTOR_WORKERS: int = Field(default=0)
+    TTS_MAX_IN_FLIGHT: int = Field(default=0)
+
+    # ── Inference workers ─────────────────────────────────────────────────────
+    # "inprocess" loads models in the gateway; "workers" runs STT/translation/TTS
+    # in separate processes reached over Unix sockets + shared memory
+    INFERENCE_MODE: str = Field(default="inprocess")
+    INFERENCE_SOCKET_DIR: str = Field(default="/tmp/voice-inference")
+    INFERENCE_WORKER_START_TIMEOUT: int = Field(default=900)
 
     # ── Model Cache ───────────────────────────────────────────────────────────
     MODEL_CACHE_DIR: str = Field(default="/app/.cache/models")
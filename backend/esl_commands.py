@@ -0,0 +1,167 @@
+"""
+FreeSWITCH commands over a small pool of dedicated ESL connections.
+Commands are sent as bgapi with a Job-UUID chosen here, so FreeSWITCH
+acknowledges at once and reports the output later in a BACKGROUND_JOB event;
+many commands can be outstanding on one connection. The pool is separate
+from the event stream, so mass hangups never delay event intake.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, List
+
+from config import settings
+from esl_protocol import open_session, parse_event, read_message
+from metrics import esl_command_seconds, esl_commands
+
+logger = logging.getLogger(__name__)
+
+_MAX_RECONNECT_DELAY = 60
+
+
+class ESLCommandError(Exception):
+    """FreeSWITCH rejected a command or its output was -ERR."""
+
+
+class _Connection:
+    """One authenticated session; command/reply messages answer commands in send order."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.replies: Deque[asyncio.Future] = deque()
+
+    def close(self):
+        for reply in self.replies:
+            if not reply.done():
+                reply.set_exception(ConnectionError("ESL command connection lost"))
+        self.replies.clear()
+        self.writer.close()
+
+
+class ESLCommandPool:
+    """
+    Runs bgapi commands concurrently over `size` inbound connections.
+    Every connection subscribes to BACKGROUND_JOB, so a job result is taken
+    from whichever connection delivers it first.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: str,
+        size: int = None,
+        timeout: float = None,
+        max_in_flight: int = None,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.size = max(1, size or settings.FREESWITCH_COMMAND_CONNECTIONS)
+        self.timeout = timeout or settings.FREESWITCH_COMMAND_TIMEOUT_SECONDS
+        self._slots = asyncio.Semaphore(max_in_flight or settings.FREESWITCH_COMMAND_MAX_IN_FLIGHT)
+        self._connections: List[_Connection] = []
+        self._jobs: Dict[str, asyncio.Future] = {}
+        self._next = 0
+
+    @property
+    def connected(self) -> int:
+        return len(self._connections)
+
+    async def run(self):
+        """Keep every pool connection open, reconnecting with backoff, until cancelled."""
+        await asyncio.gather(*(self._maintain(index) for index in range(self.size)))
+
+    async def bgapi(self, command: str, timeout: float = None) -> str:
+        """Run an API command in the background and return its output."""
+        timeout = timeout or self.timeout
+        name = command.split(" ", 1)[0]
+        started = time.perf_counter()
+        result = "error"
+        try:
+            async with self._slots:
+                output = await self._submit(command, timeout)
+            if output.startswith("-ERR"):
+                raise ESLCommandError(f"{name}: {output.strip()}")
+            result = "ok"
+            return output
+        except asyncio.TimeoutError:
+            result = "timeout"
+            raise
+        finally:
+            esl_commands.labels(command=name, result=result).inc()
+            esl_command_seconds.labels(command=name).observe(time.perf_counter() - started)
+
+    async def _submit(self, command: str, timeout: float) -> str:
+        if not self._connections:
+            raise ConnectionError("no ESL command connection available")
+        conn = self._connections[self._next % len(self._connections)]
+        self._next += 1
+
+        loop = asyncio.get_running_loop()
+        job_id = str(uuid.uuid4())
+        job, reply = loop.create_future(), loop.create_future()
+        # Registered before sending: the job event may arrive on another connection first
+        self._jobs[job_id] = job
+        conn.replies.append(reply)
+        try:
+            conn.writer.write(f"bgapi {command}\nJob-UUID: {job_id}\n\n".encode())
+            await conn.writer.drain()
+            reply_text = await asyncio.wait_for(reply, timeout)
+            if not reply_text.startswith("+OK"):
+                raise ESLCommandError(f"{command.split(' ', 1)[0]}: {reply_text}")
+            return await asyncio.wait_for(job, timeout)
+        finally:
+            self._jobs.pop(job_id, None)
+
+    async def _maintain(self, index: int):
+        delay = 1
+        while True:
+            try:
+                reader, writer = await open_session(self.host, self.port, self.password)
+                writer.write(b"event json BACKGROUND_JOB\n\n")
+                await writer.drain()
+                reply = await asyncio.wait_for(read_message(reader), self.timeout)
+                if not reply.reply_text.startswith("+OK"):
+                    writer.close()
+                    raise ConnectionError(f"subscription refused: {reply.reply_text!r}")
+            except Exception as e:
+                logger.debug(f"ESL command connection {index} unavailable, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_RECONNECT_DELAY)
+                continue
+
+            delay = 1
+            conn = _Connection(reader, writer)
+            self._connections.append(conn)
+            logger.info(f"ESL command connection {index} ready ({self.connected}/{self.size})")
+            try:
+                await self._read(conn)
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+                logger.warning(f"ESL command connection {index} lost: {e!r}")
+            finally:
+                self._connections.remove(conn)
+                conn.close()
+
+    async def _read(self, conn: _Connection):
+        while True:
+            message = await read_message(conn.reader)
+            content_type = message.content_type
+            if content_type == "command/reply":
+                if conn.replies:
+                    reply = conn.replies.popleft()
+                    # A reply whose waiter timed out is cancelled; it still keeps the order
+                    if not reply.done():
+                        reply.set_result(message.reply_text)
+            elif content_type == "text/disconnect-notice":
+                return
+            else:
+                event = parse_event(message)
+                if event is None or event.name != "BACKGROUND_JOB":
+                    continue
+                job = self._jobs.pop(event.get("Job-UUID"), None)
+                if job is not None and not job.done():
+                    job.set_result(event.body)
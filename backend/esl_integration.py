@@ -3,8 +3,14 @@ FreeSWITCH ESL Integration - Event Socket Layer
 Handles real-time events from FreeSWITCH using asyncio (no external ESL library required)
 """
 import asyncio
+import functools
 import logging
-from typing import Optional
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+from esl_commands import ESLCommandPool
+from esl_protocol import ESLEvent, open_session, parse_event, read_message
+from metrics import esl_events
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +24,8 @@ class ESLIntegration:
         port: int = 8021,
         password: str = "ClueCon",
         call_handler: Optional[object] = None,
+        events: List[str] = None,
+        event_format: str = None,
     ):
         self.host = host
         self.port = port
@@ -26,115 +34,152 @@ class ESLIntegration:
         self.is_connected = False
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
+        self.events = events or settings.freeswitch_events
+        self.event_format = event_format or settings.FREESWITCH_EVENT_FORMAT
+        self._handlers: Dict[str, Callable] = {
+            "CHANNEL_CREATE": self._on_channel_create,
+            "CHANNEL_ANSWER": self._on_channel_answer,
+            "CHANNEL_HANGUP": self._on_channel_hangup,
+        }
+        # Latest handler task per channel (Unique-ID)
+        self._channel_tasks: Dict[str, asyncio.Future] = {}
+        # Commands use their own connections, never the event stream
+        self.commands = ESLCommandPool(host, port, password)
+        self.media_url = settings.FREESWITCH_MEDIA_STREAM_URL.rstrip("/")
 
     async def run(self):
         """Main event loop — reconnects on failure with exponential backoff."""
+        commands_task = asyncio.ensure_future(self.commands.run())
         backoff = 5
         _first_failure = True
-        while True:
-            try:
-                await self.connect()
-                if self.is_connected:
-                    backoff = 5
-                    _first_failure = True
-                    await self.listen_for_events()
-            except Exception as e:
-                if _first_failure:
-                    logger.warning(f"ESL unavailable, retrying with backoff: {e}")
-                    _first_failure = False
-                self.is_connected = False
-            await asyncio.sleep(backoff)
-            backoff = min(backoff * 2, 60)
+        try:
+            while True:
+                try:
+                    await self.connect()
+                    if self.is_connected:
+                        backoff = 5
+                        _first_failure = True
+                        await self.listen_for_events()
+                except Exception as e:
+                    if _first_failure:
+                        logger.warning(f"ESL unavailable, retrying with backoff: {e}")
+                        _first_failure = False
+                    self.is_connected = False
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+        finally:
+            commands_task.cancel()
 
     async def connect(self):
         """Connect and authenticate to FreeSWITCH event socket."""
         try:
-            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
-
-            # Wait for auth challenge from server before sending password
-            challenge = await self.reader.readuntil(b"\n\n")
-            if b"auth/request" not in challenge:
-                logger.warning(f"ESL unexpected challenge: {challenge!r}")
-                self.is_connected = False
-                return
-
-            self.writer.write(f"auth {self.password}\n\n".encode())
-            await self.writer.drain()
-
-            response = await self.reader.readuntil(b"\n\n")
-            if b"+OK" in response:
-                self.is_connected = True
-                logger.info(f"ESL connected to {self.host}:{self.port}")
-                await self.subscribe_events()
-            else:
-                logger.warning(f"ESL authentication failed: {response!r}")
-                self.is_connected = False
+            self.reader, self.writer = await open_session(self.host, self.port, self.password)
+            self.is_connected = True
+            logger.info(f"ESL connected to {self.host}:{self.port}")
+            await self.subscribe_events()
         except Exception as e:
             logger.warning(f"ESL connection failed: {self.host}:{self.port} — {e}")
             self.is_connected = False
 
     async def subscribe_events(self):
-        """Subscribe to relevant FreeSWITCH events."""
-        events = ["CHANNEL_CREATE", "CHANNEL_ANSWER", "CHANNEL_HANGUP", "DTMF", "CUSTOM"]
-        for event in events:
-            self.writer.write(f"event plain {event}\n\n".encode())
-            await self.writer.drain()
-            # Drain the +OK acknowledgement for each subscription
-            try:
-                await asyncio.wait_for(self.reader.readuntil(b"\n\n"), timeout=3)
-            except asyncio.TimeoutError:
-                pass
+        """Subscribe to relevant FreeSWITCH events with a single command."""
+        self.writer.write(f"event {self.event_format} {' '.join(self.events)}\n\n".encode())
+        await self.writer.drain()
+        reply = await asyncio.wait_for(read_message(self.reader), timeout=3)
+        logger.info(f"ESL subscribed ({self.event_format}): {reply.reply_text}")
 
     async def listen_for_events(self):
-        """Read and dispatch events from FreeSWITCH"""
+        """Read framed events from FreeSWITCH and dispatch them; never waits on a handler."""
         while self.is_connected:
             try:
-                line = await self.reader.readuntil(b"\n")
-                if not line:
-                    break
-
-                event_data = line.decode().strip()
-
-                if "CHANNEL_CREATE" in event_data:
-                    logger.info(f"Event: CHANNEL_CREATE - {event_data}")
-                    if self.call_handler:
-                        # Extract UUID from event if present, else use placeholder
-                        parts = event_data.split()
-                        channel_id = parts[-1] if parts else "unknown"
-                        await self.call_handler.create_call(
-                            caller_id=channel_id,
-                            destination="it-team",
-                            call_id=channel_id,
-                        )
-                elif "CHANNEL_ANSWER" in event_data:
-                    logger.info(f"Event: CHANNEL_ANSWER - {event_data}")
-                    if self.call_handler:
-                        parts = event_data.split()
-                        channel_id = parts[-1] if parts else "unknown"
-                        await self.call_handler.update_call(channel_id, {"status": "answered"})
-                elif "CHANNEL_HANGUP" in event_data:
-                    logger.info(f"Event: CHANNEL_HANGUP - {event_data}")
-                    if self.call_handler:
-                        parts = event_data.split()
-                        channel_id = parts[-1] if parts else "unknown"
-                        await self.call_handler.terminate_call(channel_id)
-
+                message = await read_message(self.reader)
             except asyncio.IncompleteReadError:
                 break
             except Exception as e:
                 logger.error(f"Error reading ESL events: {str(e)}")
                 break
 
+            if message.content_type == "text/disconnect-notice":
+                logger.warning("ESL disconnect notice received")
+                break
+            try:
+                event = parse_event(message)
+            except ValueError as e:
+                logger.warning(f"Skipping malformed ESL event: {e}")
+                continue
+            if event is not None:
+                esl_events.labels(event=event.name).inc()
+                self._dispatch(event)
+
         self.is_connected = False
 
-    async def hangup_channel(self, channel_id: str):
-        """Send hangup command for a channel"""
-        if not self.writer:
-            logger.warning("ESL not connected, cannot hangup channel")
+    def _dispatch(self, event: ESLEvent):
+        """
+        Run the handler for Event-Name in the background. Handlers for the same
+        Unique-ID are chained, so a channel's events apply in order.
+        """
+        handler = self._handlers.get(event.name)
+        if handler is None or not event.uuid or not self.call_handler:
             return
+        previous = self._channel_tasks.get(event.uuid)
+        task = asyncio.ensure_future(self._handle(handler, event, previous))
+        self._channel_tasks[event.uuid] = task
+        task.add_done_callback(functools.partial(self._handled, event.uuid))
+
+    async def _handle(self, handler: Callable, event: ESLEvent, previous: Optional[asyncio.Future]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await handler(event)
+        except Exception as e:
+            logger.error(f"Error handling {event.name} for channel {event.uuid}: {e}")
+
+    def _handled(self, channel_id: str, task: asyncio.Future):
+        if self._channel_tasks.get(channel_id) is task:
+            del self._channel_tasks[channel_id]
+
+    async def _on_channel_create(self, event: ESLEvent):
+        logger.info(f"Event: CHANNEL_CREATE - {event.uuid}")
+        await self.call_handler.create_call(
+            caller_id=event.get("Caller-Caller-ID-Number", "unknown"),
+            destination=event.get("Caller-Destination-Number", "it-team"),
+            call_id=event.uuid,
+        )
+
+    async def _on_channel_answer(self, event: ESLEvent):
+        logger.info(f"Event: CHANNEL_ANSWER - {event.uuid}")
+        await self.call_handler.update_call(event.uuid, {"status": "answered"})
+        if self.media_url:
+            await self.start_media_stream(event.uuid)
+
+    async def _on_channel_hangup(self, event: ESLEvent):
+        logger.info(f"Event: CHANNEL_HANGUP - {event.uuid} ({event.get('Hangup-Cause', 'unknown')})")
+        await self.call_handler.terminate_call(event.uuid)
+
+    async def start_media_stream(self, channel_id: str) -> bool:
+        """Have FreeSWITCH stream the channel's audio to /ws/freeswitch/{channel_id}."""
+        rate = settings.FREESWITCH_MEDIA_SAMPLE_RATE
         try:
-            self.writer.write(f"api uuid_kill {channel_id}\n\n".encode())
-            await self.writer.drain()
+            await self.commands.bgapi(
+                f"uuid_audio_stream {channel_id} start {self.media_url}/{channel_id} mono {rate // 1000}k"
+            )
+            logger.info(f"Media stream started for channel {channel_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error starting media stream for channel {channel_id}: {e}")
+            return False
+
+    async def hangup_channel(self, channel_id: str, cause: str = "NORMAL_CLEARING") -> bool:
+        """Hang up a channel through the command pool; returns whether FreeSWITCH confirmed it."""
+        try:
+            await self.commands.bgapi(f"uuid_kill {channel_id} {cause}")
             logger.info(f"Channel hung up: {channel_id}")
+            return True
         except Exception as e:
             logger.error(f"Error hanging up channel {channel_id}: {e}")
+            return False
+
+    async def hangup_channels(self, channel_ids: List[str], cause: str = "NORMAL_CLEARING") -> int:
+        """Hang up many channels concurrently (bounded by the command pool); returns how many succeeded."""
+        results = await asyncio.gather(*(self.hangup_channel(channel_id, cause) for channel_id in channel_ids))
+        return sum(results)
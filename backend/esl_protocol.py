@@ -0,0 +1,101 @@
+"""
+FreeSWITCH Event Socket wire format.
+Every message is a header block terminated by a blank line, optionally
+followed by a Content-Length body. Events arrive as such a body: either
+another header block with URL-encoded values ("event plain") or a JSON
+object ("event json"). Header blocks are read with one readuntil() and
+split in one pass; URL-decoding is deferred until a header is looked up, as
+handlers only read a handful of the ~100 headers FreeSWITCH sends.
+"""
+import asyncio
+import json
+from typing import Dict, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+
+_HEADER_END = b"\n\n"
+
+
+class ESLMessage(NamedTuple):
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("Content-Type", "")
+
+    @property
+    def reply_text(self) -> str:
+        return self.headers.get("Reply-Text", "")
+
+
+class ESLEvent(NamedTuple):
+    name: str
+    uuid: Optional[str]
+    # Raw values; still URL-encoded when url_encoded is set, so read them through get()
+    headers: Dict[str, str]
+    body: str
+    url_encoded: bool = False
+
+    def get(self, header: str, default: str = None) -> Optional[str]:
+        value = self.headers.get(header)
+        if value is None:
+            return default
+        if self.url_encoded and "%" in value:
+            return unquote(value)
+        return value
+
+
+async def read_message(reader: asyncio.StreamReader) -> ESLMessage:
+    """Read one framed message; raises IncompleteReadError when the socket closes."""
+    headers = parse_headers(await reader.readuntil(_HEADER_END))
+    length = headers.get("Content-Length")
+    body = await reader.readexactly(int(length)) if length else b""
+    return ESLMessage(headers, body)
+
+
+async def open_session(
+    host: str, port: int, password: str
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Connect and authenticate an inbound session; raises ConnectionError if refused."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        # Wait for auth challenge from server before sending password
+        challenge = await read_message(reader)
+        if challenge.content_type != "auth/request":
+            raise ConnectionError(f"unexpected challenge {challenge.headers!r}")
+        writer.write(f"auth {password}\n\n".encode())
+        await writer.drain()
+        reply = await read_message(reader)
+        if not reply.reply_text.startswith("+OK"):
+            raise ConnectionError(f"authentication failed: {reply.reply_text!r}")
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+def parse_headers(block: bytes) -> Dict[str, str]:
+    headers = {}
+    for line in block.decode("utf-8", "replace").split("\n"):
+        name, sep, value = line.partition(": ")
+        if sep:
+            headers[name] = value
+    return headers
+
+
+def parse_event(message: ESLMessage) -> Optional[ESLEvent]:
+    """Decode an event message; returns None for replies and other non-event messages."""
+    content_type = message.content_type
+    if content_type == "text/event-json":
+        headers = json.loads(message.body)
+        body = headers.pop("_body", "")
+        event = ESLEvent("", None, headers, body)
+    elif content_type == "text/event-plain":
+        block, _, rest = message.body.partition(_HEADER_END)
+        headers = parse_headers(block)
+        length = headers.get("Content-Length")
+        body = rest[:int(length)].decode("utf-8", "replace") if length else ""
+        event = ESLEvent("", None, headers, body, url_encoded=True)
+    else:
+        return None
+    return event._replace(name=event.get("Event-Name", ""), uuid=event.get("Unique-ID"))
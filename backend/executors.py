@@ -0,0 +1,81 @@
+"""
+Dedicated per-engine executors.
+STT, language detection, translation and TTS each get their own pool with a
+max in-flight limit, so a burst on one stage cannot starve the others in the
+shared default executor. Every pool exports active/queued gauges and a
+wait-time histogram.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict
+
+from config import settings
+from metrics import executor_active, executor_queued, executor_wait
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("stt", "detector", "translation", "tts")
+
+
+class EngineExecutor:
+    """
+    Bounded executor for one engine.
+    kind="process" only suits picklable, module-level callables; engines that
+    hold a model in this process use threads.
+    """
+
+    def __init__(self, name: str, workers: int, max_in_flight: int, kind: str = "thread"):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.kind = kind
+        if kind == "process":
+            self._executor: Executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-")
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        logger.info(f"{name} executor: {self.workers} {kind} worker(s), max {self.max_in_flight} in flight")
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) in this engine's pool, waiting for an in-flight slot first."""
+        queued_at = time.perf_counter()
+        executor_queued.labels(engine=self.name).inc()
+        try:
+            await self._slots.acquire()
+        finally:
+            executor_queued.labels(engine=self.name).dec()
+        executor_wait.labels(engine=self.name).observe(time.perf_counter() - queued_at)
+
+        executor_active.labels(engine=self.name).inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            executor_active.labels(engine=self.name).dec()
+            self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_executors: Dict[str, EngineExecutor] = {}
+
+
+def get_executor(engine: str) -> EngineExecutor:
+    """Return the shared executor for an engine, creating it from settings on first use."""
+    executor = _executors.get(engine)
+    if executor is None:
+        prefix = engine.upper()
+        workers = getattr(settings, f"{prefix}_EXECUTOR_WORKERS") or settings.WORKER_THREADS
+        max_in_flight = getattr(settings, f"{prefix}_MAX_IN_FLIGHT") or workers * 2
+        executor = EngineExecutor(engine, workers, max_in_flight)
+        _executors[engine] = executor
+    return executor
+
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
@@ -0,0 +1,457 @@
+"""
+Out-of-process inference workers.
+With INFERENCE_MODE=workers, WhisperSTT, TranslationEngine and CoquiTTS each run
+in a long-lived worker process, so tokenization, decoding loops and numpy
+conversions never compete with the gateway's event loop for the GIL.
+
+The gateway talks to each worker over a Unix socket (length-prefixed pickle
+frames). PCM never travels through the socket: it is written once into a
+shared-memory block and only the block's name is sent.
+
+Workers can also be started standalone:  python inference_workers.py stt
+"""
+import asyncio
+import inspect
+import itertools
+import logging
+import os
+import pickle
+import struct
+import sys
+import time
+from multiprocessing import get_context, resource_tracker, shared_memory
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("stt", "translation", "tts")
+
+# Only these engine methods may be invoked over the socket
+_EXPOSED_METHODS = {
+    "transcribe_streaming", "transcribe_with_language", "transcribe_segments", "translate", "synthesize_stream",
+}
+
+_HEADER = struct.Struct("!I")
+
+
+class ShmRef(NamedTuple):
+    """Name and layout of a shared-memory block holding one PCM/audio buffer."""
+    name: str
+    nbytes: int
+    dtype: str
+
+
+class SharedBlock:
+    """Owner-side handle on a shared-memory block."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, nbytes: int, dtype: str):
+        self.shm = shm
+        self.ref = ShmRef(shm.name, nbytes, dtype)
+        self.view: Optional[memoryview] = shm.buf[:nbytes]
+
+    @classmethod
+    def from_buffer(cls, data, dtype: str = "uint8") -> "SharedBlock":
+        src = memoryview(data).cast("B")
+        shm = shared_memory.SharedMemory(create=True, size=max(1, src.nbytes))
+        shm.buf[:src.nbytes] = src
+        return cls(shm, src.nbytes, dtype)
+
+    @classmethod
+    def attach(cls, ref: ShmRef) -> "SharedBlock":
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=ref.name, track=False)
+        else:
+            # Older versions register attached blocks too; spawned workers share
+            # the gateway's resource tracker, so a duplicate entry is harmless.
+            shm = shared_memory.SharedMemory(name=ref.name)
+        return cls(shm, ref.nbytes, ref.dtype)
+
+    def array(self) -> np.ndarray:
+        return np.frombuffer(self.view, dtype=self.ref.dtype)
+
+    def release(self, unlink: bool):
+        """Drop our mapping; unlink removes the name once the last reader is done."""
+        try:
+            if self.view is not None:
+                self.view.release()
+                self.view = None
+            self.shm.close()
+        except BufferError:
+            # A consumer still holds a view; the mapping goes away with it
+            pass
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def hand_off(self) -> ShmRef:
+        """Pass ownership (and the duty to unlink) to the peer that receives the ref."""
+        self.release(unlink=False)
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        return self.ref
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        (length,) = _HEADER.unpack(header)
+        return pickle.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def _write_frame(writer: asyncio.StreamWriter, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(data)) + data)
+
+
+def socket_path(engine: str) -> str:
+    return os.path.join(settings.INFERENCE_SOCKET_DIR, f"{engine}.sock")
+
+
+# ── Worker side ───────────────────────────────────────────────────────────────
+
+def _load_engine(engine: str):
+    if engine == "stt":
+        from stt_engine import WhisperSTT
+        return WhisperSTT()
+    if engine == "translation":
+        import redis.asyncio as redis
+        from translator import TranslationEngine
+        return TranslationEngine(redis_client=redis.from_url(settings.redis_url, decode_responses=True))
+    if engine == "tts":
+        from tts_engine import CoquiTTS
+        tts = CoquiTTS()
+        tts.presynthesize(settings.tts_presynth_prompts, settings.TARGET_LANGUAGE)
+        return tts
+    raise ValueError(f"Unknown inference engine: {engine}")
+
+
+class WorkerServer:
+    """Serves one engine object's exposed methods to gateway connections."""
+
+    def __init__(self, target):
+        self.target = target
+
+    async def serve(self, path: str):
+        """Listen on path; the socket appears only once the engine is ready."""
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self._handle_connection, path=path)
+        logger.info(f"Inference worker listening on {path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        requests: Dict[int, asyncio.Task] = {}
+        try:
+            while True:
+                message = await _read_frame(reader)
+                if message is None:
+                    break
+                request_id, method, args = message
+                if method == "__cancel__":
+                    task = requests.get(request_id)
+                    if task:
+                        task.cancel()
+                    continue
+                task = asyncio.ensure_future(self._dispatch(request_id, method, args, writer, write_lock))
+                requests[request_id] = task
+                task.add_done_callback(lambda _, rid=request_id: requests.pop(rid, None))
+        finally:
+            for task in list(requests.values()):
+                task.cancel()
+            writer.close()
+
+    async def _dispatch(self, request_id, method, args, writer, write_lock):
+        attached = []
+        try:
+            if method not in _EXPOSED_METHODS:
+                raise ValueError(f"Method not exposed: {method}")
+            call_args = []
+            for arg in args:
+                if isinstance(arg, ShmRef):
+                    block = SharedBlock.attach(arg)
+                    attached.append(block)
+                    call_args.append(block.array())
+                else:
+                    call_args.append(arg)
+
+            result = getattr(self.target, method)(*call_args)
+            if inspect.isasyncgen(result):
+                async for chunk in result:
+                    if isinstance(chunk, (str, tuple)):
+                        await self._send(writer, write_lock, (request_id, "chunk", chunk))
+                        continue
+                    # The gateway unlinks the block once it has sent the audio
+                    ref = SharedBlock.from_buffer(chunk).hand_off()
+                    await self._send(writer, write_lock, (request_id, "chunk", ref))
+                await self._send(writer, write_lock, (request_id, "end", None))
+            else:
+                result = await result
+                del call_args
+                await self._send(writer, write_lock, (request_id, "result", result))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Inference worker {method} failed: {e}")
+            await self._send(writer, write_lock, (request_id, "error", f"{type(e).__name__}: {e}"))
+        finally:
+            for block in attached:
+                block.release(unlink=False)
+
+    async def _send(self, writer, write_lock, message):
+        async with write_lock:
+            _write_frame(writer, message)
+            await writer.drain()
+
+
+def worker_main(engine: str, path: str):
+    """Process entry point: load the engine, then serve it."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s [%(levelname)s] worker-{engine} %(name)s: %(message)s"
+    )
+    target = _load_engine(engine)
+    asyncio.run(WorkerServer(target).serve(path))
+
+
+# ── Gateway side ──────────────────────────────────────────────────────────────
+
+class WorkerClient:
+    """Multiplexes concurrent requests to one worker over a single Unix socket."""
+
+    def __init__(self, engine: str, path: str):
+        self.engine = engine
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[int, asyncio.Queue] = {}
+        self._ids = itertools.count()
+
+    async def _ensure_connected(self):
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            self._reader_task = asyncio.ensure_future(self._read_loop(self._reader))
+            logger.info(f"Connected to {self.engine} inference worker at {self.path}")
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        while True:
+            message = await _read_frame(reader)
+            if message is None:
+                break
+            request_id, kind, payload = message
+            queue = self._pending.get(request_id)
+            if queue is None:
+                if kind == "chunk" and isinstance(payload, ShmRef):
+                    # Late chunk for an abandoned stream — free it
+                    SharedBlock.attach(payload).release(unlink=True)
+                continue
+            queue.put_nowait((kind, payload))
+
+        logger.warning(f"Lost connection to {self.engine} inference worker")
+        self._writer = None
+        for queue in self._pending.values():
+            queue.put_nowait(("error", "inference worker disconnected"))
+
+    async def _send(self, method: str, args: tuple):
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[request_id] = queue
+        _write_frame(self._writer, (request_id, method, args))
+        await self._writer.drain()
+        return request_id, queue
+
+    async def request(self, method: str, *args):
+        request_id, queue = await self._send(method, args)
+        try:
+            kind, payload = await queue.get()
+        finally:
+            self._pending.pop(request_id, None)
+        if kind == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    async def stream(self, method: str, *args) -> AsyncIterator:
+        """
+        Yield streamed chunks. Audio arrives as zero-copy views of shared-memory
+        blocks, each freed once the consumer moves on; text (and tuples of it) arrives inline.
+        """
+        request_id, queue = await self._send(method, args)
+        finished = False
+        try:
+            while True:
+                kind, payload = await queue.get()
+                if kind == "end":
+                    finished = True
+                    return
+                if kind == "error":
+                    finished = True
+                    raise RuntimeError(payload)
+                if not isinstance(payload, ShmRef):
+                    yield payload
+                    continue
+                block = SharedBlock.attach(payload)
+                try:
+                    yield block.view
+                finally:
+                    block.release(unlink=True)
+        finally:
+            self._pending.pop(request_id, None)
+            if not finished and self._writer is not None:
+                _write_frame(self._writer, (request_id, "__cancel__", ()))
+            # Free any chunks that arrived but were never consumed
+            while not queue.empty():
+                kind, payload = queue.get_nowait()
+                if kind == "chunk" and isinstance(payload, ShmRef):
+                    SharedBlock.attach(payload).release(unlink=True)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+
+
+class RemoteSTT:
+    """Gateway proxy with the WhisperSTT async API."""
+
+    def __init__(self, client: WorkerClient):
+        self.client = client
+
+    async def transcribe_streaming(self, audio_array: np.ndarray, language: str = None, prompt: str = None) -> str:
+        text, _, _ = await self.transcribe_with_language(audio_array, language, prompt)
+        return text
+
+    async def transcribe_with_language(
+        self, audio_array: np.ndarray, language: str = None, prompt: str = None
+    ) -> Tuple[str, Optional[str], Optional[float]]:
+        audio_array = np.ascontiguousarray(audio_array, dtype=np.float32)
+        block = SharedBlock.from_buffer(audio_array, dtype="float32")
+        try:
+            return tuple(await self.client.request("transcribe_with_language", block.ref, language, prompt))
+        except Exception as e:
+            logger.error(f"STT error: {e}")
+            return "", None, None
+        finally:
+            block.release(unlink=True)
+
+    async def transcribe_batch(self, audio_arrays: list) -> list:
+        return await asyncio.gather(*[self.transcribe_streaming(a) for a in audio_arrays])
+
+    async def transcribe_segments(
+        self, audio_array: np.ndarray, language: str = None, prompt: str = None
+    ) -> AsyncIterator[Tuple[str, Optional[str], Optional[float]]]:
+        audio_array = np.ascontiguousarray(audio_array, dtype=np.float32)
+        block = SharedBlock.from_buffer(audio_array, dtype="float32")
+        try:
+            async for segment in self.client.stream("transcribe_segments", block.ref, language, prompt):
+                yield tuple(segment)
+        finally:
+            block.release(unlink=True)
+
+
+class RemoteTranslator:
+    """Gateway proxy with the TranslationEngine async API."""
+
+    def __init__(self, client: WorkerClient):
+        self.client = client
+
+    async def translate(self, text: str, source_lang: str, target_lang: str) -> str:
+        if not text or not text.strip():
+            return ""
+        try:
+            return await self.client.request("translate", text, source_lang, target_lang)
+        except Exception as e:
+            logger.error(f"Translation error: {e}")
+            return text  # Return original on error
+
+    async def translate_batch(self, texts: list, source_lang: str, target_lang: str) -> list:
+        return await asyncio.gather(*[self.translate(t, source_lang, target_lang) for t in texts])
+
+
+class RemoteTTS:
+    """Gateway proxy with the CoquiTTS async API; audio arrives via shared memory."""
+
+    def __init__(self, client: WorkerClient):
+        self.client = client
+
+    async def synthesize_stream(self, text: str, language: str) -> AsyncIterator[memoryview]:
+        if not text or not text.strip():
+            return
+        try:
+            async for pcm in self.client.stream("synthesize_stream", text, language):
+                yield pcm
+        except RuntimeError as e:
+            logger.error(f"TTS error: {e}")
+
+    async def synthesize(self, text: str, language: str) -> bytes:
+        chunks = [bytes(pcm) async for pcm in self.synthesize_stream(text, language)]
+        return b"".join(chunks)
+
+    async def synthesize_batch(self, texts: list, language: str) -> list:
+        return await asyncio.gather(*[self.synthesize(t, language) for t in texts])
+
+
+_processes: Dict[str, object] = {}
+
+
+def start_workers(engines=ENGINES) -> Dict[str, WorkerClient]:
+    """
+    Spawn one worker process per engine and block until each is serving.
+    Runs in the model-preload thread, not on the event loop.
+    """
+    os.makedirs(settings.INFERENCE_SOCKET_DIR, exist_ok=True)
+    ctx = get_context("spawn")
+    for engine in engines:
+        path = socket_path(engine)
+        if os.path.exists(path):
+            os.unlink(path)
+        process = ctx.Process(target=worker_main, args=(engine, path), name=f"inference-{engine}", daemon=True)
+        process.start()
+        _processes[engine] = process
+        logger.info(f"Started {engine} inference worker (pid {process.pid})")
+
+    deadline = time.monotonic() + settings.INFERENCE_WORKER_START_TIMEOUT
+    for engine in engines:
+        path = socket_path(engine)
+        while not os.path.exists(path):
+            if not _processes[engine].is_alive():
+                raise RuntimeError(f"{engine} inference worker exited during startup")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{engine} inference worker did not become ready")
+            time.sleep(0.5)
+        logger.info(f"{engine} inference worker ready")
+
+    return {engine: WorkerClient(engine, socket_path(engine)) for engine in engines}
+
+
+def stop_workers():
+    for engine, process in _processes.items():
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=5)
+        logger.info(f"Stopped {engine} inference worker")
+    _processes.clear()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ENGINES:
+        sys.exit(f"usage: python inference_workers.py {{{','.join(ENGINES)}}}")
+    os.makedirs(settings.INFERENCE_SOCKET_DIR, exist_ok=True)
+    worker_main(sys.argv[1], socket_path(sys.argv[1]))
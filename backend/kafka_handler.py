@@ -1,145 +1,284 @@
 """
 Kafka Event Handler - Publishes and consumes call events.
-Initialization is non-blocking — if Kafka is unavailable the handler
-silently skips rather than delaying application startup.
+Initialization is non-blocking — if Kafka is unavailable the clients keep
+retrying in the background rather than delaying application startup.
 """
 import asyncio
+import functools
 import json
 import logging
+import time
+import zlib
+from collections import deque
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRecord, TopicPartition
+from aiokafka.errors import CommitFailedError
+
+from config import settings
+from metrics import (
+    kafka_consumer_events,
+    kafka_consumer_lag,
+    kafka_producer_batch_size,
+    kafka_producer_buffered,
+    kafka_producer_errors,
+    kafka_send_latency,
+)
 
 logger = logging.getLogger(__name__)
 
-# Silence kafka-python's internal noisy connection logger
-logging.getLogger("kafka").setLevel(logging.CRITICAL)
+# Silence aiokafka's internal noisy connection logger; connect failures are logged below
+logging.getLogger("aiokafka").setLevel(logging.CRITICAL)
 
 _CONNECT_TIMEOUT = 5
+_MAX_RECONNECT_DELAY = 30
+
+
+async def _connect(factory: Callable, name: str):
+    """Start an aiokafka client, retrying with backoff while the brokers are unreachable."""
+    delay = 1
+    while True:
+        client = factory()
+        try:
+            await client.start()
+        except Exception as e:
+            await client.stop()
+            logger.warning(f"Kafka {name} unavailable, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _MAX_RECONNECT_DELAY)
+            continue
+        logger.info(f"Kafka {name} connected")
+        return client
+
+
+class CallEventProducer:
+    """
+    Asyncio-native publisher for call events.
+    publish() only appends to a bounded buffer and never waits on the broker;
+    run() hands buffered events to aiokafka, which batches them per partition
+    (linger / batch size) and compresses each batch. Events are keyed by
+    call_id, so every event of a call lands on one partition in order. When
+    the buffer is full the oldest event is dropped.
+    """
+
+    def __init__(
+        self,
+        bootstrap_servers: List[str],
+        topic: str = None,
+        linger_ms: int = None,
+        max_batch_bytes: int = None,
+        compression: str = None,
+        max_buffered: int = None,
+    ):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic or settings.KAFKA_TOPIC_GATEWAY_EVENTS
+        self.linger_ms = linger_ms if linger_ms is not None else settings.KAFKA_PRODUCER_LINGER_MS
+        self.max_batch_bytes = max_batch_bytes or settings.KAFKA_PRODUCER_MAX_BATCH_BYTES
+        self.compression = (compression or settings.KAFKA_PRODUCER_COMPRESSION).lower()
+        self.max_buffered = max_buffered or settings.KAFKA_PRODUCER_MAX_BUFFERED
+
+        # (enqueued at, call_id, payload)
+        self._buffer: Deque[Tuple[float, str, dict]] = deque()
+        self._ready = asyncio.Event()
+        self._producer: Optional[AIOKafkaProducer] = None
+
+    def publish(self, event_type: str, call_id: str, data: dict = None) -> bool:
+        """Buffer one event; returns False if an older event had to be dropped for it."""
+        dropped = len(self._buffer) >= self.max_buffered
+        if dropped:
+            self._buffer.popleft()
+            kafka_producer_errors.labels(reason="buffer_full").inc()
+        self._buffer.append((time.perf_counter(), call_id, {
+            "event_type": event_type,
+            "call_id": call_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "data": data or {},
+        }))
+        kafka_producer_buffered.set(len(self._buffer))
+        self._ready.set()
+        return not dropped
+
+    async def run(self):
+        """Connect (retrying with backoff) and drain the buffer until cancelled; flushes on exit."""
+        try:
+            self._producer = await _connect(lambda: AIOKafkaProducer(
+                bootstrap_servers=self.bootstrap_servers,
+                acks="all",
+                # Broker-side retries without reordering or duplicating a call's events
+                enable_idempotence=True,
+                compression_type=None if self.compression == "none" else self.compression,
+                linger_ms=self.linger_ms,
+                max_batch_size=self.max_batch_bytes,
+                request_timeout_ms=_CONNECT_TIMEOUT * 1000,
+            ), f"producer ({self.compression}, linger {self.linger_ms}ms)")
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                await self._drain()
+        finally:
+            if self._producer is not None:
+                try:
+                    await asyncio.wait_for(self._drain(), _CONNECT_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"Kafka producer flush on shutdown incomplete: {e!r}")
+                # stop() waits for in-flight batches to be delivered
+                await self._producer.stop()
+                self._producer = None
+
+    async def _drain(self):
+        sent = 0
+        while self._buffer:
+            enqueued_at, call_id, payload = self._buffer.popleft()
+            try:
+                # Only waits when aiokafka's own accumulator is full; delivery is reported via the future
+                delivery = await self._producer.send(
+                    self.topic,
+                    value=json.dumps(payload, separators=(",", ":")).encode("utf-8"),
+                    key=call_id.encode("utf-8"),
+                )
+            except Exception as e:
+                kafka_producer_errors.labels(reason="send").inc()
+                logger.error(f"Error publishing Kafka event for call {call_id}: {e}")
+                continue
+            delivery.add_done_callback(functools.partial(_delivered, enqueued_at))
+            sent += 1
+        kafka_producer_buffered.set(0)
+        if sent:
+            kafka_producer_batch_size.observe(sent)
+
+
+def _delivered(enqueued_at: float, delivery: asyncio.Future):
+    if delivery.cancelled():
+        return
+    error = delivery.exception()
+    if error is not None:
+        kafka_producer_errors.labels(reason="delivery").inc()
+        logger.error(f"Kafka event delivery failed: {error}")
+        return
+    kafka_send_latency.observe(time.perf_counter() - enqueued_at)
 
 
 class KafkaCallEventHandler:
-    """Handles Kafka event streaming for calls."""
+    """
+    Handles Kafka event streaming for calls.
+    Consumed records are fetched in batches and split into lanes by call_id:
+    lanes run concurrently, records within a lane run in order, so events of
+    one call are applied in order while different calls proceed in parallel.
+    Offsets are committed only once the whole batch has been processed.
+    Events are published to KAFKA_TOPIC_GATEWAY_EVENTS, which is not among
+    the consumed topics.
+    """
 
     def __init__(
         self,
         bootstrap_servers: List[str],
         call_handler: Optional[object] = None,
-        consumer_group: str = "voice-gateway",
+        consumer_group: str = None,
+        topics: List[str] = None,
+        workers: int = None,
+        max_records: int = None,
     ):
         self.bootstrap_servers = bootstrap_servers
         self.call_handler = call_handler
-        self.consumer_group = consumer_group
-        self.producer = None
-        self.consumer = None
-
-    def _broker_reachable(self) -> bool:
-        """Quick TCP check — avoids kafka-python's slow internal retry on DNS failure."""
-        import socket
-        for server in self.bootstrap_servers:
-            try:
-                host, port = server.rsplit(":", 1)
-                with socket.create_connection((host, int(port)), timeout=_CONNECT_TIMEOUT):
-                    return True
-            except Exception:
-                continue
-        return False
+        self.consumer_group = consumer_group or settings.KAFKA_CONSUMER_GROUP
+        self.topics = topics or [settings.KAFKA_TOPIC_CALLS, settings.KAFKA_TOPIC_EVENTS]
+        if settings.KAFKA_TOPIC_GATEWAY_EVENTS in self.topics:
+            raise ValueError(f"gateway must not consume its own event topic {settings.KAFKA_TOPIC_GATEWAY_EVENTS!r}")
+        self.workers = max(1, workers or settings.KAFKA_CONSUMER_WORKERS)
+        self.max_records = max_records or settings.KAFKA_CONSUMER_MAX_RECORDS
+        self.producer = CallEventProducer(bootstrap_servers)
+        self.consumer: Optional[AIOKafkaConsumer] = None
 
-    def _init_producer(self):
-        from kafka import KafkaProducer
-        self.producer = KafkaProducer(
-            bootstrap_servers=self.bootstrap_servers,
-            value_serializer=lambda v: json.dumps(v).encode("utf-8"),
-            request_timeout_ms=_CONNECT_TIMEOUT * 1000,
-            retries=0,
-            max_block_ms=_CONNECT_TIMEOUT * 1000,
-        )
-
-    def _init_consumer(self):
-        from kafka import KafkaConsumer
-        self.consumer = KafkaConsumer(
-            "voice-calls",
-            "voice-events",
+    def publish_call_event(self, event_type: str, call_id: str, data: dict = None) -> bool:
+        """Non-blocking; safe to call from the audio path (see CallEventProducer)."""
+        return self.producer.publish(event_type, call_id, data)
+
+    async def consume_events(self):
+        """Connect (retrying with backoff) and process batches until cancelled."""
+        self.consumer = await _connect(lambda: AIOKafkaConsumer(
+            *self.topics,
             bootstrap_servers=self.bootstrap_servers,
             group_id=self.consumer_group,
-            value_deserializer=lambda m: json.loads(m.decode("utf-8")),
+            enable_auto_commit=False,
             auto_offset_reset="earliest",
             request_timeout_ms=_CONNECT_TIMEOUT * 1000,
-            consumer_timeout_ms=_CONNECT_TIMEOUT * 1000,
-        )
-
-    async def publish_call_event(self, event_type: str, call_id: str, data: dict):
-        if not self.producer:
-            return
+        ), f"consumer ({', '.join(self.topics)})")
         try:
-            payload = {
-                "event_type": event_type,
-                "call_id": call_id,
-                "timestamp": datetime.utcnow().isoformat(),
-                "data": data,
-            }
-            self.producer.send("voice-events", value=payload)
-        except Exception as e:
-            logger.error(f"Error publishing Kafka event: {e}")
+            while True:
+                batches = await self.consumer.getmany(
+                    timeout_ms=settings.KAFKA_CONSUMER_FETCH_TIMEOUT_MS, max_records=self.max_records
+                )
+                if batches:
+                    await self._process_batch(batches)
+                    # At-least-once: a crash or rebalance before this commit replays the batch
+                    try:
+                        await self.consumer.commit({
+                            tp: records[-1].offset + 1 for tp, records in batches.items()
+                        })
+                    except CommitFailedError as e:
+                        logger.warning(f"Kafka offset commit failed, batch will be redelivered: {e}")
+                await self._export_lag()
+        finally:
+            await self.consumer.stop()
+            self.consumer = None
 
-    async def consume_events(self):
-        """
-        Try to connect to Kafka in a thread (non-blocking).
-        If unavailable, logs a warning and exits cleanly.
-        """
-        loop = asyncio.get_event_loop()
-
-        # Fast TCP check before attempting kafka-python init
-        reachable = await loop.run_in_executor(None, self._broker_reachable)
-        if not reachable:
-            logger.warning(f"Kafka brokers unreachable: {self.bootstrap_servers} — skipping")
-            return
+    async def _process_batch(self, batches: Dict[TopicPartition, List[ConsumerRecord]]):
+        lanes: List[List[dict]] = [[] for _ in range(self.workers)]
+        for records in batches.values():
+            for record in records:
+                event = _decode(record)
+                if event is None:
+                    kafka_consumer_events.labels(result="invalid").inc()
+                    continue
+                lanes[zlib.crc32(event["call_id"].encode("utf-8")) % self.workers].append(event)
+        await asyncio.gather(*(self._process_lane(lane) for lane in lanes if lane))
 
-        try:
-            await asyncio.wait_for(
-                loop.run_in_executor(None, self._init_producer),
-                timeout=_CONNECT_TIMEOUT + 1,
-            )
-            logger.info(f"Kafka producer connected: {self.bootstrap_servers}")
-        except Exception as e:
-            logger.warning(f"Kafka producer unavailable: {e}")
+    async def _process_lane(self, events: List[dict]):
+        for event in events:
+            try:
+                await self._handle_event(event)
+                kafka_consumer_events.labels(result="processed").inc()
+            except Exception as e:
+                kafka_consumer_events.labels(result="failed").inc()
+                logger.error(f"Error processing Kafka event {event.get('event_type')} for call {event['call_id']}: {e}")
 
-        try:
-            await asyncio.wait_for(
-                loop.run_in_executor(None, self._init_consumer),
-                timeout=_CONNECT_TIMEOUT + 1,
-            )
-            logger.info(f"Kafka consumer connected: {self.bootstrap_servers}")
-        except Exception as e:
-            logger.warning(f"Kafka consumer unavailable: {e}")
+    async def _handle_event(self, event: dict):
+        event_type, call_id = event.get("event_type"), event["call_id"]
+        # Fields may be top-level (external producers) or under "data" (CallEventProducer)
+        data = {**(event.get("data") or {}), **event}
+        logger.info(f"Kafka event: {event_type} for call {call_id}")
+        if not self.call_handler:
             return
+        if event_type == "call.created":
+            # Redelivered after a rebalance or restart: the call already exists
+            if await self.call_handler.get_call(call_id):
+                return
+            await self.call_handler.create_call(
+                caller_id=data.get("caller_id", "unknown"),
+                destination=data.get("destination", "it-team"),
+                source_language=data.get("source_language"),
+                call_id=call_id,
+            )
+        elif event_type == "call.terminated":
+            await self.call_handler.terminate_call(call_id)
 
-        await loop.run_in_executor(None, self._consume_blocking)
+    async def _export_lag(self):
+        for tp in self.consumer.assignment():
+            highwater = self.consumer.highwater(tp)
+            if highwater is None:
+                continue
+            position = await self.consumer.position(tp)
+            kafka_consumer_lag.labels(topic=tp.topic, partition=str(tp.partition)).set(max(0, highwater - position))
 
-    def _consume_blocking(self):
-        """Blocking consumer loop (runs in thread pool)."""
-        try:
-            for message in self.consumer:
-                try:
-                    event = message.value
-                    event_type = event.get("event_type")
-                    call_id = event.get("call_id")
-                    logger.info(f"Kafka event: {event_type} for call {call_id}")
-                    if self.call_handler and call_id:
-                        if event_type == "call.created":
-                            asyncio.run_coroutine_threadsafe(
-                                self.call_handler.create_call(
-                                    caller_id=event.get("caller_id", "unknown"),
-                                    destination=event.get("destination", "it-team"),
-                                    call_id=call_id,
-                                ),
-                                asyncio.get_event_loop(),
-                            )
-                        elif event_type == "call.terminated":
-                            asyncio.run_coroutine_threadsafe(
-                                self.call_handler.terminate_call(call_id),
-                                asyncio.get_event_loop(),
-                            )
-                except Exception as e:
-                    logger.error(f"Error processing Kafka message: {e}")
-        except Exception as e:
-            logger.error(f"Kafka consumer error: {e}")
+
+def _decode(record: ConsumerRecord) -> Optional[dict]:
+    try:
+        event = json.loads(record.value)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Skipping undecodable Kafka record {record.topic}:{record.partition}@{record.offset}: {e}")
+        return None
+    if not isinstance(event, dict) or not isinstance(event.get("call_id"), str) or not event["call_id"]:
+        logger.warning(f"Skipping Kafka record without a call_id {record.topic}:{record.partition}@{record.offset}")
+        return None
+    return event
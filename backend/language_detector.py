@@ -2,10 +2,12 @@
 Language Detection using fastText lid.176.bin model.
 Model is downloaded on first use into /app/.cache/fasttext/.
 """
-import asyncio
 import logging
 import os
 import urllib.request
+from typing import Tuple
+
+from executors import get_executor
 
 logger = logging.getLogger(__name__)
 
@@ -32,22 +34,29 @@ class LanguageDetector:
             urllib.request.urlretrieve(_MODEL_URL, _MODEL_PATH)
             logger.info("fastText model downloaded")
         self.model = fasttext.load_model(_MODEL_PATH)
+        self.executor = get_executor("detector")
 
     async def detect(self, text: str) -> str:
         if not text or len(text.strip()) < 3:
             return "unknown"
+        language, confidence = await self.detect_with_confidence(text)
+        if confidence < 0.5:
+            return "hindi"
+        return language
+
+    async def detect_with_confidence(self, text: str) -> Tuple[str, float]:
+        """Top fastText label as (language, confidence); ("unknown", 0.0) on failure."""
+        if not text or len(text.strip()) < 3:
+            return "unknown", 0.0
         try:
-            loop = asyncio.get_event_loop()
-            predictions = await loop.run_in_executor(
-                None, lambda: self.model.predict(text.replace("\n", " "), k=1)
+            predictions = await self.executor.run(
+                lambda: self.model.predict(text.replace("\n", " "), k=1)
             )
             label = predictions[0][0]
             confidence = float(predictions[1][0])
             language = _LANG_MAP.get(label, "unknown")
             logger.info(f"Detected language: {language} (confidence: {confidence:.2f})")
-            if confidence < 0.5:
-                return "hindi"
-            return language
+            return language, confidence
         except Exception as e:
             logger.error(f"Language detection error: {e}")
-            return "hindi"
+            return "unknown", 0.0
@@ -0,0 +1,116 @@
+"""
+Per-call source-language resolution.
+Whisper's audio-based language ID (already computed while transcribing) is
+the primary signal; fastText on the transcript is only consulted when Whisper
+is unsure. Evidence is smoothed per call with hysteresis so the language does
+not flip between segments, and once it is stable it is pinned for STT, which
+skips Whisper's own detection pass on later segments.
+"""
+import logging
+from typing import Dict, Optional
+
+from config import settings
+from metrics import language_resolutions
+
+logger = logging.getLogger(__name__)
+
+# Whisper language codes for the languages the pipeline supports
+WHISPER_LANGUAGES = {
+    "ta": "tamil",
+    "te": "telugu",
+    "kn": "kannada",
+    "mr": "marathi",
+    "hi": "hindi",
+    "en": "english",
+}
+_WHISPER_CODES = {name: code for code, name in WHISPER_LANGUAGES.items()}
+
+# Same default the fastText detector falls back to
+_DEFAULT_LANGUAGE = "hindi"
+
+
+class CallLanguage:
+    """
+    Running language estimate for one call.
+    Each segment decays every language's score and adds its evidence to the
+    observed one; the current language only changes when a challenger leads
+    it by switch_margin, so a single odd segment cannot flip the call.
+    """
+
+    def __init__(
+        self,
+        detector,
+        min_confidence: float = None,
+        switch_margin: float = None,
+        smoothing: float = None,
+        pin_after: int = None,
+        recheck_every: int = None,
+    ):
+        self.detector = detector
+        self.min_confidence = min_confidence if min_confidence is not None else settings.LANGUAGE_MIN_CONFIDENCE
+        self.switch_margin = switch_margin if switch_margin is not None else settings.LANGUAGE_SWITCH_MARGIN
+        self.smoothing = smoothing if smoothing is not None else settings.LANGUAGE_SMOOTHING
+        self.pin_after = pin_after if pin_after is not None else settings.LANGUAGE_PIN_AFTER
+        self.recheck_every = recheck_every if recheck_every is not None else settings.LANGUAGE_RECHECK_EVERY
+
+        self.language: Optional[str] = None
+        self.pinned = False
+        self._scores: Dict[str, float] = {}
+        self._streak = 0
+        self._since_check = 0
+
+    def stt_language(self, final: bool = True) -> Optional[str]:
+        """
+        Whisper language code to decode the next segment with, or None to let
+        Whisper detect it. A pinned call still re-checks every recheck_every
+        final decodes; partial re-decodes pass final=False and never count.
+        """
+        if not self.pinned:
+            return None
+        if not final:
+            return _WHISPER_CODES.get(self.language)
+        self._since_check += 1
+        if self.recheck_every and self._since_check >= self.recheck_every:
+            self._since_check = 0
+            return None
+        return _WHISPER_CODES.get(self.language)
+
+    async def resolve(self, text: str, whisper_language: str = None, probability: float = None) -> str:
+        """
+        Fold one segment's evidence into the estimate and return the call's language.
+        probability None with a language means the segment was decoded pinned.
+        """
+        if whisper_language is not None and probability is None:
+            language_resolutions.labels(source="pinned").inc()
+            return self.language or WHISPER_LANGUAGES.get(whisper_language, _DEFAULT_LANGUAGE)
+
+        name = WHISPER_LANGUAGES.get(whisper_language)
+        if name is not None and probability >= self.min_confidence:
+            language_resolutions.labels(source="whisper").inc()
+            self._observe(name, probability)
+        else:
+            language, confidence = await self.detector.detect_with_confidence(text)
+            language_resolutions.labels(source="fasttext").inc()
+            if language != "unknown":
+                self._observe(language, confidence)
+        return self.language or _DEFAULT_LANGUAGE
+
+    def _observe(self, language: str, weight: float):
+        for known in self._scores:
+            self._scores[known] *= 1 - self.smoothing
+        self._scores[language] = self._scores.get(language, 0.0) + self.smoothing * weight
+
+        if self.language is None:
+            self.language = language
+        elif language != self.language:
+            if self._scores[language] > self._scores.get(self.language, 0.0) + self.switch_margin:
+                logger.info(f"Call language switched: {self.language} → {language}")
+                self.language = language
+                self.pinned = False
+                self._streak = 0
+
+        self._streak = self._streak + 1 if language == self.language else 0
+        if not self.pinned and self._streak >= self.pin_after and language in _WHISPER_CODES:
+            logger.info(f"Call language pinned: {language}")
+            self.pinned = True
+            self._since_check = 0
@@ -2,14 +2,15 @@
 FastAPI Voice Gateway - Main Application
 """
 import asyncio
+import json
 import logging
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Callable, Optional
 
 import redis.asyncio as redis
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from prometheus_client import generate_latest
 
 try:
@@ -24,10 +25,14 @@ except ImportError:
     TELEMETRY_ENABLED = False
 
 from config import settings
+from admission import AdmissionController, AdmissionRejected
 from call_handler import CallHandler
-from websocket_stream import AudioStreamManager
+from websocket_stream import AudioStreamManager, MediaLeg
 from metrics import calls_total, active_calls, audio_packets_processed, errors_total
-from pipeline import VoicePipeline
+from pipeline import VoicePipeline, stage_backlog, unload_models
+from audio_codec import negotiate
+from tts_engine import SAMPLE_RATE as TTS_SAMPLE_RATE
+from executors import shutdown_executors
 
 # Module-level shared pipeline instance for model warmup — unused, removed
 
@@ -41,6 +46,11 @@ try:
 except ImportError:
     KafkaCallEventHandler = None
 
+try:
+    from call_archive import CallArchiver
+except ImportError:
+    CallArchiver = None
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
@@ -48,8 +58,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Suppress noisy internal loggers for optional services
-logging.getLogger("kafka").setLevel(logging.CRITICAL)
-logging.getLogger("kafka.conn").setLevel(logging.CRITICAL)
+logging.getLogger("aiokafka").setLevel(logging.CRITICAL)
 
 
 def _init_tracing():
@@ -73,10 +82,16 @@ class AppState:
     redis_client: Optional[redis.Redis] = None
     call_handler: Optional[CallHandler] = None
     stream_manager: Optional[AudioStreamManager] = None
+    admission: Optional[AdmissionController] = None
     esl_integration: Optional[object] = None
     kafka_handler: Optional[object] = None
     esl_task: Optional[asyncio.Task] = None
     kafka_task: Optional[asyncio.Task] = None
+    kafka_producer_task: Optional[asyncio.Task] = None
+    call_events_task: Optional[asyncio.Task] = None
+    call_stats_task: Optional[asyncio.Task] = None
+    archive_task: Optional[asyncio.Task] = None
+    admission_task: Optional[asyncio.Task] = None
 
 
 state = AppState()
@@ -97,7 +112,20 @@ async def lifespan(app: FastAPI):
 
     state.call_handler = CallHandler(state.redis_client)
     state.stream_manager = AudioStreamManager(state.call_handler)
-    logger.info("Call handler and stream manager initialised")
+    state.call_events_task = asyncio.create_task(state.call_handler.listen_for_events())
+    state.call_stats_task = asyncio.create_task(state.call_handler.stats.run())
+    state.admission = AdmissionController(state.redis_client, backlog=stage_backlog)
+    state.admission_task = asyncio.create_task(state.admission.run())
+    logger.info("Call handler, stream manager and admission control initialised")
+
+    if CallArchiver and settings.ARCHIVE_ENABLED:
+        try:
+            archiver = CallArchiver(state.redis_client, settle=state.call_handler.settle)
+            state.call_handler.add_termination_listener(archiver.submit)
+            state.archive_task = asyncio.create_task(archiver.run())
+            logger.info("Call archival to PostgreSQL started")
+        except Exception as e:
+            logger.warning(f"Call archival unavailable: {e}")
 
     # Pre-load AI models in background so first call isn't slow
     asyncio.create_task(_preload_models())
@@ -122,7 +150,11 @@ async def lifespan(app: FastAPI):
                 call_handler=state.call_handler,
             )
             state.kafka_task = asyncio.create_task(state.kafka_handler.consume_events())
-            logger.info("Kafka consumer started")
+            state.kafka_producer_task = asyncio.create_task(state.kafka_handler.producer.run())
+            state.call_handler.add_termination_listener(
+                lambda call_id: state.kafka_handler.publish_call_event("call.terminated", call_id)
+            )
+            logger.info("Kafka consumer and producer started")
         except Exception as e:
             logger.warning(f"Kafka unavailable: {e}")
 
@@ -130,15 +162,22 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("Shutting down Voice Gateway...")
-    for task in (state.esl_task, state.kafka_task):
+    for task in (
+        state.esl_task, state.kafka_task, state.kafka_producer_task,
+        state.call_events_task, state.call_stats_task, state.archive_task, state.admission_task,
+    ):
         if task:
             task.cancel()
             try:
                 await task
             except asyncio.CancelledError:
                 pass
+            except Exception as e:
+                logger.error(f"Background task failed before shutdown: {e!r}")
     if state.redis_client:
         await state.redis_client.close()
+    shutdown_executors()
+    unload_models()
     calls_total.labels(status="shutdown").inc()
     logger.info("Shutdown complete")
 
@@ -172,15 +211,15 @@ async def _preload_models():
     logger.info("Pre-loading AI models in background...")
     try:
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, _load_models_sync)
+        await loop.run_in_executor(None, _load_models_sync, state.redis_client)
         logger.info("All AI models loaded and ready")
     except Exception as e:
         logger.error(f"Model preload failed: {e}")
 
 
-def _load_models_sync():
+def _load_models_sync(redis_client=None):
     from pipeline import load_models
-    load_models()
+    load_models(redis_client)
 
 
 # ── Health ────────────────────────────────────────────────────────────────────
@@ -226,21 +265,90 @@ async def metrics():
 # ── WebSocket ─────────────────────────────────────────────────────────────────
 
 @app.websocket("/ws/audio/{call_id}")
-async def audio_stream_handler(websocket: WebSocket, call_id: str):
+async def audio_stream_handler(
+    websocket: WebSocket,
+    call_id: str,
+    codec: str = "pcm",
+    rate: Optional[int] = None,
+    output_rate: Optional[int] = None,
+):
+    """
+    Client audio stream. The format is negotiated per call from the query
+    string: codec (pcm, ulaw, alaw, opus), rate of the frames sent and
+    output_rate wanted for TTS playback. Defaults are pipeline-rate PCM in
+    and native TTS-rate PCM out; G.711 is always 8 kHz. Calls over the
+    admission limits are closed with 1013 (try again later).
+    """
     await websocket.accept()
-    logger.info(f"WebSocket connected: {call_id}")
-    active_calls.inc()
+    try:
+        transcoder = negotiate(codec, rate, output_rate, tts_sample_rate=TTS_SAMPLE_RATE)
+    except ValueError as e:
+        logger.warning(f"WebSocket {call_id} rejected: {e}")
+        await websocket.close(code=1003, reason=str(e))
+        return
+    if not await _admit(websocket, call_id):
+        return
+    logger.info(
+        f"WebSocket connected: {call_id} ({transcoder.codec} {transcoder.sample_rate} Hz in, "
+        f"{transcoder.output_rate} Hz out)"
+    )
 
     # Ensure call record exists
-    existing = await state.call_handler.get_call(call_id)
-    if not existing:
-        await state.call_handler.create_call(
-            caller_id="websocket",
-            destination="it-team",
-            call_id=call_id,
-        )
+    try:
+        existing = await state.call_handler.get_call(call_id)
+        if not existing:
+            await state.call_handler.create_call(
+                caller_id="websocket",
+                destination="it-team",
+                call_id=call_id,
+            )
+    except Exception:
+        await state.admission.release(call_id)
+        raise
 
-    await state.stream_manager.register_connection(call_id, websocket)
+    if transcoder.passthrough:
+        await _stream_call(websocket, call_id, websocket)
+    else:
+        leg = MediaLeg(websocket, transcoder)
+        await _stream_call(websocket, call_id, leg, decode=leg.decode)
+
+
+@app.websocket("/ws/freeswitch/{call_id}")
+async def freeswitch_media_handler(websocket: WebSocket, call_id: str):
+    """
+    Media stream opened by FreeSWITCH itself (uuid_audio_stream, started by
+    ESLIntegration on CHANNEL_ANSWER). The call record already exists from
+    CHANNEL_CREATE, so frames flow without any setup round trip; TTS audio
+    goes back on the same leg.
+    """
+    await websocket.accept()
+    if not await _admit(websocket, call_id):
+        if state.esl_integration:
+            # The caller would otherwise sit in silence on a parked channel
+            await state.esl_integration.hangup_channel(call_id)
+        return
+    logger.info(f"FreeSWITCH media stream connected: {call_id}")
+    leg = MediaLeg.freeswitch(websocket, tts_sample_rate=TTS_SAMPLE_RATE)
+    await _stream_call(websocket, call_id, leg, decode=leg.decode)
+
+
+async def _admit(websocket: WebSocket, call_id: str) -> bool:
+    """Take an admission slot for the call, or close the socket with 1013 (try again later)."""
+    try:
+        await state.admission.admit(call_id)
+        return True
+    except AdmissionRejected as e:
+        logger.warning(f"Call {call_id} rejected by admission control ({e.reason})")
+        calls_total.labels(status="rejected").inc()
+        message = "call already connected" if e.reason == "duplicate" else "overloaded"
+        await websocket.close(code=1013, reason=f"{message}, retry after {e.retry_after}s")
+        return False
+
+
+async def _stream_call(websocket: WebSocket, call_id: str, connection, decode: Callable = None):
+    """Run the pipeline for a call and feed it binary audio frames until the socket closes."""
+    active_calls.inc()
+    await state.stream_manager.register_connection(call_id, connection)
 
     # Start the AI processing pipeline for this call
     pipeline = VoicePipeline(call_id, state.stream_manager, state.call_handler)
@@ -248,22 +356,35 @@ async def audio_stream_handler(websocket: WebSocket, call_id: str):
 
     try:
         while True:
-            audio_data = await websocket.receive_bytes()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            audio_data = message.get("bytes")
+            if audio_data is None:
+                continue  # text frames carry stream metadata only
             audio_packets_processed.inc()
-            await state.stream_manager.process_audio(call_id, audio_data)
+            state.call_handler.record_stat(call_id, "audio_packets")
+            state.call_handler.record_stat(call_id, "audio_bytes", len(audio_data))
+            await state.stream_manager.process_audio(call_id, decode(audio_data) if decode else audio_data)
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected: {call_id}")
     except Exception as e:
         logger.error(f"WebSocket error for {call_id}: {e}")
         errors_total.labels(type=type(e).__name__).inc()
     finally:
-        pipeline_task.cancel()
+        # Closing the ring lets the pipeline flush the last utterance and drain its stages
+        await state.stream_manager.unregister_connection(call_id)
         try:
-            await pipeline_task
+            await asyncio.wait_for(pipeline_task, settings.PIPELINE_DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"Pipeline for {call_id} did not drain in time, cancelled")
         except asyncio.CancelledError:
-            pass
-        await state.stream_manager.unregister_connection(call_id)
+            pass  # wait_for has cancelled the pipeline as well
+        except Exception as e:
+            logger.error(f"Pipeline error for {call_id}: {e}")
+        state.stream_manager.discard_buffer(call_id)
         await state.call_handler.terminate_call(call_id)
+        await state.admission.release(call_id)
         active_calls.dec()
 
 
@@ -303,11 +424,14 @@ async def terminate_call(call_id: str):
 
 
 @app.get("/calls")
-async def list_active_calls():
+async def list_active_calls(status: str = "active", cursor: Optional[str] = None, limit: int = 50):
+    if status not in ("active", "terminated"):
+        raise HTTPException(status_code=400, detail="status must be 'active' or 'terminated'")
     try:
-        call_keys = await state.redis_client.keys("call:*")
-        calls = [await state.redis_client.hgetall(k) for k in call_keys]
-        return {"total": len(calls), "calls": calls}
+        calls, next_cursor, total = await state.call_handler.list_calls(status, cursor, limit)
+        return {"total": total, "calls": calls, "next_cursor": next_cursor}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -315,11 +439,9 @@ async def list_active_calls():
 @app.get("/stats")
 async def get_statistics():
     try:
-        call_keys = await state.redis_client.keys("call:*")
-        return {
-            "active_calls": len(call_keys),
-            "uptime_seconds": int(asyncio.get_running_loop().time()),
-        }
+        stats = await state.call_handler.get_stats()
+        stats["uptime_seconds"] = int(asyncio.get_running_loop().time())
+        return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -328,6 +450,15 @@ async def get_statistics():
 
 @app.post("/api/call/initiate")
 async def initiate_call(caller_number: str, destination: str):
+    try:
+        state.admission.check()
+    except AdmissionRejected as e:
+        calls_total.labels(status="rejected").inc()
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(e), "reason": e.reason},
+            headers={"Retry-After": str(e.retry_after)},
+        )
     call_id = await state.call_handler.create_call(caller_number, destination)
     calls_total.labels(status="initiated").inc()
     return {"call_id": call_id, "status": "initiated"}
@@ -335,11 +466,31 @@ async def initiate_call(caller_number: str, destination: str):
 
 @app.post("/api/call/{call_id}/hangup")
 async def hangup_call(call_id: str):
+    if state.esl_integration:
+        await state.esl_integration.hangup_channel(call_id)
     await state.call_handler.hangup_call(call_id)
     calls_total.labels(status="hangup").inc()
     return {"call_id": call_id, "status": "terminated"}
 
 
+@app.post("/api/calls/drain")
+async def drain_calls():
+    """Hang up every active call, e.g. before taking this node out of service."""
+    call_ids, cursor = [], None
+    while True:
+        calls, cursor, _ = await state.call_handler.list_calls("active", cursor=cursor, limit=500)
+        call_ids.extend(call["call_id"] for call in calls)
+        if not cursor:
+            break
+    hung_up = 0
+    if state.esl_integration:
+        # Runs on the command pool; event intake carries on meanwhile
+        hung_up = await state.esl_integration.hangup_channels(call_ids)
+    await asyncio.gather(*(state.call_handler.hangup_call(call_id) for call_id in call_ids))
+    calls_total.labels(status="hangup").inc(len(call_ids))
+    return {"drained": len(call_ids), "channels_hung_up": hung_up}
+
+
 @app.get("/api/call/{call_id}/status")
 async def get_call_status(call_id: str):
     status = await state.call_handler.get_call_status(call_id)
@@ -349,11 +500,31 @@ async def get_call_status(call_id: str):
 
 
 @app.get("/api/call/{call_id}/transcript")
-async def get_call_transcript(call_id: str):
-    transcript = await state.call_handler.get_call_transcript(call_id)
-    if not transcript:
+async def get_call_transcript(
+    call_id: str,
+    cursor: Optional[str] = None,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    limit: int = 100,
+    follow: bool = False,
+):
+    """
+    Transcript entries oldest first, paginated by cursor (last entry id seen)
+    or bounded by append time. follow=true streams new entries as NDJSON
+    until the call ends.
+    """
+    if follow:
+        async def tail():
+            async for entry in state.call_handler.tail_transcript(call_id, after=cursor):
+                yield json.dumps(entry) + "\n"
+        return StreamingResponse(tail(), media_type="application/x-ndjson")
+
+    transcript, next_cursor = await state.call_handler.get_call_transcript(
+        call_id, cursor=cursor, start_ms=start_ms, end_ms=end_ms, limit=limit
+    )
+    if not transcript and not cursor and start_ms is None and end_ms is None:
         raise HTTPException(status_code=404, detail="Transcript not found")
-    return {"call_id": call_id, "transcript": transcript}
+    return {"call_id": call_id, "transcript": transcript, "next_cursor": next_cursor}
 
 
 # ── Error handlers ────────────────────────────────────────────────────────────
@@ -7,8 +7,113 @@ from prometheus_client import Counter, Histogram, Gauge
 calls_total = Counter('voice_calls_total', 'Total calls processed', ['status'])
 call_duration = Histogram('voice_call_duration_seconds', 'Call duration in seconds')
 active_calls = Gauge('voice_active_calls', 'Number of active calls')
+call_state_cache_requests = Counter(
+    'call_state_cache_requests_total', 'Call state reads served locally or from Redis', ['result']
+)
+call_stats_flush_size = Histogram(
+    'call_stats_flush_calls', 'Calls whose buffered counters were written in one stats flush',
+    buckets=(1, 5, 10, 50, 100, 500, 1000),
+)
 audio_packets_processed = Counter('audio_packets_total', 'Audio packets processed')
 translation_latency = Histogram('translation_latency_seconds', 'Translation latency in seconds')
+translation_batch_size = Histogram(
+    'translation_batch_size', 'Requests padded into one NLLB generate call',
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+translation_queue_wait = Histogram(
+    'translation_queue_wait_seconds', 'Time a request waits in the translation coalescer',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+translation_cache_requests = Counter(
+    'translation_cache_requests_total', 'Translation cache lookups', ['tier', 'result']
+)
+translation_cache_evictions = Counter('translation_cache_evictions_total', 'Local translation cache LRU evictions')
+translation_cache_bytes = Gauge('translation_cache_bytes', 'Bytes held by the local translation cache')
 stt_latency = Histogram('stt_latency_seconds', 'STT latency in seconds')
+stt_commit_lag = Histogram(
+    'stt_commit_lag_seconds', 'Time from a word first appearing in a partial to its commit',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8),
+)
+stt_batch_size = Histogram(
+    'stt_batch_size', 'Segments decoded per batched Whisper call',
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+stt_queue_wait = Histogram(
+    'stt_queue_wait_seconds', 'Time a segment waits in the STT batch scheduler',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
 tts_latency = Histogram('tts_latency_seconds', 'TTS latency in seconds')
+tts_time_to_first_audio = Histogram(
+    'tts_time_to_first_audio_seconds', 'Time from TTS start until the first PCM chunk is sent',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8),
+)
+tts_cache_requests = Counter('tts_cache_requests_total', 'TTS audio cache lookups', ['result'])
+tts_cache_bytes_served = Counter('tts_cache_bytes_served_total', 'PCM bytes served from the TTS audio cache')
+tts_cache_bytes = Gauge('tts_cache_bytes', 'Bytes held on disk by the TTS audio cache')
+vad_segment_duration = Histogram(
+    'vad_segment_duration_seconds', 'Duration of speech segments released by the endpointer',
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16),
+)
+language_resolutions = Counter(
+    'language_resolutions_total', 'Segments whose language came from Whisper, fastText or a pinned call', ['source']
+)
+archive_calls = Counter(
+    'call_archive_calls_total', 'Terminated calls by archival outcome', ['result']
+)
+archive_flush_seconds = Histogram(
+    'call_archive_flush_seconds', 'Time to COPY one batch of calls into PostgreSQL',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+archive_pending = Gauge('call_archive_pending', 'Terminated calls waiting to be batched for archival')
+kafka_send_latency = Histogram(
+    'kafka_send_latency_seconds', 'Time from publishing a call event until the broker acknowledged it',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+kafka_producer_batch_size = Histogram(
+    'kafka_producer_batch_size', 'Call events handed to the Kafka producer per drain of the buffer',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+kafka_producer_buffered = Gauge('kafka_producer_buffered', 'Call events buffered for the Kafka producer')
+kafka_producer_errors = Counter(
+    'kafka_producer_errors_total', 'Call events dropped or not delivered to Kafka', ['reason']
+)
+kafka_consumer_events = Counter(
+    'kafka_consumer_events_total', 'Consumed call events by processing outcome', ['result']
+)
+kafka_consumer_lag = Gauge(
+    'kafka_consumer_lag', 'Records behind the partition high watermark', ['topic', 'partition']
+)
+esl_events = Counter('esl_events_total', 'FreeSWITCH events received over ESL', ['event'])
+esl_commands = Counter('esl_commands_total', 'FreeSWITCH bgapi commands by outcome', ['command', 'result'])
+esl_command_seconds = Histogram(
+    'esl_command_seconds', 'Time from sending a bgapi command until its job result arrived', ['command'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+audio_buffer_dropped_bytes = Counter(
+    'audio_buffer_dropped_bytes_total', 'Inbound call audio discarded by a full per-call ring buffer', ['policy']
+)
+audio_buffer_backpressure_seconds = Histogram(
+    'audio_buffer_backpressure_seconds', 'Time a socket reader waited for room in the call ring buffer',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+admission_decisions = Counter(
+    'admission_decisions_total', 'New calls admitted or rejected, by the limit that rejected them', ['result']
+)
+admission_saturation = Gauge(
+    'admission_saturation', 'Load against the tightest admission limit on this replica (1 = shedding calls)'
+)
+admission_cluster_calls = Gauge('admission_cluster_calls', 'Calls holding a cluster-wide admission lease')
 errors_total = Counter('voice_errors_total', 'Total errors', ['type'])
+executor_active = Gauge('engine_executor_active', 'Jobs running in an engine executor', ['engine'])
+executor_queued = Gauge('engine_executor_queued', 'Jobs waiting for an engine executor slot', ['engine'])
+executor_wait = Histogram(
+    'engine_executor_wait_seconds', 'Time a job waits for an engine executor slot', ['engine'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+pipeline_stage_queue_depth = Gauge(
+    'pipeline_stage_queue_depth', 'Items waiting for a per-call pipeline stage (summed over calls)', ['stage']
+)
+pipeline_stage_wait = Histogram(
+    'pipeline_stage_wait_seconds', 'Time an item waits before a pipeline stage picks it up', ['stage'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
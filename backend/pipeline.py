@@ -1,17 +1,31 @@
 """
 Audio Processing Pipeline
-Reads raw PCM audio from the WebSocket queue and runs it through:
-  STT → Language Detection → Translation → TTS → response bytes
+Reads raw PCM audio from the WebSocket queue, endpoints it into utterances
+with a streaming VAD, and runs each utterance through:
+  STT → Language Detection → Translation → TTS → response bytes (streamed per sentence)
+The stages run concurrently per call, connected by bounded queues.
 
 Models are loaded once into module-level singletons and reused across all calls.
 """
 import asyncio
+import inspect
 import logging
 import time
+from collections import deque
+from contextlib import aclosing
+from typing import Optional
+
 import numpy as np
 
+from audio_buffer import BufferClosed, PCMScratch
 from config import settings
-from metrics import stt_latency, translation_latency, tts_latency
+from metrics import (
+    stt_latency, translation_latency, tts_latency, tts_time_to_first_audio, vad_segment_duration,
+    pipeline_stage_queue_depth, pipeline_stage_wait,
+)
+from vad import UtteranceEndpointer
+from streaming_stt import StreamingTranscriber
+from language_resolver import CallLanguage
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +38,19 @@ _tts = None
 _models_loaded = False
 
 
-def load_models():
+def load_models(redis_client=None):
     """
     Load all AI models into module-level singletons.
     Called once at startup from main.py _preload_models().
     Thread-safe for read after initial load.
+    redis_client backs the shared translation cache tier (optional).
     """
     global _stt, _detector, _translator, _tts, _models_loaded
 
+    if settings.INFERENCE_MODE == "workers":
+        _load_remote_models()
+        return
+
     logger.info("Loading STT model...")
     from stt_engine import WhisperSTT
     _stt = WhisperSTT()
@@ -42,7 +61,7 @@ def load_models():
 
     logger.info("Loading translation model...")
     from translator import TranslationEngine
-    _translator = TranslationEngine()
+    _translator = TranslationEngine(redis_client=redis_client)
 
     logger.info("Loading TTS model...")
     from tts_engine import CoquiTTS
@@ -51,6 +70,35 @@ def load_models():
     _models_loaded = True
     logger.info("All models loaded and ready")
 
+    # Calls can start now; canned prompts warm the TTS cache in the meantime
+    _tts.presynthesize(settings.tts_presynth_prompts, settings.TARGET_LANGUAGE)
+
+
+def _load_remote_models():
+    """Spawn STT/translation/TTS worker processes and bind proxies to them."""
+    global _stt, _detector, _translator, _tts, _models_loaded
+    from inference_workers import start_workers, RemoteSTT, RemoteTranslator, RemoteTTS
+
+    logger.info("Loading language detector...")
+    from language_detector import LanguageDetector
+    _detector = LanguageDetector()
+
+    logger.info("Starting inference worker processes...")
+    clients = start_workers()
+    _stt = RemoteSTT(clients["stt"])
+    _translator = RemoteTranslator(clients["translation"])
+    _tts = RemoteTTS(clients["tts"])
+
+    _models_loaded = True
+    logger.info("All inference workers ready")
+
+
+def unload_models():
+    """Stop inference worker processes, if any. Called at shutdown."""
+    if settings.INFERENCE_MODE == "workers":
+        from inference_workers import stop_workers
+        stop_workers()
+
 
 def models_ready() -> bool:
     return _models_loaded
@@ -58,106 +106,376 @@ def models_ready() -> bool:
 
 # ── Pipeline ──────────────────────────────────────────────────────────────────
 
+# A stage that waits this long for input is logged, so a stuck call is visible
+_SLOW_STAGE_WAIT_SECONDS = 2.0
+# Items waiting in every call's stage queues; admission control sheds load on it
+_stage_backlog = 0
+
+
+def stage_backlog() -> int:
+    return _stage_backlog
+
+
+class StageQueue:
+    """Bounded FIFO between two pipeline stages; reports depth and wait time per stage."""
+
+    def __init__(self, call_id: str, stage: str, maxsize: int):
+        self.call_id = call_id
+        self.stage = stage
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def put(self, item):
+        global _stage_backlog
+        await self._queue.put((time.perf_counter(), item))
+        _stage_backlog += 1
+        pipeline_stage_queue_depth.labels(stage=self.stage).inc()
+
+    async def get(self):
+        global _stage_backlog
+        queued_at, item = await self._queue.get()
+        _stage_backlog -= 1
+        pipeline_stage_queue_depth.labels(stage=self.stage).dec()
+        waited = time.perf_counter() - queued_at
+        pipeline_stage_wait.labels(stage=self.stage).observe(waited)
+        if waited > _SLOW_STAGE_WAIT_SECONDS:
+            logger.warning(
+                f"[{self.call_id}] {self.stage} stage backlog: item waited {waited:.1f}s "
+                f"({self._queue.qsize()} still queued)"
+            )
+        return item
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def clear(self):
+        """Drop anything left behind at shutdown, keeping the depth gauge honest."""
+        global _stage_backlog
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            _stage_backlog -= 1
+            pipeline_stage_queue_depth.labels(stage=self.stage).dec()
+
+
 class VoicePipeline:
     """
     Processes audio for a single call using shared model singletons.
     One instance per active WebSocket call.
+
+    Ingest → STT → translate → TTS run as concurrent stages linked by bounded
+    StageQueues, so segment N+1 can transcribe while segment N is translating
+    or synthesizing. Each stage handles its items in FIFO order, which keeps
+    output audio in speaking order.
+
+    With STT_STREAMING, the in-progress utterance is also re-decoded at an
+    interval; partial hypotheses go to the client as JSON text frames and
+    committed sentences enter the STT stage queue ahead of the final decode.
+    Otherwise, long utterances are decoded segment by segment and each
+    Whisper segment is forwarded to translation as soon as it is finished.
+
+    The source language comes from Whisper's own language ID, smoothed per
+    call by CallLanguage; once stable it is pinned for later decodes.
+
+    Each utterance's record (source text, language, translation and stage
+    timings) travels with it through the stages and is appended to the
+    call's transcript stream once it has been spoken.
     """
 
     def __init__(self, call_id: str, stream_manager, call_handler):
         self.call_id = call_id
         self.stream_manager = stream_manager
         self.call_handler = call_handler
+        size = settings.PIPELINE_STAGE_QUEUE_SIZE
+        self.stt_queue = StageQueue(call_id, "stt", size)
+        self.translate_queue = StageQueue(call_id, "translate", size)
+        self.tts_queue = StageQueue(call_id, "tts", size)
+        self.transcriber = StreamingTranscriber(_stt) if settings.STT_STREAMING else None
+        self.language = CallLanguage(_detector)
+        self._reported_language: Optional[str] = None
+        self._partial_task: Optional[asyncio.Task] = None
+        self._last_partial_at = 0.0
+        # (forwarded words, prompt) of each utterance the endpointer kept, awaiting the STT stage
+        self._closed_utterances: deque = deque()
+        # Float conversions reuse these; partial decodes overlap final ones, so each has its own
+        self._final_scratch = PCMScratch()
+        self._partial_scratch = PCMScratch()
+        # Set by CallHandler when any replica terminates the call
+        self.terminated = call_handler.termination_event(call_id)
+
+    def stage_depths(self) -> dict:
+        return {
+            "stt": self.stt_queue.qsize(),
+            "translate": self.translate_queue.qsize(),
+            "tts": self.tts_queue.qsize(),
+        }
 
     async def run(self):
-        """Main loop — accumulates audio chunks and processes them."""
+        """Start the stage tasks and feed them until the call ends."""
         if not _models_loaded:
             logger.error(f"[{self.call_id}] Models not loaded, pipeline cannot start")
             return
 
         logger.info(f"[{self.call_id}] Pipeline started")
 
-        # Accumulate chunks until we have at least 2 seconds of audio before transcribing
-        # 2s @ 16kHz 16-bit mono = 64000 bytes
-        MIN_AUDIO_BYTES = 64000
-        audio_buffer = b""
+        stages = [
+            asyncio.create_task(self._stage(self.stt_queue, self.translate_queue, self._transcribe)),
+            asyncio.create_task(self._stage(self.translate_queue, self.tts_queue, self._translate)),
+            asyncio.create_task(self._stage(self.tts_queue, None, self._speak)),
+        ]
+        ingest = asyncio.create_task(self._ingest())
+        ended = asyncio.create_task(self.terminated.wait())
+        try:
+            await asyncio.wait({ingest, ended}, return_when=asyncio.FIRST_COMPLETED)
+            if ingest.done():
+                await ingest  # returns once the audio stream closed, raises on error
+            logger.info(f"[{self.call_id}] Call ended, stopping pipeline")
+            ingest.cancel()
+            await asyncio.gather(ingest, return_exceptions=True)
+            # End of stream: the sentinel drains through every stage in order
+            await self.stt_queue.put(None)
+            await asyncio.gather(*stages)
+        finally:
+            ingest.cancel()
+            ended.cancel()
+            if self._partial_task:
+                self._partial_task.cancel()
+            for task in stages:
+                task.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            for queue in (self.stt_queue, self.translate_queue, self.tts_queue):
+                queue.clear()
+            self.call_handler.release(self.call_id)
+
+        logger.info(f"[{self.call_id}] Pipeline stopped")
+
+    async def _ingest(self):
+        """Endpoint incoming audio into utterances and hand them to the STT stage."""
+        # Segments are released by the VAD endpointer as soon as the speaker pauses
+        # (or the max-speech cap is hit) instead of on a fixed byte count.
+        endpointer = UtteranceEndpointer(sample_rate=settings.AUDIO_SAMPLE_RATE, on_close=self._utterance_closed)
 
         while True:
-            audio_bytes = await self.stream_manager.get_audio_chunk(self.call_id, timeout=1.0)
+            # A view into the call's ring buffer; feed() copies it before the next await
+            try:
+                audio_bytes = await self.stream_manager.get_audio_chunk(self.call_id, timeout=1.0)
+            except BufferClosed:
+                # Caller hung up: release the utterance in progress and stop
+                segment = endpointer.flush()
+                if segment:
+                    await self._enqueue_segment(segment)
+                return
 
             if audio_bytes is None:
-                # Timeout — process whatever is buffered if we have enough
-                if len(audio_buffer) >= MIN_AUDIO_BYTES // 2:
-                    try:
-                        await self._process_chunk(audio_buffer)
-                    except Exception as e:
-                        logger.error(f"[{self.call_id}] Pipeline error: {e}", exc_info=True)
-                    audio_buffer = b""
-
-                call = await self.call_handler.get_call(self.call_id)
-                if not call or call.get("status") == "terminated":
-                    logger.info(f"[{self.call_id}] Call ended, stopping pipeline")
-                    break
+                # Stream gap — treat as end of utterance
+                segment = endpointer.flush()
+                if segment:
+                    await self._enqueue_segment(segment)
                 continue
 
-            audio_buffer += audio_bytes
-
-            # Process once we have 2 seconds of audio
-            if len(audio_buffer) >= MIN_AUDIO_BYTES:
-                try:
-                    await self._process_chunk(audio_buffer)
-                except Exception as e:
-                    logger.error(f"[{self.call_id}] Pipeline error: {e}", exc_info=True)
-                audio_buffer = b""
-
-        logger.info(f"[{self.call_id}] Pipeline stopped")
-
-    async def _process_chunk(self, audio_bytes: bytes):
-        """Run one audio chunk through STT → detect → translate → TTS."""
-        # Convert raw PCM int16 → float32 normalised array
-        audio_array = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+            for segment in endpointer.feed(audio_bytes):
+                await self._enqueue_segment(segment)
+
+            if self.transcriber and endpointer.in_speech:
+                self._maybe_decode_partial(endpointer)
+
+    def _utterance_closed(self, kept: bool):
+        """
+        Endpointer callback: the open utterance ended, so partial state must not
+        carry over into the next one — also when it was a discarded blip.
+        """
+        if self.transcriber:
+            state = self.transcriber.end_utterance()
+            if kept:
+                self._closed_utterances.append(state)
+
+    async def _enqueue_segment(self, segment: bytes):
+        vad_segment_duration.observe(len(segment) / (2 * settings.AUDIO_SAMPLE_RATE))
+        if self.transcriber:
+            forwarded, prompt = self._closed_utterances.popleft()
+            await self.stt_queue.put((segment, forwarded, prompt))
+        else:
+            await self.stt_queue.put((segment,))
 
-        # 1. STT
-        t0 = time.perf_counter()
-        text = await _stt.transcribe_streaming(audio_array)
-        stt_latency.observe(time.perf_counter() - t0)
+    def _maybe_decode_partial(self, endpointer: UtteranceEndpointer):
+        """Start a partial re-decode of the open utterance, at most one in flight."""
+        if self._partial_task and not self._partial_task.done():
+            return
+        now = time.perf_counter()
+        if (now - self._last_partial_at) * 1000 < settings.STT_PARTIAL_INTERVAL_MS:
+            return
+        audio = endpointer.current_audio()
+        if len(audio) < settings.STT_PARTIAL_INTERVAL_MS * settings.AUDIO_SAMPLE_RATE * 2 // 1000:
+            return
+        self._last_partial_at = now
+        self._partial_task = asyncio.create_task(self._decode_partial(self.transcriber.utterance, audio))
+
+    async def _decode_partial(self, utterance: int, audio_bytes: bytes):
+        try:
+            audio_array = self._partial_scratch.floats(audio_bytes)
+            result = await self.transcriber.update(
+                utterance, audio_array, language=self.language.stt_language(final=False)
+            )
+            if result is None:
+                return
+            partial, committed = result
+            # Committed sentences go downstream in order with the final decodes
+            fragment = self.transcriber.take_forwardable()
+            if fragment:
+                await self.stt_queue.put((None, 0, None, fragment))
+            ws = self.stream_manager.connections.get(self.call_id)
+            if ws:
+                await ws.send_json({"type": "partial", "text": partial, "committed": committed})
+        except Exception as e:
+            logger.error(f"[{self.call_id}] Partial transcription error: {e}")
+
+    async def _stage(self, inbox: StageQueue, outbox, handler):
+        """
+        Generic stage loop: handle each item (an args tuple) in order and forward any result.
+        A handler may return an async generator to forward several results per item.
+        """
+        while True:
+            item = await inbox.get()
+            if item is None:
+                if outbox is not None:
+                    await outbox.put(None)
+                return
+            try:
+                result = await handler(*item)
+                if inspect.isasyncgen(result):
+                    async for part in result:
+                        if part is not None and outbox is not None:
+                            await outbox.put(part)
+                    continue
+            except Exception as e:
+                logger.error(f"[{self.call_id}] Pipeline error in {inbox.stage} stage: {e}", exc_info=True)
+                continue
+            if result is not None and outbox is not None:
+                await outbox.put(result)
+
+    async def _transcribe(self, audio_bytes: Optional[bytes], forwarded: int = 0,
+                          prompt: Optional[str] = None, committed: Optional[str] = None):
+        """
+        STT + language detection. Returns (text, source_lang, timings) or None.
+        In streaming mode, committed text arrives without audio, and the final
+        decode of an utterance skips the words already forwarded. Long
+        utterances outside streaming mode return a generator of per-segment results.
+        """
+        whisper_lang = probability = None
+        timings = {}
+        if audio_bytes is None:
+            text = committed
+        else:
+            # Convert raw PCM int16 → float32 normalised array
+            audio_array = self._final_scratch.floats(audio_bytes)
+
+            if not self.transcriber and len(audio_array) >= settings.STT_SEGMENT_STREAM_SECONDS * settings.AUDIO_SAMPLE_RATE:
+                return self._transcribe_segments(audio_array, prompt)
+
+            language = self.language.stt_language()
+            t0 = time.perf_counter()
+            if self.transcriber:
+                text, whisper_lang, probability = await self.transcriber.finalize(
+                    audio_array, forwarded, prompt, language=language
+                )
+            else:
+                text, whisper_lang, probability = await _stt.transcribe_with_language(audio_array, language=language)
+            elapsed = time.perf_counter() - t0
+            stt_latency.observe(elapsed)
+            self.call_handler.record_stat(self.call_id, "stt_seconds", elapsed)
+            timings["stt_ms"] = round(elapsed * 1000, 1)
 
         if not text:
             logger.debug(f"[{self.call_id}] STT: no speech detected in chunk")
-            return
+            return None
 
         logger.info(f"[{self.call_id}] STT: {text!r}")
-
-        # 2. Language detection
-        source_lang = await _detector.detect(text)
-        logger.info(f"[{self.call_id}] Detected language: {source_lang}")
-        await self.call_handler.update_language(self.call_id, source_lang)
-
-        # 3. Translation
+        self.call_handler.record_stat(self.call_id, "transcription_count")
+
+        if audio_bytes is None and self.language.language:
+            # Committed partial text: the utterance's language is already known
+            return text, self.language.language, timings
+        source_lang = await self._resolve_language(text, whisper_lang, probability)
+        return text, source_lang, timings
+
+    async def _transcribe_segments(self, audio_array: np.ndarray, prompt: Optional[str] = None):
+        """Yield (text, source_lang, timings) for each Whisper segment of a long utterance as it decodes."""
+        language = self.language.stt_language()
+        t0 = segment_start = time.perf_counter()
+        source_lang = None
+        segments = _stt.transcribe_segments(audio_array, language=language, prompt=prompt)
+        async for text, whisper_lang, probability in segments:
+            logger.info(f"[{self.call_id}] STT segment: {text!r}")
+            self.call_handler.record_stat(self.call_id, "transcription_count")
+            if source_lang is None:
+                # One utterance is one speaker turn — resolve on its first segment only
+                source_lang = await self._resolve_language(text, whisper_lang, probability)
+            now = time.perf_counter()
+            yield text, source_lang, {"stt_ms": round((now - segment_start) * 1000, 1)}
+            segment_start = now
+        elapsed = time.perf_counter() - t0
+        stt_latency.observe(elapsed)
+        self.call_handler.record_stat(self.call_id, "stt_seconds", elapsed)
+
+    async def _resolve_language(self, text: str, whisper_lang: str = None, probability: float = None) -> str:
+        """Update the call's language estimate; Redis is only written when it changes."""
+        source_lang = await self.language.resolve(text, whisper_lang, probability)
+        if source_lang != self._reported_language:
+            logger.info(f"[{self.call_id}] Detected language: {source_lang}")
+            await self.call_handler.update_language(self.call_id, source_lang)
+            self._reported_language = source_lang
+        return source_lang
+
+    async def _translate(self, text: str, source_lang: str, timings: Optional[dict] = None):
+        """
+        Translation into the call's target language.
+        Returns (translated, target_lang, record) or None; record is the utterance's transcript entry.
+        """
         call = await self.call_handler.get_call(self.call_id)
         target_lang = (call.get("target_language") if call else None) or settings.TARGET_LANGUAGE
 
         t0 = time.perf_counter()
         translated = await _translator.translate(text, source_lang, target_lang)
-        translation_latency.observe(time.perf_counter() - t0)
-
+        elapsed = time.perf_counter() - t0
+        translation_latency.observe(elapsed)
+        self.call_handler.record_stat(self.call_id, "translation_seconds", elapsed)
+
+        record = {
+            "source_text": text,
+            "source_language": source_lang,
+            "translation": translated or "",
+            "target_language": target_lang,
+            "timings": dict(timings or {}, translation_ms=round(elapsed * 1000, 1)),
+        }
         if not translated:
-            return
+            self.call_handler.append_transcript(self.call_id, record)
+            return None
+        self.call_handler.record_stat(self.call_id, "translation_count")
 
         logger.info(f"[{self.call_id}] Translated: {translated!r}")
+        return translated, target_lang, record
 
-        # 4. TTS
+    async def _speak(self, translated: str, target_lang: str, record: Optional[dict] = None):
+        """TTS — stream each sentence back over the WebSocket as soon as it is ready."""
         t0 = time.perf_counter()
-        output_audio = await _tts.synthesize(translated, target_lang)
-        tts_latency.observe(time.perf_counter() - t0)
-
-        if not output_audio:
-            return
-
-        # 5. Send synthesised audio back over WebSocket
-        ws = self.stream_manager.connections.get(self.call_id)
-        if ws:
-            await ws.send_bytes(output_audio)
-            logger.info(f"[{self.call_id}] Sent {len(output_audio)} bytes of TTS audio")
-        else:
-            logger.warning(f"[{self.call_id}] WebSocket gone before TTS response could be sent")
+        sent_bytes = 0
+        # Closed on break or cancellation, so the prefetched sentence is cancelled right away
+        async with aclosing(_tts.synthesize_stream(translated, target_lang)) as stream:
+            async for pcm in stream:
+                ws = self.stream_manager.connections.get(self.call_id)
+                if not ws:
+                    logger.warning(f"[{self.call_id}] WebSocket gone before TTS response could be sent")
+                    break
+                if not sent_bytes:
+                    tts_time_to_first_audio.observe(time.perf_counter() - t0)
+                await ws.send_bytes(pcm)
+                sent_bytes += len(pcm)
+        elapsed = time.perf_counter() - t0
+        tts_latency.observe(elapsed)
+        self.call_handler.record_stat(self.call_id, "tts_seconds", elapsed)
+        self.call_handler.record_stat(self.call_id, "tts_bytes_sent", sent_bytes)
+        if record is not None:
+            record["timings"]["tts_ms"] = round(elapsed * 1000, 1)
+            self.call_handler.append_transcript(self.call_id, record)
+
+        if sent_bytes:
+            logger.info(f"[{self.call_id}] Sent {sent_bytes} bytes of TTS audio")
+        return None
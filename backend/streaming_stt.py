@@ -0,0 +1,118 @@
+"""
+Incremental (partial) transcription for one call.
+While the speaker is talking, the in-progress utterance is re-decoded every
+STT_PARTIAL_INTERVAL_MS. Words on which two consecutive hypotheses agree are
+committed (local agreement); committed text is carried forward as Whisper's
+prompt and is the only text that ever reaches translation.
+"""
+import logging
+import re
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from metrics import stt_commit_lag
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"[.!?।॥]$")
+
+
+def _common_prefix(a: List[str], b: List[str]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class StreamingTranscriber:
+    """
+    Tracks partial hypotheses for the current utterance of one call.
+    The utterance counter lets late partial results for an utterance that
+    has already ended be discarded.
+    """
+
+    def __init__(self, stt, prompt_max_chars: int = None):
+        self.stt = stt
+        self.prompt_max_chars = prompt_max_chars or settings.STT_PROMPT_MAX_CHARS
+        self.utterance = 0
+        self._context = ""
+        self._reset()
+
+    def _reset(self):
+        self._hypothesis: List[str] = []
+        self._first_seen: List[float] = []
+        self._committed = 0
+        self._forwarded = 0
+
+    @property
+    def prompt(self) -> Optional[str]:
+        return self._context or None
+
+    @property
+    def committed_text(self) -> str:
+        return " ".join(self._hypothesis[:self._committed])
+
+    async def update(
+        self, utterance: int, audio_array: np.ndarray, language: str = None
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Re-decode the in-progress utterance (language pins Whisper's decode language).
+        Returns (partial hypothesis, committed text) or None if the result is stale.
+        """
+        if utterance != self.utterance:
+            return None
+        text = await self.stt.transcribe_streaming(audio_array, language=language, prompt=self.prompt)
+        if utterance != self.utterance:
+            return None
+
+        words = text.split()
+        now = time.perf_counter()
+        stable = _common_prefix(words, self._hypothesis)
+        # A word's emit time survives only while it stays in the same position
+        self._first_seen = self._first_seen[:stable] + [now] * (len(words) - stable)
+
+        if stable > self._committed:
+            for emitted_at in self._first_seen[self._committed:stable]:
+                stt_commit_lag.observe(now - emitted_at)
+            self._committed = stable
+        self._hypothesis = words
+        return text, self.committed_text
+
+    def take_forwardable(self) -> Optional[str]:
+        """Committed text not yet sent downstream, released up to the last sentence end."""
+        pending = self._hypothesis[self._forwarded:self._committed]
+        ends = [i for i, word in enumerate(pending) if _SENTENCE_END.search(word)]
+        if not ends:
+            return None
+        fragment = pending[:ends[-1] + 1]
+        self._forwarded += len(fragment)
+        return " ".join(fragment)
+
+    def end_utterance(self) -> Tuple[int, Optional[str]]:
+        """
+        Close the current utterance (called when the endpointer releases it).
+        Returns (words already forwarded, prompt) for the final decode.
+        """
+        forwarded, prompt = self._forwarded, self.prompt
+        self.utterance += 1
+        self._reset()
+        return forwarded, prompt
+
+    async def finalize(
+        self, audio_array: np.ndarray, forwarded: int, prompt: Optional[str], language: str = None
+    ) -> Tuple[str, Optional[str], Optional[float]]:
+        """
+        Final decode of a closed utterance.
+        Returns (text not yet forwarded, Whisper language, probability).
+        """
+        text, detected, probability = await self.stt.transcribe_with_language(
+            audio_array, language=language, prompt=prompt
+        )
+        if text:
+            self._context = (self._context + " " + text).strip()[-self.prompt_max_chars:]
+        return " ".join(text.split()[forwarded:]), detected, probability
@@ -3,14 +3,29 @@ Speech-to-Text Engine using Whisper
 Streaming implementation for low-latency transcription
 """
 import asyncio
+import bisect
 import logging
+import threading
+from typing import AsyncIterator, Optional, Tuple
+
 import numpy as np
-from faster_whisper import WhisperModel
+from faster_whisper import WhisperModel, BatchedInferencePipeline
 
 from config import settings
+from batching import DynamicBatcher
+from executors import get_executor
+from metrics import stt_batch_size, stt_queue_wait
 
 logger = logging.getLogger(__name__)
 
+# Whisper decodes at most 30s of audio per batch element
+_MAX_CLIP_SECONDS = 30
+# Shorter than one Whisper feature frame: nothing to decode, and segment start
+# times (rounded to the millisecond) could not tell such a clip from the next one
+_MIN_CLIP_SECONDS = 0.01
+
+_END_OF_SEGMENTS = object()
+
 class WhisperSTT:
     def __init__(self, model_size: str = None):
         """
@@ -22,7 +37,7 @@ class WhisperSTT:
 
         self.device = settings.STT_DEVICE
         self.compute_type = settings.STT_COMPUTE_TYPE
-        
+
         logger.info(f"Loading Whisper model: {model_size} on {self.device}")
         self.model = WhisperModel(
             model_size,
@@ -30,45 +45,166 @@ class WhisperSTT:
             compute_type=self.compute_type,
             num_workers=4
         )
-        
+        self.batched_model = BatchedInferencePipeline(model=self.model)
+        self.sample_rate = self.model.feature_extractor.sampling_rate
+
+        # Cross-call scheduler: segments from all active calls are coalesced
+        # for a short window and decoded together, grouped by (language, prompt).
+        self.executor = get_executor("stt")
+        self.scheduler = DynamicBatcher(
+            name="stt",
+            process_batch=self._transcribe_batch_sync,
+            max_batch_size=settings.STT_BATCH_MAX_SIZE,
+            max_wait_ms=settings.STT_BATCH_MAX_WAIT_MS,
+            batch_size_metric=stt_batch_size,
+            queue_wait_metric=stt_queue_wait,
+            executor=self.executor,
+            max_concurrent_batches=self.executor.max_in_flight,
+        )
+
         # Supported languages
         self.supported_languages = ["ta", "te", "kn", "mr", "hi", "en"]
-        
-    async def transcribe_streaming(self, audio_array: np.ndarray) -> str:
+
+    async def transcribe_streaming(self, audio_array: np.ndarray, language: str = None, prompt: str = None) -> str:
         """
-        Transcribe audio chunk with streaming support
+        Transcribe audio chunk through the batch scheduler
+        prompt carries previously committed text as decoding context
         Returns text or empty string if no speech detected
         """
+        text, _, _ = await self.transcribe_with_language(audio_array, language, prompt)
+        return text
+
+    async def transcribe_with_language(
+        self, audio_array: np.ndarray, language: str = None, prompt: str = None
+    ) -> Tuple[str, Optional[str], Optional[float]]:
+        """
+        Like transcribe_streaming, but also returns Whisper's language ID for the segment
+        as (text, language code, probability). With a pinned language no detection
+        runs and the probability is None.
+        """
         try:
-            # Run in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            segments, info = await loop.run_in_executor(
-                None,
-                lambda: self.model.transcribe(
-                    audio_array,
-                    language=None,  # Auto-detect
-                    beam_size=5,
-                    vad_filter=True,  # Voice Activity Detection
-                    vad_parameters=dict(
-                        min_silence_duration_ms=500,
-                        threshold=0.5
-                    )
-                )
-            )
-            
-            # Combine segments
-            text = " ".join([segment.text for segment in segments]).strip()
-            
+            text, detected, probability = await self.scheduler.submit(audio_array, key=(language, prompt))
             if text:
-                logger.debug(f"Transcribed: {text} (lang: {info.language})")
-            
-            return text
-            
+                logger.debug(f"Transcribed: {text}")
+            return text, detected, probability
+
         except Exception as e:
             logger.error(f"STT error: {e}")
-            return ""
-    
+            return "", None, None
+
     async def transcribe_batch(self, audio_arrays: list) -> list:
-        """Batch transcription for multiple audio chunks"""
+        """Batch transcription for multiple audio chunks (shares the scheduler window)"""
         tasks = [self.transcribe_streaming(audio) for audio in audio_arrays]
         return await asyncio.gather(*tasks)
+
+    async def transcribe_segments(
+        self, audio_array: np.ndarray, language: str = None, prompt: str = None
+    ) -> AsyncIterator[Tuple[str, Optional[str], Optional[float]]]:
+        """
+        Decode one utterance and yield each Whisper segment as soon as it is finished,
+        as (text, language code, probability) like transcribe_with_language: the
+        utterance's language ID comes with every segment, with probability None when
+        the language was pinned.
+        faster-whisper's segment generator is lazy — the decoding happens while it is
+        iterated — so it is driven entirely inside the STT executor and only the
+        finished text crosses to the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def decode():
+            try:
+                segments, info = self.model.transcribe(
+                    audio_array,
+                    language=language,
+                    beam_size=5,
+                    vad_filter=False,  # already endpointed upstream
+                    initial_prompt=prompt,
+                )
+                probability = None if language else info.language_probability
+                for segment in segments:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, (segment.text, info.language, probability))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _END_OF_SEGMENTS)
+
+        job = asyncio.ensure_future(self.executor.run(decode))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_SEGMENTS:
+                    break
+                text, detected, probability = item
+                text = text.strip()
+                if text:
+                    yield text, detected, probability
+            await job  # surfaces decode errors
+        finally:
+            # Consumer gave up early: let the worker stop at the next segment
+            stop.set()
+
+    def _transcribe_batch_sync(self, key: tuple, audio_arrays: list) -> list:
+        """
+        Decode a batch of independent segments (runs in thread pool).
+        Segments without a language hint get per-segment language ID first so
+        callers speaking different languages are never decoded under one label.
+        Returns (text, language, probability) per segment.
+        """
+        language, prompt = key
+        if language is None:
+            detections = [self.model.detect_language(audio)[:2] for audio in audio_arrays]
+        else:
+            detections = [(language, None)] * len(audio_arrays)
+        languages = [lang for lang, _ in detections]
+
+        results = [""] * len(audio_arrays)
+        for lang in set(languages):
+            indices = [i for i, l in enumerate(languages) if l == lang]
+            texts = self._decode_clips_sync([audio_arrays[i] for i in indices], lang, prompt)
+            for i, text in zip(indices, texts):
+                results[i] = text
+        return [(text, lang, prob) for text, (lang, prob) in zip(results, detections)]
+
+    def _decode_clips_sync(self, audio_arrays: list, language: str, prompt: str = None) -> list:
+        """
+        Concatenate segments and decode them as one batch via clip timestamps.
+        Each clip is one batch element; output segments are mapped back to
+        their owner by start time. Clips are at least _MIN_CLIP_SECONDS long,
+        so every start is unambiguous; shorter audio transcribes to "".
+        """
+        max_clip = _MAX_CLIP_SECONDS * self.sample_rate
+        min_clip = int(_MIN_CLIP_SECONDS * self.sample_rate)
+        clips, clip_starts, owners = [], [], []
+        offset = 0
+        for owner, audio in enumerate(audio_arrays):
+            for start in range(0, len(audio), max_clip):
+                end = min(start + max_clip, len(audio))
+                if end - start < min_clip:
+                    continue
+                # clip_timestamps are in seconds
+                clips.append({"start": (offset + start) / self.sample_rate, "end": (offset + end) / self.sample_rate})
+                clip_starts.append((offset + start) / self.sample_rate)
+                owners.append(owner)
+            offset += len(audio)
+
+        texts = [[] for _ in audio_arrays]
+        if not clips:
+            return ["" for _ in audio_arrays]
+
+        segments, _ = self.batched_model.transcribe(
+            np.concatenate(audio_arrays).astype(np.float32, copy=False),
+            language=language,
+            beam_size=5,
+            batch_size=len(clips),
+            vad_filter=False,  # already endpointed upstream
+            clip_timestamps=clips,
+            without_timestamps=True,
+            initial_prompt=prompt,
+        )
+        for segment in segments:
+            clip = max(0, bisect.bisect_right(clip_starts, segment.start + 1e-3) - 1)
+            texts[owners[clip]].append(segment.text.strip())
+
+        return [" ".join(t for t in owner_texts if t) for owner_texts in texts]
@@ -0,0 +1,111 @@
+"""
+Two-tier translation cache.
+A bounded in-process LRU sits in front of a shared Redis tier so repeated
+phrases skip NLLB entirely and replicas share each other's hits.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from config import settings
+from metrics import translation_cache_requests, translation_cache_evictions, translation_cache_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different phrasings share a key."""
+    return " ".join(text.split()).casefold()
+
+
+class TranslationCache:
+    """LRU (entry- and byte-bounded) + Redis read-through/write-behind cache."""
+
+    def __init__(
+        self,
+        model_name: str,
+        redis_client=None,
+        max_entries: int = None,
+        max_bytes: int = None,
+        ttl_seconds: int = None,
+    ):
+        self.model_name = model_name
+        self.redis = redis_client
+        self.max_entries = max_entries or settings.TRANSLATION_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or settings.TRANSLATION_CACHE_MAX_BYTES
+        self.ttl_seconds = ttl_seconds or settings.TRANSLATION_CACHE_TTL_SECONDS
+        self.key_prefix = "trans:"
+
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._pending_writes: set = set()
+
+    def make_key(self, text: str, src_code: str, tgt_code: str) -> str:
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}{self.model_name}:{src_code}:{tgt_code}:{digest}"
+
+    async def get(self, text: str, src_code: str, tgt_code: str) -> Optional[str]:
+        key = self.make_key(text, src_code, tgt_code)
+
+        value = self._lru.get(key)
+        if value is not None:
+            self._lru.move_to_end(key)
+            translation_cache_requests.labels(tier="local", result="hit").inc()
+            return value
+        translation_cache_requests.labels(tier="local", result="miss").inc()
+
+        if self.redis is None:
+            return None
+        try:
+            value = await self.redis.get(key)
+        except Exception as e:
+            logger.debug(f"Translation cache Redis read failed: {e}")
+            return None
+        if value is None:
+            translation_cache_requests.labels(tier="redis", result="miss").inc()
+            return None
+
+        translation_cache_requests.labels(tier="redis", result="hit").inc()
+        self._store_local(key, value)
+        return value
+
+    def put(self, text: str, src_code: str, tgt_code: str, translated: str):
+        """Store locally and write behind to Redis without blocking the caller."""
+        key = self.make_key(text, src_code, tgt_code)
+        self._store_local(key, translated)
+        if self.redis is None:
+            return
+        task = asyncio.ensure_future(self._write_redis(key, translated))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def _write_redis(self, key: str, value: str):
+        try:
+            await self.redis.set(key, value, ex=self.ttl_seconds)
+        except Exception as e:
+            logger.debug(f"Translation cache Redis write failed: {e}")
+
+    def _store_local(self, key: str, value: str):
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._bytes -= _entry_size(key, old)
+        self._lru[key] = value
+        self._bytes += size
+
+        while len(self._lru) > self.max_entries or self._bytes > self.max_bytes:
+            old_key, old_value = self._lru.popitem(last=False)
+            self._bytes -= _entry_size(old_key, old_value)
+            translation_cache_evictions.inc()
+        translation_cache_bytes.set(self._bytes)
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+
+def _entry_size(key: str, value: str) -> int:
+    return len(key) + len(value.encode("utf-8"))
@@ -7,11 +7,17 @@ from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import asyncio
 
 from config import settings
+from batching import DynamicBatcher
+from executors import get_executor
+from translation_cache import TranslationCache
+from metrics import translation_batch_size, translation_queue_wait
 
 logger = logging.getLogger(__name__)
 
+_MAX_LENGTH = 512
+
 class TranslationEngine:
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, redis_client=None):
         """
         Initialize NLLB translation model
         Using distilled version for faster inference
@@ -36,6 +42,23 @@ class TranslationEngine:
             "hi_en": "hin_Deva"  # Hinglish approximated as Hindi
         }
         
+        # Repeated phrases are served from the LRU / Redis tiers without decoding
+        self.cache = TranslationCache(model_name, redis_client=redis_client)
+        
+        # Cross-call coalescer: pending requests are grouped by (source, target)
+        # code pair and padded into a single generate call.
+        self.executor = get_executor("translation")
+        self.coalescer = DynamicBatcher(
+            name="translation",
+            process_batch=self._translate_batch_sync,
+            max_batch_size=settings.TRANSLATION_BATCH_MAX_SIZE,
+            max_wait_ms=settings.TRANSLATION_BATCH_MAX_WAIT_MS,
+            batch_size_metric=translation_batch_size,
+            queue_wait_metric=translation_queue_wait,
+            executor=self.executor,
+            max_concurrent_batches=self.executor.max_in_flight,
+        )
+        
     async def translate(self, text: str, source_lang: str, target_lang: str) -> str:
         """
         Translate text from source to target language
@@ -55,17 +78,13 @@ class TranslationEngine:
             src_code = self.lang_codes.get(source_lang, "hin_Deva")
             tgt_code = self.lang_codes.get(target_lang, "eng_Latn")
             
-            # Set source language
-            self.tokenizer.src_lang = src_code
+            cached = await self.cache.get(text, src_code, tgt_code)
+            if cached is not None:
+                return cached
             
-            # Run translation in thread pool
-            loop = asyncio.get_event_loop()
-            translated = await loop.run_in_executor(
-                None,
-                self._translate_sync,
-                text,
-                tgt_code
-            )
+            # Coalesced with concurrent requests for the same language pair
+            translated = await self.coalescer.submit(text, key=(src_code, tgt_code))
+            self.cache.put(text, src_code, tgt_code, translated)
             
             logger.debug(f"Translated: {text[:50]}... → {translated[:50]}...")
             return translated
@@ -74,32 +93,40 @@ class TranslationEngine:
             logger.error(f"Translation error: {e}")
             return text  # Return original on error
     
-    def _translate_sync(self, text: str, target_code: str) -> str:
-        """Synchronous translation (runs in thread pool)"""
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
+    def _encode(self, text: str, src_code: str) -> list:
+        """
+        Tokenize one request with explicit NLLB special tokens.
+        Never touches tokenizer.src_lang, so concurrent batches can't race on it.
+        """
+        ids = self.tokenizer(text, add_special_tokens=False)["input_ids"][:_MAX_LENGTH - 2]
+        src_id = self.tokenizer.convert_tokens_to_ids(src_code)
+        if getattr(self.tokenizer, "legacy_behaviour", False):
+            return ids + [self.tokenizer.eos_token_id, src_id]
+        return [src_id] + ids + [self.tokenizer.eos_token_id]
+    
+    def _translate_batch_sync(self, lang_pair: tuple, texts: list) -> list:
+        """Synchronous padded batch translation (runs in thread pool)"""
+        src_code, tgt_code = lang_pair
+        inputs = self.tokenizer.pad(
+            {"input_ids": [self._encode(text, src_code) for text in texts]},
             padding=True,
-            truncation=True,
-            max_length=512
+            return_tensors="pt"
         ).to(self.device)
         
         translated_tokens = self.model.generate(
             **inputs,
-            forced_bos_token_id=self.tokenizer.lang_code_to_id[target_code],
-            max_length=512,
+            forced_bos_token_id=self.tokenizer.convert_tokens_to_ids(tgt_code),
+            max_length=_MAX_LENGTH,
             num_beams=5,
             early_stopping=True
         )
         
-        translated_text = self.tokenizer.batch_decode(
+        return self.tokenizer.batch_decode(
             translated_tokens,
             skip_special_tokens=True
-        )[0]
-        
-        return translated_text
+        )
     
     async def translate_batch(self, texts: list, source_lang: str, target_lang: str) -> list:
-        """Batch translation for multiple texts"""
+        """Batch translation for multiple texts (one padded generate per coalesced group)"""
         tasks = [self.translate(text, source_lang, target_lang) for text in texts]
         return await asyncio.gather(*tasks)
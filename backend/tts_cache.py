@@ -0,0 +1,159 @@
+"""
+Content-addressed cache for synthesized TTS audio.
+PCM blobs live in a size-bounded directory on disk and are served as
+memory-mapped views, so cache hits go to the WebSocket without copying.
+"""
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config import settings
+from metrics import tts_cache_requests, tts_cache_bytes_served, tts_cache_bytes
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = ".pcm"
+
+
+class AudioCache:
+    """Disk-backed, mmap-served PCM store with LRU eviction by total size."""
+
+    def __init__(
+        self,
+        voice: str,
+        sample_rate: int,
+        directory: str = None,
+        max_bytes: int = None,
+    ):
+        self.voice = voice
+        self.sample_rate = sample_rate
+        self.directory = directory or settings.TTS_CACHE_DIR
+        self.max_bytes = max_bytes or settings.TTS_CACHE_MAX_BYTES
+
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        # put_sync() runs on the model-loading thread while calls already use the cache on the loop
+        self._lock = threading.Lock()
+        # Blob writes get their own thread instead of queueing behind other work on the loop's default pool
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-cache")
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def make_key(self, text: str, language: str) -> str:
+        material = "\x1f".join([text.strip(), language or "", self.voice, str(self.sample_rate)])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, language: str) -> Optional[memoryview]:
+        """Return a read-only memoryview over the cached PCM, or None on a miss."""
+        key = self.make_key(text, language)
+        with self._lock:
+            cached = key in self._index
+        if not cached:
+            tts_cache_requests.labels(result="miss").inc()
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError) as e:
+            logger.warning(f"TTS cache entry {key[:12]} unreadable, dropping: {e}")
+            self._forget(key)
+            tts_cache_requests.labels(result="miss").inc()
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        tts_cache_requests.labels(result="hit").inc()
+        tts_cache_bytes_served.inc(len(view))
+        return view
+
+    def contains(self, text: str, language: str) -> bool:
+        key = self.make_key(text, language)
+        with self._lock:
+            return key in self._index
+
+    async def put(self, text: str, language: str, pcm: bytes):
+        """Persist a blob; the file write runs off the event loop, the index update on it."""
+        if not pcm or len(pcm) > self.max_bytes:
+            return
+        key = self.make_key(text, language)
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(self._writer, self._write_file, key, pcm):
+            self._record(key, len(pcm))
+
+    def put_sync(self, text: str, language: str, pcm: bytes):
+        """Blocking variant for startup pre-synthesis."""
+        if not pcm or len(pcm) > self.max_bytes:
+            return
+        key = self.make_key(text, language)
+        if self._write_file(key, pcm):
+            self._record(key, len(pcm))
+
+    def _write_file(self, key: str, pcm: bytes) -> bool:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(pcm)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logger.warning(f"TTS cache write failed: {e}")
+            return False
+
+    def _record(self, key: str, size: int):
+        with self._lock:
+            if key in self._index:
+                self._bytes -= self._index.pop(key)
+            self._index[key] = size
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used blobs down to max_bytes; caller holds the lock."""
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._unlink(key)
+            self._bytes -= size
+        tts_cache_bytes.set(self._bytes)
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._unlink(key)
+            tts_cache_bytes.set(self._bytes)
+
+    def _unlink(self, key: str):
+        try:
+            # Open mmaps of the unlinked file stay valid until their views are released
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _load_index(self):
+        """Rebuild the LRU from disk, oldest access first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[: -len(_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+        self._evict()
+        if entries:
+            logger.info(f"TTS cache: {len(self._index)} entries, {self._bytes} bytes on disk")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
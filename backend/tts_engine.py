@@ -1,15 +1,61 @@
 """
 Text-to-Speech Engine using Coqui TTS.
 Uses glowTTS (single-speaker) per config default to avoid XTTS speaker_wav requirement.
+Synthesized PCM is cached on disk (see tts_cache.py) so repeated phrases skip the model.
+synthesize_stream() splits text into sentences/clauses and yields PCM as each one finishes.
 """
 import asyncio
 import logging
+import re
+from typing import AsyncIterator, List, Union
+
 import numpy as np
 
 from config import settings
+from executors import get_executor
+from tts_cache import AudioCache
 
 logger = logging.getLogger(__name__)
 
+_MODEL_NAME = "tts_models/en/ljspeech/glow-tts"
+# Native output rate of the model; telephony legs resample from this
+SAMPLE_RATE = 22050
+
+# Sentence ends (incl. Devanagari danda) and, for long sentences, clause breaks
+_SENTENCE_END = re.compile(r"(?<=[.!?\u0964\u0965])\s+")
+_CLAUSE_BREAK = re.compile(r"(?<=[,;:])\s+")
+_MAX_CLAUSE_CHARS = 120
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into synthesis units: sentences, with long ones broken at clauses."""
+    units = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= _MAX_CLAUSE_CHARS:
+            units.append(sentence)
+            continue
+        current = ""
+        for clause in _CLAUSE_BREAK.split(sentence):
+            if current and len(current) + len(clause) + 1 > _MAX_CLAUSE_CHARS:
+                units.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}" if current else clause
+        if current:
+            units.append(current)
+    return units
+
+
+def _to_pcm16(audio) -> bytes:
+    """Model float output → int16 PCM in one conversion, clipped to avoid wrap-around."""
+    samples = np.asarray(audio, dtype=np.float32)
+    np.clip(samples, -1.0, 1.0, out=samples)
+    samples *= 32767
+    return samples.astype(np.int16).tobytes()
+
 
 class CoquiTTS:
     def __init__(self):
@@ -18,24 +64,70 @@ class CoquiTTS:
         logger.info(f"Loading TTS model ({settings.TTS_ENGINE}) on {device}")
         # glowTTS is single-speaker, no speaker_wav needed
         # Switch to xtts_v2 in config if you have a reference wav
-        self.model = TTS("tts_models/en/ljspeech/glow-tts").to(device)
-        self.sample_rate = 22050
+        self.model = TTS(_MODEL_NAME).to(device)
+        self.sample_rate = SAMPLE_RATE
+        self.executor = get_executor("tts")
+        self.cache = AudioCache(
+            voice=f"{_MODEL_NAME}:{settings.TTS_SPEAKER_ID}",
+            sample_rate=self.sample_rate,
+        )
 
     async def synthesize(self, text: str, language: str) -> bytes:
+        return bytes(await self.synthesize_view(text, language))
+
+    async def synthesize_view(self, text: str, language: str) -> Union[bytes, memoryview]:
+        """
+        Like synthesize(), but cache hits come back as a zero-copy memoryview
+        over the memory-mapped blob, ready for ws.send_bytes().
+        """
         if not text or not text.strip():
             return b""
+        cached = self.cache.get(text, language)
+        if cached is not None:
+            return cached
         try:
-            loop = asyncio.get_event_loop()
-            audio_array = await loop.run_in_executor(
-                None, self._synthesize_sync, text
-            )
-            return (np.array(audio_array) * 32767).astype(np.int16).tobytes()
+            audio_array = await self.executor.run(self._synthesize_sync, text)
+            pcm = _to_pcm16(audio_array)
         except Exception as e:
             logger.error(f"TTS error: {e}")
             return b""
+        await self.cache.put(text, language, pcm)
+        return pcm
+
+    async def synthesize_stream(self, text: str, language: str) -> AsyncIterator[Union[bytes, memoryview]]:
+        """
+        Yield PCM per sentence/clause, in order, as soon as each is synthesized.
+        The next unit is synthesized while the current one is being sent.
+        """
+        units = split_sentences(text) if text else []
+        if not units:
+            return
+        pending = asyncio.ensure_future(self.synthesize_view(units[0], language))
+        try:
+            for i in range(len(units)):
+                pcm = await pending
+                if i + 1 < len(units):
+                    pending = asyncio.ensure_future(self.synthesize_view(units[i + 1], language))
+                if pcm:
+                    yield pcm
+        finally:
+            if not pending.done():
+                pending.cancel()
 
     def _synthesize_sync(self, text: str) -> list:
         return self.model.tts(text=text)
 
     async def synthesize_batch(self, texts: list, language: str) -> list:
         return await asyncio.gather(*[self.synthesize(t, language) for t in texts])
+
+    def presynthesize(self, prompts: List[str], language: str):
+        """Warm the cache with known prompts (greetings, hold messages). Blocking."""
+        for prompt in prompts:
+            if self.cache.contains(prompt, language):
+                continue
+            try:
+                pcm = _to_pcm16(self._synthesize_sync(prompt))
+                self.cache.put_sync(prompt, language, pcm)
+            except Exception as e:
+                logger.warning(f"Pre-synthesis failed for {prompt!r}: {e}")
+        logger.info(f"Pre-synthesized {len(prompts)} TTS prompts")
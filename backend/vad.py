@@ -0,0 +1,172 @@
+"""
+Voice Activity Detection and utterance endpointing.
+Runs a lightweight energy VAD over 20–30 ms frames of 16-bit PCM and releases
+a speech segment as soon as the speaker pauses, so STT never waits for a fixed
+buffer size and never sees half-words or pure silence.
+"""
+import logging
+from collections import deque
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_BYTES_PER_SAMPLE = 2  # int16 mono
+_NOISE_FLOOR_MARGIN_DB = 10.0
+_NOISE_FLOOR_ALPHA = 0.05
+
+
+class EnergyVAD:
+    """Frame-level speech classifier based on RMS energy with an adaptive noise floor."""
+
+    def __init__(self, threshold_db: float = None):
+        if threshold_db is None:
+            threshold_db = settings.VAD_ENERGY_THRESHOLD_DB
+        self.threshold_db = threshold_db
+        self.noise_floor_db = threshold_db - _NOISE_FLOOR_MARGIN_DB
+
+    def classify(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Classify a (n_frames, frame_samples) int16 array.
+        Returns a boolean array, True where the frame contains speech.
+        """
+        samples = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1)) + 1e-9
+        energy_db = 20.0 * np.log10(rms / 32768.0)
+
+        is_speech = np.empty(len(energy_db), dtype=bool)
+        for i, db in enumerate(energy_db):
+            limit = max(self.threshold_db, self.noise_floor_db + _NOISE_FLOOR_MARGIN_DB)
+            is_speech[i] = db > limit
+            if not is_speech[i]:
+                # Track background noise only on non-speech frames
+                self.noise_floor_db += _NOISE_FLOOR_ALPHA * (db - self.noise_floor_db)
+        return is_speech
+
+
+class UtteranceEndpointer:
+    """
+    Streaming endpointer for one call.
+    feed() accepts arbitrary-sized PCM packets and returns every segment that
+    was closed by a pause (hangover) or by the max-speech cap.
+    on_close(kept) is called, in order, each time an utterance closes; kept is
+    False for a blip dropped below the min-speech length.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = None,
+        frame_ms: int = None,
+        hangover_ms: int = None,
+        min_speech_ms: int = None,
+        max_speech_ms: int = None,
+        preroll_ms: int = 150,
+        vad: Optional[EnergyVAD] = None,
+        on_close: Optional[Callable[[bool], None]] = None,
+    ):
+        self.sample_rate = sample_rate or settings.AUDIO_SAMPLE_RATE
+        self.frame_ms = frame_ms or settings.VAD_FRAME_MS
+        hangover_ms = settings.VAD_HANGOVER_MS if hangover_ms is None else hangover_ms
+        min_speech_ms = settings.VAD_MIN_SPEECH_MS if min_speech_ms is None else min_speech_ms
+        max_speech_ms = settings.VAD_MAX_SPEECH_MS if max_speech_ms is None else max_speech_ms
+
+        self.frame_samples = self.sample_rate * self.frame_ms // 1000
+        self.frame_bytes = self.frame_samples * _BYTES_PER_SAMPLE
+        self.hangover_frames = max(1, hangover_ms // self.frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // self.frame_ms)
+        self.max_segment_frames = max(1, max_speech_ms // self.frame_ms)
+        self.vad = vad or EnergyVAD()
+        self.on_close = on_close
+
+        self._pending = bytearray()
+        self._preroll: deque = deque(maxlen=max(0, preroll_ms // self.frame_ms))
+        self._segment = bytearray()
+        self._in_speech = False
+        self._speech_frames = 0
+        self._silence_frames = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._in_speech
+
+    def current_audio(self) -> bytes:
+        """Snapshot of the in-progress utterance (empty when not in speech)."""
+        return bytes(self._segment) if self._in_speech else b""
+
+    def feed(self, pcm: bytes) -> List[bytes]:
+        """Push raw int16 PCM and return any completed speech segments."""
+        self._pending += pcm
+        n_frames = len(self._pending) // self.frame_bytes
+        if n_frames == 0:
+            return []
+
+        usable = n_frames * self.frame_bytes
+        frames = np.frombuffer(bytes(self._pending[:usable]), dtype=np.int16)
+        del self._pending[:usable]
+        frames = frames.reshape(n_frames, self.frame_samples)
+        flags = self.vad.classify(frames)
+
+        segments: List[bytes] = []
+        for frame, is_speech in zip(frames, flags):
+            segment = self._step(frame.tobytes(), bool(is_speech))
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> Optional[bytes]:
+        """Close the current segment (e.g. on a stream gap). Returns it if long enough."""
+        if not self._in_speech:
+            return None
+        return self._close_segment()
+
+    def _step(self, frame: bytes, is_speech: bool) -> Optional[bytes]:
+        if not self._in_speech:
+            if not is_speech:
+                self._preroll.append(frame)
+                return None
+            self._in_speech = True
+            self._segment = bytearray(b"".join(self._preroll))
+            self._preroll.clear()
+            self._speech_frames = 0
+            self._silence_frames = 0
+
+        self._segment += frame
+        if is_speech:
+            self._speech_frames += 1
+            self._silence_frames = 0
+        else:
+            self._silence_frames += 1
+
+        if self._silence_frames >= self.hangover_frames:
+            return self._close_segment()
+
+        if len(self._segment) >= self.max_segment_frames * self.frame_bytes:
+            # Max-speech cap: release what we have and keep listening
+            segment = bytes(self._segment)
+            self._segment = bytearray()
+            self._speech_frames = 0
+            self._silence_frames = 0
+            self._closed(True)
+            return segment
+        return None
+
+    def _close_segment(self) -> Optional[bytes]:
+        segment = bytes(self._segment)
+        speech_frames = self._speech_frames
+        self._segment = bytearray()
+        self._in_speech = False
+        self._speech_frames = 0
+        self._silence_frames = 0
+        if speech_frames < self.min_speech_frames:
+            logger.debug(f"Discarding {speech_frames}-frame blip below min speech length")
+            self._closed(False)
+            return None
+        self._closed(True)
+        return segment
+
+    def _closed(self, kept: bool):
+        if self.on_close is not None:
+            self.on_close(kept)
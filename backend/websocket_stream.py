@@ -1,53 +1,139 @@
 """
 WebSocket Stream Manager - Handles real-time audio streaming.
 """
-import asyncio
+import base64
+import json
 import logging
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
 
 from fastapi import WebSocket
 
+from audio_buffer import AudioRingBuffer, BufferClosed
+from audio_codec import AudioTranscoder
+from config import settings
+from metrics import audio_buffer_dropped_bytes
+
 logger = logging.getLogger(__name__)
 
 
+class MediaLeg:
+    """
+    A call's WebSocket wrapped with its negotiated audio format: a FreeSWITCH
+    media stream (uuid_audio_stream / audio fork) or a client that asked for
+    G.711, Opus or another rate. decode() turns the leg's frames into
+    pipeline-rate PCM; send_bytes() takes TTS PCM and plays it back on the
+    same socket in the leg's format, so the pipeline can use it like any other
+    WebSocket connection. send_json() forwards control messages (partial
+    transcripts) to clients; FreeSWITCH cannot take them, so they are dropped there.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        transcoder: AudioTranscoder,
+        playback: str = "binary",
+        control_messages: bool = True,
+    ):
+        self.websocket = websocket
+        self.transcoder = transcoder
+        self.playback = playback
+        self.control_messages = control_messages
+
+    @classmethod
+    def freeswitch(cls, websocket: WebSocket, tts_sample_rate: int) -> "MediaLeg":
+        rate = settings.FREESWITCH_MEDIA_SAMPLE_RATE
+        transcoder = AudioTranscoder("pcm", sample_rate=rate, output_rate=rate, tts_sample_rate=tts_sample_rate)
+        return cls(websocket, transcoder, playback=settings.FREESWITCH_MEDIA_PLAYBACK, control_messages=False)
+
+    def decode(self, frame: bytes) -> bytes:
+        return self.transcoder.decode(frame)
+
+    async def send_bytes(self, pcm: Union[bytes, memoryview]):
+        for packet in self.transcoder.encode(pcm):
+            if self.playback == "json":
+                await self.websocket.send_text(json.dumps({
+                    "type": "streamAudio",
+                    "data": {
+                        "audioDataType": "raw",
+                        "sampleRate": self.transcoder.output_rate,
+                        "audioData": base64.b64encode(packet).decode("ascii"),
+                    },
+                }))
+            else:
+                await self.websocket.send_bytes(packet)
+
+    async def send_json(self, data: dict):
+        if self.control_messages:
+            await self.websocket.send_json(data)
+
+
 class AudioStreamManager:
-    """Manages WebSocket audio streams for active calls."""
+    """
+    Manages WebSocket audio streams for active calls.
+    Inbound audio for each call goes through its own preallocated
+    AudioRingBuffer of STREAM_BUFFER_SIZE bytes; STREAM_OVERFLOW_POLICY
+    decides what happens when the pipeline falls behind.
+    """
 
     def __init__(self, call_handler):
         self.call_handler = call_handler
         self.connections: Dict[str, WebSocket] = {}
-        self.buffers: Dict[str, asyncio.Queue] = {}
+        self.buffers: Dict[str, AudioRingBuffer] = {}
 
-    async def register_connection(self, call_id: str, websocket: WebSocket):
+    async def register_connection(self, call_id: str, websocket: Union[WebSocket, MediaLeg]):
         self.connections[call_id] = websocket
-        self.buffers[call_id] = asyncio.Queue(maxsize=100)
+        self.buffers[call_id] = AudioRingBuffer(
+            settings.STREAM_BUFFER_SIZE,
+            settings.STREAM_OVERFLOW_POLICY,
+            backpressure_timeout=settings.STREAM_BACKPRESSURE_TIMEOUT_MS / 1000,
+        )
         logger.info(f"WebSocket registered for call {call_id}")
 
     async def unregister_connection(self, call_id: str):
+        """
+        Forget the socket and close the call's ring. Audio still buffered stays
+        readable through get_audio_chunk until drained; discard_buffer() drops it.
+        """
         self.connections.pop(call_id, None)
-        self.buffers.pop(call_id, None)
+        buffer = self.buffers.get(call_id)
+        if buffer is not None:
+            buffer.close()
+            if buffer.dropped_bytes:
+                logger.warning(f"Call {call_id} dropped {buffer.dropped_bytes} bytes of inbound audio ({buffer.policy})")
         logger.info(f"WebSocket unregistered for call {call_id}")
 
-    async def process_audio(self, call_id: str, audio_data: bytes):
+    async def process_audio(self, call_id: str, audio_data: Union[bytes, memoryview]):
         try:
-            queue = self.buffers.get(call_id)
-            if queue is None:
+            buffer = self.buffers.get(call_id)
+            if buffer is None:
                 return
-            if not queue.full():
-                await queue.put(audio_data)
-            else:
-                logger.warning(f"Audio buffer full for call {call_id}, dropping packet")
+            dropped = await buffer.put(audio_data)
+            if dropped:
+                audio_buffer_dropped_bytes.labels(policy=buffer.policy).inc(dropped)
+                self.call_handler.record_stat(call_id, "audio_dropped_bytes", dropped)
         except Exception as e:
             logger.error(f"Error processing audio for {call_id}: {e}")
 
-    async def get_audio_chunk(self, call_id: str, timeout: float = 1.0) -> Optional[bytes]:
+    async def get_audio_chunk(self, call_id: str, timeout: float = 1.0) -> Optional[memoryview]:
+        """
+        Next buffered audio, as a view into the call's ring buffer: use or
+        copy it before awaiting anything else. None after timeout; raises
+        BufferClosed once the call is unregistered and its audio drained.
+        """
+        buffer = self.buffers.get(call_id)
+        if buffer is None:
+            raise BufferClosed()
         try:
-            queue = self.buffers.get(call_id)
-            if queue is None:
-                return None
-            return await asyncio.wait_for(queue.get(), timeout=timeout)
-        except asyncio.TimeoutError:
-            return None
+            return await buffer.get(timeout)
+        except BufferClosed:
+            self.discard_buffer(call_id, buffer)
+            raise
         except Exception as e:
             logger.error(f"Error getting audio chunk for {call_id}: {e}")
             return None
+
+    def discard_buffer(self, call_id: str, buffer: Optional[AudioRingBuffer] = None):
+        """Drop a closed call's ring (only `buffer`, if given, so a re-registered call keeps its new one)."""
+        current = self.buffers.get(call_id)
+        if current is not None and current.closed and (buffer is None or current is buffer):
+            del self.buffers[call_id]
@@ -0,0 +1,80 @@
+"""
+Per-frame transcoding cost with hundreds of concurrent call legs.
+
+Each stream has its own AudioTranscoder and is fed 20 ms frames round-robin,
+the way the event loop interleaves calls: leg audio is decoded and resampled
+to the pipeline rate, and 22.05 kHz TTS audio is resampled and encoded for
+the leg. Reports µs per frame and the share of one core needed to keep every
+stream in real time.
+
+Usage:
+    python scripts/bench_audio_codec.py
+    python scripts/bench_audio_codec.py --streams 1000 --seconds 5
+    python scripts/bench_audio_codec.py --codec pcm --rate 8000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from audio_codec import AudioTranscoder, g711_encode  # noqa: E402
+
+FRAME_MS = 20
+TTS_RATE = 22050
+
+
+def _tone(rate: int, seconds: float) -> np.ndarray:
+    t = np.arange(int(rate * seconds)) / rate
+    return (8000 * np.sin(2 * np.pi * 440 * t) + 500 * np.random.randn(len(t))).astype(np.int16)
+
+
+def _frames(codec: str, rate: int, seconds: float) -> list:
+    samples = _tone(rate, seconds)
+    step = rate * FRAME_MS // 1000
+    frames = [samples[i:i + step] for i in range(0, len(samples) - step + 1, step)]
+    if codec in ("ulaw", "alaw"):
+        return [g711_encode(codec, frame).tobytes() for frame in frames]
+    return [frame.tobytes() for frame in frames]
+
+
+def bench(label: str, streams: list, work: list, direction: str):
+    started = time.perf_counter()
+    for frame in work:
+        for transcoder in streams:
+            if direction == "in":
+                transcoder.decode(frame)
+            else:
+                transcoder.encode(frame)
+    elapsed = time.perf_counter() - started
+    frames = len(work) * len(streams)
+    per_frame = elapsed / frames
+    # Every stream produces one frame per FRAME_MS
+    core_share = per_frame * len(streams) * 1000 / FRAME_MS
+    print(f"  {label:<28} {frames:>8} frames  {per_frame * 1e6:7.1f} µs/frame  "
+          f"{core_share * 100:6.1f}% of a core for {len(streams)} streams")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio codec / resampler cost per frame")
+    parser.add_argument("--streams", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=2.0, help="audio per stream")
+    parser.add_argument("--codec", default="ulaw", choices=["pcm", "ulaw", "alaw"])
+    parser.add_argument("--rate", type=int, default=8000, help="leg sample rate (pcm only)")
+    args = parser.parse_args()
+
+    rate = 8000 if args.codec != "pcm" else args.rate
+    streams = [
+        AudioTranscoder(args.codec, sample_rate=rate, output_rate=rate, tts_sample_rate=TTS_RATE)
+        for _ in range(args.streams)
+    ]
+    print(f"{args.streams} streams, {args.codec} {rate} Hz leg, {FRAME_MS} ms frames")
+    bench(f"decode {args.codec}/{rate} → pipeline", streams, _frames(args.codec, rate, args.seconds), "in")
+    bench(f"encode TTS {TTS_RATE} → {args.codec}/{rate}", streams, _frames("pcm", TTS_RATE, args.seconds), "out")
+
+
+if __name__ == "__main__":
+    main()
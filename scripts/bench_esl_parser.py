@@ -0,0 +1,169 @@
+"""
+ESL event parsing throughput — framed reader vs. the old line-by-line loop.
+
+Replays an event stream through an asyncio.StreamReader and reports events/s
+for read_message() + parse_event(). Without arguments a synthetic stream of
+realistic channel events is generated in both "plain" and "json" formats;
+captured streams (raw bytes read from port 8021 after subscribing, e.g. with
+`nc`) can be passed instead.
+
+Usage:
+    python scripts/bench_esl_parser.py
+    python scripts/bench_esl_parser.py --events 50000
+    python scripts/bench_esl_parser.py --capture esl-plain.bin --capture esl-json.bin
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from esl_protocol import parse_event, read_message  # noqa: E402
+
+
+# ── Synthetic stream ──────────────────────────────────────────────────────────
+
+def _event_headers(name: str, channel_id: str, seq: int) -> dict:
+    """About the header set FreeSWITCH sends for a channel event."""
+    headers = {
+        "Event-Name": name,
+        "Core-UUID": "6b1e0f2c-1111-4e55-9a33-4c3a2b1d0e9f",
+        "FreeSWITCH-Hostname": "fs-01",
+        "FreeSWITCH-Switchname": "fs-01",
+        "FreeSWITCH-IPv4": "10.0.0.5",
+        "Event-Date-Local": "2024-05-01 10:15:02",
+        "Event-Date-GMT": "Wed, 01 May 2024 10:15:02 GMT",
+        "Event-Date-Timestamp": str(1714558502000000 + seq),
+        "Event-Calling-File": "switch_channel.c",
+        "Event-Calling-Function": "switch_channel_perform_mark_answered",
+        "Event-Sequence": str(seq),
+        "Channel-State": "CS_EXECUTE",
+        "Channel-Call-State": "ACTIVE",
+        "Channel-Name": "sofia/internal/1001@10.0.0.5:5060",
+        "Unique-ID": channel_id,
+        "Call-Direction": "inbound",
+        "Answer-State": "answered",
+        "Caller-Username": "1001",
+        "Caller-Dialplan": "XML",
+        "Caller-Caller-ID-Name": "Help Desk, Floor 2",
+        "Caller-Caller-ID-Number": "1001",
+        "Caller-Network-Addr": "10.0.0.17",
+        "Caller-Destination-Number": "it-team",
+        "Caller-Unique-ID": channel_id,
+        "Caller-Context": "default",
+        "Caller-Channel-Name": "sofia/internal/1001@10.0.0.5:5060",
+        "Caller-Profile-Created-Time": str(1714558500000000 + seq),
+        "variable_sip_user_agent": "Zoiper rv2.10.20.2",
+        "variable_sip_from_display": "Help Desk, Floor 2",
+        "variable_sip_full_from": "\"Help Desk\" <sip:1001@10.0.0.5>;tag=a7f3",
+        "variable_remote_media_ip": "10.0.0.17",
+        "variable_read_codec": "PCMU",
+        "variable_read_rate": "8000",
+    }
+    if name == "CHANNEL_HANGUP":
+        headers["Hangup-Cause"] = "NORMAL_CLEARING"
+    return headers
+
+
+def _frame(body: bytes, content_type: str) -> bytes:
+    return f"Content-Length: {len(body)}\nContent-Type: {content_type}\n\n".encode() + body
+
+
+def synthetic_stream(count: int, event_format: str) -> bytes:
+    names = ("CHANNEL_CREATE", "CHANNEL_ANSWER", "CHANNEL_HANGUP")
+    frames = []
+    channel_id = str(uuid.uuid4())
+    for seq in range(count):
+        if seq % len(names) == 0:
+            channel_id = str(uuid.uuid4())
+        headers = _event_headers(names[seq % len(names)], channel_id, seq)
+        if event_format == "json":
+            frames.append(_frame(json.dumps(headers).encode(), "text/event-json"))
+        else:
+            block = "".join(f"{k}: {quote(v, safe='')}\n" for k, v in headers.items()) + "\n"
+            frames.append(_frame(block.encode(), "text/event-plain"))
+    return b"".join(frames)
+
+
+# ── Parsers ───────────────────────────────────────────────────────────────────
+
+async def _connect(data: bytes):
+    """Stream over a local socket replaying data, so buffering matches a live connection."""
+    ours, theirs = socket.socketpair()
+
+    def replay():
+        with theirs:
+            theirs.sendall(data)
+
+    threading.Thread(target=replay, daemon=True).start()
+    return await asyncio.open_connection(sock=ours)
+
+
+async def framed(data: bytes) -> int:
+    # Keep the writer referenced: dropping it closes the transport
+    reader, writer = await _connect(data)
+    events = 0
+    while True:
+        try:
+            message = await read_message(reader)
+        except asyncio.IncompleteReadError:
+            return events
+        if parse_event(message) is not None:
+            events += 1
+
+
+async def line_by_line(data: bytes) -> int:
+    """The pre-framing loop: decode every line and substring-match event names."""
+    reader, writer = await _connect(data)
+    events = 0
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError:
+            return events
+        event_data = line.decode().strip()
+        if "CHANNEL_CREATE" in event_data or "CHANNEL_ANSWER" in event_data or "CHANNEL_HANGUP" in event_data:
+            events += 1
+
+
+def bench(label: str, parser, data: bytes, repeat: int):
+    best = float("inf")
+    events = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        events = asyncio.run(parser(data))
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {label:<14} {events:>8} events  {best * 1000:8.1f} ms  {events / best:>10,.0f} events/s  "
+          f"{len(data) / best / 2 ** 20:6.1f} MiB/s")
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="ESL parser throughput")
+    parser.add_argument("--events", type=int, default=20000, help="synthetic events per format")
+    parser.add_argument("--capture", action="append", default=[], help="raw ESL stream captured from port 8021")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.capture:
+        streams = [(os.path.basename(path), open(path, "rb").read()) for path in args.capture]
+    else:
+        streams = [(fmt, synthetic_stream(args.events, fmt)) for fmt in ("plain", "json")]
+
+    for name, data in streams:
+        print(f"{name}: {len(data) / 2 ** 20:.1f} MiB")
+        bench("framed", framed, data, args.repeat)
+        # Counts matching lines, not events — shown for cost only
+        bench("line-by-line", line_by_line, data, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Local stand-in for FreeSWITCH's inbound event socket, for tests.
+Speaks enough ESL for ESLIntegration and ESLCommandPool: auth, event
+subscriptions (plain or json), bgapi with BACKGROUND_JOB results and
+injected channel events. uuid_audio_stream calls on_audio_stream(channel
+id, url, sample rate), so a test can open the media stream FreeSWITCH would.
+"""
+import asyncio
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from esl_protocol import parse_headers
+
+
+class FakeFreeSWITCH:
+    def __init__(self, password: str = "ClueCon", job_delay: float = 0.0):
+        self.password = password
+        self.job_delay = job_delay
+        self.channels = set()
+        self.commands: List[str] = []
+        self.on_audio_stream: Optional[Callable[[str, str, int], None]] = None
+        self._sessions: List[Tuple[asyncio.StreamWriter, Dict[str, str]]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        for writer, _ in self._sessions:
+            writer.close()
+        await self._server.wait_closed()
+
+    def emit(self, name: str, unique_id: str = None, **headers: str):
+        """Send an event to every session subscribed to it."""
+        headers = {"Event-Name": name, **({"Unique-ID": unique_id} if unique_id else {}), **headers}
+        for writer, subscriptions in self._sessions:
+            event_format = subscriptions.get(name) or subscriptions.get("ALL")
+            if event_format:
+                writer.write(_event(headers, event_format))
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscriptions: Dict[str, str] = {}
+        writer.write(b"Content-Type: auth/request\n\n")
+        try:
+            while True:
+                block = await reader.readuntil(b"\n\n")
+                line, _, rest = block.decode().partition("\n")
+                await self._command(line.strip(), parse_headers(rest.encode()), writer, subscriptions)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if (writer, subscriptions) in self._sessions:
+                self._sessions.remove((writer, subscriptions))
+            writer.close()
+
+    async def _command(self, line: str, headers: Dict[str, str], writer, subscriptions):
+        verb, _, args = line.partition(" ")
+        if verb == "auth":
+            if args != self.password:
+                writer.write(_reply("-ERR invalid"))
+                writer.write(b"Content-Type: text/disconnect-notice\n\n")
+                writer.close()
+                return
+            self._sessions.append((writer, subscriptions))
+            writer.write(_reply("+OK accepted"))
+        elif verb == "event":
+            event_format, _, names = args.partition(" ")
+            for name in names.split():
+                subscriptions[name] = event_format
+            writer.write(_reply(f"+OK event listener enabled {event_format}"))
+        elif verb == "bgapi":
+            self.commands.append(args)
+            job_id = headers["Job-UUID"]
+            writer.write(_reply(f"+OK Job-UUID: {job_id}"))
+            asyncio.ensure_future(self._finish_job(job_id, args))
+        else:
+            writer.write(_reply("-ERR command not found"))
+
+    async def _finish_job(self, job_id: str, command: str):
+        if self.job_delay:
+            await asyncio.sleep(self.job_delay)
+        verb, _, args = command.partition(" ")
+        if verb == "uuid_kill":
+            channel_id = args.split()[0]
+            if channel_id in self.channels:
+                self.channels.discard(channel_id)
+                self.emit("CHANNEL_HANGUP", channel_id, **{"Hangup-Cause": "NORMAL_CLEARING"})
+                output = "+OK\n"
+            else:
+                output = "-ERR No such channel!\n"
+        elif verb == "uuid_audio_stream":
+            channel_id, action, url, _, rate = args.split()[:5]
+            if action == "start" and self.on_audio_stream:
+                self.on_audio_stream(channel_id, url, int(rate.rstrip("k")) * 1000)
+            output = "+OK Success\n"
+        else:
+            output = "+OK\n"
+        self.emit("BACKGROUND_JOB", **{"Job-UUID": job_id, "Job-Command": verb, "_body": output})
+
+
+def _reply(text: str) -> bytes:
+    return f"Content-Type: command/reply\nReply-Text: {text}\n\n".encode()
+
+
+def _event(headers: Dict[str, str], event_format: str) -> bytes:
+    headers = dict(headers)
+    body = headers.pop("_body", "")
+    if event_format == "json":
+        content = json.dumps({**headers, **({"_body": body} if body else {})}).encode()
+        content_type = "text/event-json"
+    else:
+        if body:
+            headers["Content-Length"] = str(len(body.encode()))
+        block = "".join(f"{name}: {quote(value, safe='')}\n" for name, value in headers.items()) + "\n"
+        content = block.encode() + body.encode()
+        content_type = "text/event-plain"
+    return f"Content-Length: {len(content)}\nContent-Type: {content_type}\n\n".encode() + content
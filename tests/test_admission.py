@@ -0,0 +1,100 @@
+"""
+Tests for admission control: local slots, inference backlog and the
+cluster-wide lease set (against fakeredis, which runs the Lua script)
+"""
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+import main
+from admission import AdmissionController, AdmissionRejected
+
+
+def _client(server):
+    return fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+
+@pytest.mark.asyncio
+async def test_cluster_limit_is_shared_between_replicas():
+    server = fakeredis.FakeServer()
+    first = AdmissionController(_client(server), max_calls=2, replica_max_calls=2, max_backlog=0)
+    second = AdmissionController(_client(server), max_calls=2, replica_max_calls=2, max_backlog=0)
+
+    await first.admit("a")
+    await second.admit("b")
+    with pytest.raises(AdmissionRejected) as rejected:
+        await second.admit("c")
+    assert rejected.value.reason == "cluster"
+    assert second.calls == {"b"}
+    assert second.saturation == 1.0
+
+    await first.release("a")
+    await second.admit("c")
+    assert second.calls == {"b", "c"}
+
+
+@pytest.mark.asyncio
+async def test_second_connection_for_a_call_is_rejected():
+    server = fakeredis.FakeServer()
+    first = AdmissionController(_client(server), max_calls=2, replica_max_calls=2, max_backlog=0)
+    second = AdmissionController(_client(server), max_calls=2, replica_max_calls=2, max_backlog=0)
+
+    await first.admit("a")
+    for controller in (first, second):
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit("a")
+        assert rejected.value.reason == "duplicate"
+    assert first.calls == {"a"} and second.calls == set()
+
+    # The surviving connection still holds the slot and the lease
+    await second.admit("b")
+    with pytest.raises(AdmissionRejected, match="cluster"):
+        await second.admit("c")
+    await first.release("a")
+    await first.admit("a")
+
+
+@pytest.mark.asyncio
+async def test_replica_and_backlog_limits_are_local():
+    backlog = [0]
+    controller = AdmissionController(
+        None, backlog=lambda: backlog[0], max_calls=100, replica_max_calls=2, max_backlog=10
+    )
+    await controller.admit("a")
+    await controller.admit("b")
+    with pytest.raises(AdmissionRejected, match="replica"):
+        await controller.admit("c")
+
+    await controller.release("b")
+    backlog[0] = 10
+    with pytest.raises(AdmissionRejected, match="backlog"):
+        controller.check()
+    assert controller.saturation == 1.0
+
+
+@pytest.mark.asyncio
+async def test_leases_of_a_dead_replica_expire():
+    server = fakeredis.FakeServer()
+    dead = AdmissionController(_client(server), max_calls=1, lease_seconds=30, max_backlog=0)
+    await dead.admit("orphan")
+    # The replica stopped renewing; pretend its lease ran out
+    await dead.redis.zadd("admission:calls", {"orphan": time.time() - 1})
+
+    alive = AdmissionController(_client(server), max_calls=1, max_backlog=0)
+    await alive.admit("new")
+    await alive.renew()
+    assert alive.cluster_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_initiate_returns_503_with_retry_after(monkeypatch):
+    controller = AdmissionController(None, max_calls=1, max_backlog=0, retry_after=7)
+    await controller.admit("busy")
+    monkeypatch.setattr(main.state, "admission", controller)
+
+    response = await main.initiate_call("1001", "it-team")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
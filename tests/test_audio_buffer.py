@@ -0,0 +1,137 @@
+"""
+Tests for the per-call ring buffer, its overflow policies and float scratch
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from audio_buffer import BACKPRESSURE, DROP_NEWEST, DROP_OLDEST, AudioRingBuffer, BufferClosed, PCMScratch
+from websocket_stream import AudioStreamManager
+
+
+def pcm(*values: int) -> bytes:
+    return np.array(values, dtype=np.int16).tobytes()
+
+
+def drain(buffer: AudioRingBuffer) -> bytes:
+    out = bytearray()
+    while (view := buffer.read()) is not None:
+        out += view
+    return bytes(out)
+
+
+def test_reads_are_views_into_the_ring_across_the_wrap():
+    buffer = AudioRingBuffer(8)
+    buffer.write(pcm(1, 2, 3))
+    assert bytes(buffer.read(4)) == pcm(1, 2)
+
+    buffer.write(pcm(4, 5))  # wraps
+    first = buffer.read()
+    assert isinstance(first, memoryview) and first.obj is buffer._data
+    assert bytes(first) == pcm(3, 4)
+    assert bytes(buffer.read()) == pcm(5)
+    assert buffer.read() is None
+
+
+def test_drop_oldest_keeps_the_latest_audio():
+    buffer = AudioRingBuffer(8, DROP_OLDEST)
+    assert buffer.write(pcm(1, 2, 3)) == 0
+    assert buffer.write(pcm(4, 5)) == 2
+    assert drain(buffer) == pcm(2, 3, 4, 5)
+
+    assert buffer.write(pcm(*range(10, 16))) == 4
+    assert drain(buffer) == pcm(12, 13, 14, 15)
+    assert buffer.dropped_bytes == 6
+
+
+def test_drop_newest_keeps_what_was_already_buffered():
+    buffer = AudioRingBuffer(8, DROP_NEWEST)
+    buffer.write(pcm(1, 2, 3))
+    assert buffer.write(pcm(4, 5)) == 2
+    assert drain(buffer) == pcm(1, 2, 3, 4)
+
+
+def test_odd_trailing_byte_is_dropped():
+    buffer = AudioRingBuffer(8)
+    assert buffer.write(pcm(1) + b"\x07") == 1
+    assert drain(buffer) == pcm(1)
+
+
+@pytest.mark.asyncio
+async def test_backpressure_waits_for_the_reader():
+    buffer = AudioRingBuffer(8, BACKPRESSURE, backpressure_timeout=1.0)
+    await buffer.put(pcm(1, 2, 3, 4))
+    writer = asyncio.ensure_future(buffer.put(pcm(5, 6)))
+    await asyncio.sleep(0.01)
+    assert not writer.done()
+
+    assert bytes(await buffer.get(timeout=1.0)) == pcm(1, 2, 3, 4)
+    assert await writer == 0
+    assert drain(buffer) == pcm(5, 6)
+
+
+@pytest.mark.asyncio
+async def test_backpressure_drops_after_timeout():
+    buffer = AudioRingBuffer(4, BACKPRESSURE, backpressure_timeout=0.01)
+    await buffer.put(pcm(1, 2))
+    assert await buffer.put(pcm(3)) == 2
+    assert buffer.dropped_bytes == 2
+
+
+@pytest.mark.asyncio
+async def test_get_times_out_and_close_wakes_the_reader():
+    buffer = AudioRingBuffer(8)
+    assert await buffer.get(timeout=0.01) is None
+
+    reader = asyncio.ensure_future(buffer.get(timeout=5))
+    await asyncio.sleep(0)
+    buffer.close()
+    with pytest.raises(BufferClosed):
+        await reader
+
+
+@pytest.mark.asyncio
+async def test_closed_buffer_is_drained_before_the_reader_stops():
+    buffer = AudioRingBuffer(8)
+    buffer.write(pcm(1))
+    buffer.close()
+    assert bytes(await buffer.get(timeout=5)) == pcm(1)
+    with pytest.raises(BufferClosed):
+        await buffer.get(timeout=5)
+
+
+def test_scratch_reuses_its_buffer():
+    scratch = PCMScratch()
+    first = scratch.floats(pcm(-32768, 0, 16384))
+    np.testing.assert_array_equal(first, np.array([-1.0, 0.0, 0.5], dtype=np.float32))
+    second = scratch.floats(memoryview(pcm(8192)))
+    assert second.dtype == np.float32 and np.shares_memory(first, second)
+    assert second[0] == 0.25
+
+
+class StatsCallHandler:
+    def __init__(self):
+        self.stats = {}
+
+    def record_stat(self, call_id, field, amount=1):
+        self.stats[(call_id, field)] = self.stats.get((call_id, field), 0) + amount
+
+
+@pytest.mark.asyncio
+async def test_stream_manager_counts_drops_per_call(monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, "STREAM_BUFFER_SIZE", 640)
+    monkeypatch.setattr(settings, "STREAM_OVERFLOW_POLICY", DROP_OLDEST)
+    call_handler = StatsCallHandler()
+    manager = AudioStreamManager(call_handler)
+    await manager.register_connection("c-1", object())
+
+    for _ in range(3):
+        await manager.process_audio("c-1", bytes(320))
+    assert call_handler.stats == {("c-1", "audio_dropped_bytes"): 320}
+    assert len(await manager.get_audio_chunk("c-1")) + len(drain(manager.buffers["c-1"])) == 640
+
+    await manager.unregister_connection("c-1")
+    with pytest.raises(BufferClosed):
+        await manager.get_audio_chunk("c-1")
@@ -0,0 +1,96 @@
+"""
+Tests for G.711 tables, the polyphase resampler and per-call transcoding
+"""
+import warnings
+
+import numpy as np
+import pytest
+
+from audio_codec import AudioTranscoder, Resampler, g711_decode, g711_encode, negotiate
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    audioop = pytest.importorskip("audioop")
+
+
+ALL_SAMPLES = np.arange(-32768, 32768, dtype=np.int16)
+
+
+@pytest.mark.parametrize("codec, encode, decode", [
+    ("ulaw", "lin2ulaw", "ulaw2lin"),
+    ("alaw", "lin2alaw", "alaw2lin"),
+])
+def test_g711_tables_match_reference(codec, encode, decode):
+    expected = getattr(audioop, encode)(ALL_SAMPLES.tobytes(), 2)
+    assert g711_encode(codec, ALL_SAMPLES).tobytes() == expected
+
+    codes = bytes(range(256))
+    assert g711_decode(codec, codes).tobytes() == getattr(audioop, decode)(codes, 2)
+
+
+def test_g711_writes_into_reused_buffer():
+    out = np.zeros(320, dtype=np.int16)
+    decoded = g711_decode("ulaw", bytes(160), out=out)
+    assert decoded.base is out or decoded is out
+    assert len(decoded) == 160
+
+
+def _tone(rate: int, frequency: float, seconds: float = 1.0) -> np.ndarray:
+    t = np.arange(int(rate * seconds)) / rate
+    return (10000 * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+def _snr_db(signal: np.ndarray, rate: int, frequency: float) -> float:
+    """Fit a sine of the given frequency; everything left over counts as noise."""
+    t = np.arange(len(signal)) / rate
+    basis = np.stack([np.sin(2 * np.pi * frequency * t), np.cos(2 * np.pi * frequency * t)], axis=1)
+    coeffs, *_ = np.linalg.lstsq(basis, signal.astype(float), rcond=None)
+    residual = signal - basis @ coeffs
+    return 20 * np.log10(np.hypot(*coeffs) / np.sqrt(2) / residual.std())
+
+
+@pytest.mark.parametrize("src, dst", [(8000, 16000), (16000, 8000), (22050, 8000), (22050, 16000)])
+def test_resampler_streams_20ms_frames_cleanly(src, dst):
+    resampler = Resampler(src, dst)
+    tone = _tone(src, 440)
+    frame = src // 50
+    out = np.concatenate([resampler.process(tone[i:i + frame]).copy() for i in range(0, len(tone), frame)])
+
+    assert len(out) == dst
+    # Skip the filter's start-up; frame boundaries must not show up as noise
+    assert _snr_db(out[200:-200], dst, 440) > 60
+
+
+def test_resampler_output_does_not_depend_on_chunking():
+    samples = (np.random.default_rng(1).standard_normal(22050) * 3000).astype(np.int16)
+    framed, chunked = Resampler(22050, 8000), Resampler(22050, 8000)
+    by_frame = np.concatenate([framed.process(samples[i:i + 441]).copy() for i in range(0, 22050, 441)])
+    cuts = [0, 37, 5000, 5001, 22050]
+    by_chunk = np.concatenate([chunked.process(samples[a:b]).copy() for a, b in zip(cuts, cuts[1:])])
+    np.testing.assert_array_equal(by_frame, by_chunk)
+
+
+def test_resampler_rejects_energy_above_new_nyquist():
+    resampler = Resampler(16000, 8000)
+    out = resampler.process(_tone(16000, 6000))
+    assert np.abs(out[200:]).max() < 10
+
+
+def test_ulaw_transcoder_round_trip():
+    transcoder = AudioTranscoder("ulaw", tts_sample_rate=22050, pipeline_rate=16000)
+    assert (transcoder.sample_rate, transcoder.output_rate) == (8000, 8000)
+
+    inbound = g711_encode("ulaw", _tone(8000, 440)[:160]).tobytes()
+    assert len(transcoder.decode(inbound)) == 320 * 2
+
+    packets = transcoder.encode(_tone(22050, 440)[:441].tobytes())
+    assert [len(packet) for packet in packets] == [160]
+
+
+def test_negotiation():
+    pcm = negotiate(None, None, None, tts_sample_rate=22050)
+    assert pcm.passthrough and pcm.output_rate == 22050
+    assert not negotiate("pcm", 8000, None, tts_sample_rate=22050).passthrough
+    assert negotiate("ALAW", 16000, 16000, tts_sample_rate=22050).output_rate == 8000
+    with pytest.raises(ValueError):
+        negotiate("g729", None, None, tts_sample_rate=22050)
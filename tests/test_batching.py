@@ -0,0 +1,53 @@
+"""
+Tests for the cross-call dynamic batcher
+"""
+import asyncio
+import pytest
+from batching import DynamicBatcher
+
+
+@pytest.mark.asyncio
+async def test_requests_within_window_share_one_batch():
+    """Concurrent submits inside the wait window are processed together"""
+    calls = []
+
+    def process(key, items):
+        calls.append((key, list(items)))
+        return [item * 2 for item in items]
+
+    batcher = DynamicBatcher("test", process, max_batch_size=8, max_wait_ms=20)
+    results = await asyncio.gather(*[batcher.submit(i) for i in range(5)])
+
+    assert results == [0, 2, 4, 6, 8]
+    assert calls == [(None, [0, 1, 2, 3, 4])]
+
+
+@pytest.mark.asyncio
+async def test_groups_by_key_and_caps_batch_size():
+    """Items are grouped per key and a full group flushes immediately"""
+    calls = []
+
+    def process(key, items):
+        calls.append((key, len(items)))
+        return [f"{key}:{item}" for item in items]
+
+    batcher = DynamicBatcher("test", process, max_batch_size=2, max_wait_ms=1000)
+    results = await asyncio.gather(
+        batcher.submit(1, key="a"),
+        batcher.submit(2, key="b"),
+        batcher.submit(3, key="a"),
+        batcher.submit(4, key="b"),
+    )
+
+    assert results == ["a:1", "b:2", "a:3", "b:4"]
+    assert sorted(calls) == [("a", 2), ("b", 2)]
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_propagates_to_every_caller():
+    def process(key, items):
+        raise RuntimeError("decode failed")
+
+    batcher = DynamicBatcher("test", process, max_batch_size=4, max_wait_ms=5)
+    results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
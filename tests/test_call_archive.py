@@ -0,0 +1,180 @@
+"""
+Tests for batched call archival (Redis via fakeredis, Postgres pool replaced by a fake)
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+pytest.importorskip("asyncpg")
+
+from call_archive import CallArchiver
+from call_handler import CallHandler
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, sql):
+        pass
+
+    async def copy_records_to_table(self, table, records, columns):
+        if self.pool.failing:
+            raise ConnectionError("database unavailable")
+        self.pool.copies.append((table, [dict(zip(columns, record)) for record in records]))
+
+
+class FakePool:
+    def __init__(self):
+        self.copies = []
+        self.failing = False
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self)
+
+    async def close(self):
+        pass
+
+
+async def _setup(tmp_path, **overrides):
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    handler = CallHandler(client, cache_ttl=60)
+    params = dict(batch_size=10, flush_interval_ms=20, flush_timeout=1, spill_dir=str(tmp_path))
+    params.update(overrides)
+    archiver = CallArchiver(client, settle=handler.settle, **params)
+    archiver._pool = FakePool()
+    handler.add_termination_listener(archiver.submit)
+    return client, handler, archiver
+
+
+async def _finished_call(handler, text="vanakkam"):
+    call_id = await handler.create_call("1001", "it-team")
+    handler.record_stat(call_id, "audio_packets", 50)
+    await handler.stats.flush()
+    handler.append_transcript(call_id, {"source_text": text, "translation": text.upper(), "timings": {"stt_ms": 12.5}})
+    await asyncio.gather(*handler._pending_writes)
+    await handler.terminate_call(call_id)
+    return call_id
+
+
+@pytest.mark.asyncio
+async def test_terminated_calls_are_copied_in_one_batch(tmp_path):
+    client, handler, archiver = await _setup(tmp_path)
+    calls = [await _finished_call(handler) for _ in range(3)]
+    await handler.terminate_call(calls[0])  # repeated termination is archived once
+
+    task = asyncio.ensure_future(archiver.run())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    tables = [table for table, _ in archiver._pool.copies]
+    assert tables == ["call_archive_stage", "call_transcript_stage"]
+    archived = archiver._pool.copies[0][1]
+    assert sorted(row["call_id"] for row in archived) == sorted(calls)
+    assert archived[0]["status"] == "terminated"
+    assert '"audio_packets": "50"' in archived[0]["stats"]
+    transcript = archiver._pool.copies[1][1]
+    assert transcript[0]["source_text"] == "vanakkam"
+    assert transcript[0]["timings"] == '{"stt_ms": 12.5}'
+    # Archived calls only linger briefly in Redis
+    assert 0 < await client.ttl(f"call:{calls[0]}") <= 300
+
+
+@pytest.mark.asyncio
+async def test_buffered_stats_and_transcript_are_archived(tmp_path):
+    client, handler, archiver = await _setup(tmp_path)
+    call_id = await handler.create_call("1001", "it-team")
+    # Terminate while the counter and the transcript append are still buffered
+    handler.record_stat(call_id, "audio_packets", 7)
+    handler.append_transcript(call_id, {"source_text": "namaste", "translation": "NAMASTE"})
+    await handler.terminate_call(call_id)
+
+    await archiver._collect()
+
+    record = archiver._batch[0]
+    assert record["call"]["audio_packets"] == "7"
+    assert [fields["source_text"] for _, fields in record["transcript"]] == ["namaste"]
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_spills_and_replays(tmp_path):
+    client, handler, archiver = await _setup(tmp_path)
+    archiver._pool.failing = True
+    call_id = await _finished_call(handler)
+
+    task = asyncio.ensure_future(archiver.run())
+    await asyncio.sleep(0.1)
+    assert len(os.listdir(tmp_path)) == 1
+    assert archiver._pool.copies == []
+
+    archiver._pool.failing = False
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert os.listdir(tmp_path) == []
+    assert [row["call_id"] for row in archiver._pool.copies[0][1]] == [call_id]
+
+
+@pytest.mark.asyncio
+async def test_deep_backlog_spills_without_waiting_on_database(tmp_path):
+    client, handler, archiver = await _setup(tmp_path, batch_size=2, max_pending=1)
+    for _ in range(6):
+        await _finished_call(handler)
+
+    await archiver._collect()
+    await archiver._flush()
+
+    assert archiver._pool.copies == []
+    assert len(os.listdir(tmp_path)) == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_requeue_calls_and_keep_running(tmp_path):
+    client, handler, archiver = await _setup(tmp_path)
+    call_id = await _finished_call(handler)
+    load = archiver._load
+    failures = []
+
+    async def flaky_load(call_ids):
+        if not failures:
+            failures.append(call_ids)
+            raise ConnectionError("redis unavailable")
+        return await load(call_ids)
+
+    archiver._load = flaky_load
+    task = asyncio.ensure_future(archiver.run())
+    await asyncio.sleep(0.15)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert failures == [[call_id]]
+    assert [row["call_id"] for row in archiver._pool.copies[0][1]] == [call_id]
+
+
+@pytest.mark.asyncio
+async def test_corrupt_spill_file_is_moved_aside(tmp_path):
+    client, handler, archiver = await _setup(tmp_path)
+    archiver._pool.failing = True
+    call_id = await _finished_call(handler)
+    await archiver._collect()
+    await archiver._flush()
+    (tmp_path / "archive-0-1.jsonl").write_text('{"call": {"call_id": "x"}\n{truncated')
+    archiver._pool.failing = False
+
+    await archiver._replay_spill()
+    await archiver._replay_spill()
+
+    assert sorted(os.listdir(tmp_path)) == ["archive-0-1.jsonl.bad"]
+    assert [row["call_id"] for row in archiver._pool.copies[0][1]] == [call_id]
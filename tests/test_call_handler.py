@@ -0,0 +1,314 @@
+"""
+Tests for CallHandler: call-state cache, pub/sub call events, scripted writes
+and write-behind counters (against fakeredis, which runs the Lua scripts)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from redis.asyncio.client import Pipeline, Redis
+
+from call_handler import CallHandler
+
+
+class RoundTrips:
+    """Counts client round trips: single commands and whole pipelines."""
+
+    def __init__(self, monkeypatch):
+        self.count = 0
+        execute_command = Redis.execute_command
+        execute = Pipeline.execute
+
+        async def counted_command(client, *args, **kwargs):
+            self.count += 1
+            return await execute_command(client, *args, **kwargs)
+
+        async def counted_execute(pipe, *args, **kwargs):
+            self.count += 1
+            return await execute(pipe, *args, **kwargs)
+
+        monkeypatch.setattr(Redis, "execute_command", counted_command)
+        monkeypatch.setattr(Pipeline, "execute", counted_execute)
+
+
+def _client(server):
+    return fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+
+@asynccontextmanager
+async def _replica(server):
+    handler = CallHandler(_client(server), cache_ttl=60)
+    listener = asyncio.ensure_future(handler.listen_for_events())
+    # Wait for the subscription
+    probe = _client(server)
+    while (await probe.pubsub_numsub(handler.events_channel))[0][1] == 0:
+        await asyncio.sleep(0.01)
+    try:
+        yield handler
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_repeated_reads_are_served_locally(monkeypatch):
+    server = fakeredis.FakeServer()
+    async with _replica(server) as handler:
+        call_id = await handler.create_call("1001", "it-team")
+        await handler.get_call(call_id)
+        trips = RoundTrips(monkeypatch)
+        for _ in range(50):
+            call = await handler.get_call(call_id)
+
+    assert call["status"] == "active"
+    assert trips.count == 0
+
+
+@pytest.mark.asyncio
+async def test_write_on_another_replica_invalidates_cache():
+    server = fakeredis.FakeServer()
+    async with _replica(server) as gateway, _replica(server) as api:
+        call_id = await gateway.create_call("1001", "it-team")
+        assert (await gateway.get_call(call_id))["source_language"] != "marathi"
+
+        await api.update_language(call_id, "marathi")
+        await _settle()
+
+        assert (await gateway.get_call(call_id))["source_language"] == "marathi"
+
+
+@pytest.mark.asyncio
+async def test_termination_is_delivered_as_event():
+    server = fakeredis.FakeServer()
+    async with _replica(server) as gateway, _replica(server) as esl:
+        call_id = await gateway.create_call("1001", "it-team")
+        ended = gateway.termination_event(call_id)
+        assert not ended.is_set()
+
+        await esl.terminate_call(call_id)
+        await asyncio.wait_for(ended.wait(), timeout=1)
+
+        assert (await gateway.get_call(call_id))["status"] == "terminated"
+        gateway.release(call_id)
+
+
+@pytest.mark.asyncio
+async def test_resubscribe_catches_missed_termination():
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=60)
+    call_id = await handler.create_call("1001", "it-team")
+    ended = handler.termination_event(call_id)
+    # Terminated while this replica was not listening
+    await _client(server).hset(f"call:{call_id}", "status", "terminated")
+
+    listener = asyncio.ensure_future(handler.listen_for_events())
+    try:
+        await asyncio.wait_for(ended.wait(), timeout=1)
+    finally:
+        listener.cancel()
+
+
+@pytest.mark.asyncio
+async def test_lifecycle_writes_are_single_round_trips(monkeypatch):
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=60)
+    raw = _client(server)
+    trips = RoundTrips(monkeypatch)
+
+    call_id = await handler.create_call("1001", "it-team")
+    assert trips.count == 1
+
+    await handler.update_language(call_id, "telugu")
+    assert trips.count == 2
+    assert 3500 < await raw.ttl(f"call:{call_id}") <= 3600
+
+    await raw.hset(f"call:{call_id}", "start_time", "100")
+    await handler.terminate_call(call_id)  # first use also loads the script
+    first = await raw.hgetall(f"call:{call_id}")
+    before = trips.count
+    await handler.terminate_call(call_id)
+    assert trips.count - before == 1
+
+    assert first["status"] == "terminated"
+    assert int(first["duration"]) == int(first["end_time"]) - 100
+    # A second termination leaves the recorded end time alone
+    assert await raw.hgetall(f"call:{call_id}") == first
+
+
+@pytest.mark.asyncio
+async def test_counters_are_written_behind_in_one_flush(monkeypatch):
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=60)
+    calls = [await handler.create_call("1001", "it-team") for _ in range(3)]
+
+    trips = RoundTrips(monkeypatch)
+    for _ in range(100):
+        for call_id in calls:
+            handler.record_stat(call_id, "audio_packets")
+            handler.record_stat(call_id, "audio_bytes", 640)
+    handler.record_stat(calls[0], "stt_seconds", 0.25)
+    handler.record_stat(calls[0], "stt_seconds", 0.5)
+    # Counters for a call whose hash is gone must not resurrect it
+    handler.record_stat("expired-call", "audio_packets")
+    assert trips.count == 0
+
+    await handler.stats.flush()
+    # One pipeline for every call (redis-py adds a SCRIPT EXISTS check before it)
+    assert trips.count <= 2
+
+    raw = _client(server)
+    for call_id in calls:
+        call = await raw.hgetall(f"call:{call_id}")
+        assert call["audio_packets"] == "100"
+        assert call["audio_bytes"] == "64000"
+    assert float((await raw.hgetall(f"call:{calls[0]}"))["stt_seconds"]) == pytest.approx(0.75)
+    assert not await raw.exists("call:expired-call")
+
+
+@pytest.mark.asyncio
+async def test_failed_stats_entry_is_retried_alone():
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=60)
+    good, bad = [await handler.create_call("1001", "it-team") for _ in range(2)]
+    raw = _client(server)
+    await raw.hset(f"call:{bad}", "audio_packets", "not a number")
+
+    handler.record_stat(good, "audio_packets", 5)
+    handler.record_stat(bad, "audio_packets", 5)
+    await handler.stats.flush()
+    assert handler.stats._pending == {bad: {"audio_packets": 5}}
+
+    await raw.hset(f"call:{bad}", "audio_packets", "0")
+    await handler.stats.flush()
+    # The applied entry is not counted twice
+    assert (await raw.hget(f"call:{good}", "audio_packets")) == "5"
+    assert (await raw.hget(f"call:{bad}", "audio_packets")) == "5"
+    assert handler.stats._pending == {}
+
+
+@pytest.mark.asyncio
+async def test_index_tracks_status_and_pages_through_ties():
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=60)
+    # Many calls share a start second, so pages must split within a score
+    calls = [await handler.create_call("1001", "it-team", call_id=f"c{i:02d}") for i in range(25)]
+    for call_id in calls[:5]:
+        await handler.terminate_call(call_id)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor, total = await handler.list_calls("active", cursor, limit=7)
+        seen += [call["call_id"] for call in page]
+        if cursor is None:
+            break
+
+    assert total == 20
+    assert sorted(seen) == sorted(calls[5:])
+    assert len(seen) == len(set(seen))
+    ended, _, _ = await handler.list_calls("terminated")
+    assert sorted(call["call_id"] for call in ended) == sorted(calls[:5])
+
+    stats = await handler.get_stats()
+    assert stats == {"active_calls": 20, "terminated_calls": 5, "calls_created": 25, "calls_terminated": 5}
+
+
+@pytest.mark.asyncio
+async def test_expired_calls_are_pruned_from_listing():
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=60)
+    for i in range(3):
+        await handler.create_call("1001", "it-team", call_id=f"c{i}")
+    await _client(server).delete("call:c1")  # hash expired
+
+    page, cursor, total = await handler.list_calls("active")
+
+    assert sorted(call["call_id"] for call in page) == ["c0", "c2"]
+    assert (cursor, total) == (None, 2)
+    assert (await handler.get_stats())["active_calls"] == 2
+
+
+async def _drain(handler):
+    await asyncio.gather(*handler._pending_writes)
+
+
+@pytest.mark.asyncio
+async def test_transcript_pages_by_cursor_and_time():
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=60)
+    call_id = await handler.create_call("1001", "it-team")
+    for i in range(5):
+        handler.append_transcript(call_id, {
+            "source_text": f"line {i}", "source_language": "tamil", "translation": f"LINE {i}",
+            "timings": {"stt_ms": 10.0 + i},
+        })
+        await _drain(handler)
+
+    first, cursor = await handler.get_call_transcript(call_id, limit=2)
+    second, cursor = await handler.get_call_transcript(call_id, cursor=cursor, limit=2)
+    third, cursor = await handler.get_call_transcript(call_id, cursor=cursor, limit=2)
+
+    assert [e["source_text"] for e in first + second + third] == [f"line {i}" for i in range(5)]
+    assert cursor is None
+    assert first[1]["timings"] == {"stt_ms": 11.0}
+
+    everything, _ = await handler.get_call_transcript(call_id)
+    middle = everything[2]["timestamp_ms"]
+    ranged, _ = await handler.get_call_transcript(call_id, start_ms=middle, end_ms=middle)
+    assert "line 2" in [e["source_text"] for e in ranged]
+
+
+@pytest.mark.asyncio
+async def test_transcript_tail_follows_until_call_ends(monkeypatch):
+    monkeypatch.setattr("call_handler._TRANSCRIPT_TAIL_BLOCK_MS", 50)
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=0)
+    call_id = await handler.create_call("1001", "it-team")
+
+    async def follow():
+        return [e["source_text"] async for e in handler.tail_transcript(call_id)]
+
+    tail = asyncio.ensure_future(follow())
+    await asyncio.sleep(0.02)
+    for text in ("one", "two"):
+        handler.append_transcript(call_id, {"source_text": text})
+        await _drain(handler)
+    await handler.terminate_call(call_id)
+
+    assert await asyncio.wait_for(tail, timeout=2) == ["one", "two"]
+
+
+@pytest.mark.asyncio
+async def test_transcript_tail_keeps_entries_appended_between_reads(monkeypatch):
+    monkeypatch.setattr("call_handler._TRANSCRIPT_TAIL_BLOCK_MS", 20)
+    server = fakeredis.FakeServer()
+    handler = CallHandler(_client(server), cache_ttl=0)
+    call_id = await handler.create_call("1001", "it-team")
+    handler.append_transcript(call_id, {"source_text": "before"})
+    await _drain(handler)
+
+    get_call = handler.get_call
+
+    async def get_call_then_append(cid):
+        # An entry lands while the tail is between two empty blocking reads
+        if not appended:
+            appended.append(True)
+            handler.append_transcript(call_id, {"source_text": "between"})
+            await _drain(handler)
+        else:
+            await handler.terminate_call(call_id)
+        return await get_call(cid)
+
+    appended = []
+    handler.get_call = get_call_then_append
+    tail = [e["source_text"] async for e in handler.tail_transcript(call_id)]
+
+    assert tail == ["between"]
@@ -0,0 +1,176 @@
+"""
+Tests for ESL framing, event decoding and dispatch
+"""
+import asyncio
+import json
+import time
+from urllib.parse import quote
+
+import pytest
+
+from esl_commands import ESLCommandError, ESLCommandPool
+from esl_integration import ESLIntegration
+from esl_protocol import parse_event, read_message
+from fake_freeswitch import FakeFreeSWITCH
+
+
+def _frame(body: bytes, content_type: str) -> bytes:
+    return f"Content-Length: {len(body)}\nContent-Type: {content_type}\n\n".encode() + body
+
+
+def plain_event(headers: dict, body: str = "") -> bytes:
+    if body:
+        headers = {**headers, "Content-Length": str(len(body.encode()))}
+    block = "".join(f"{name}: {quote(value, safe='')}\n" for name, value in headers.items()) + "\n"
+    return _frame(block.encode() + body.encode(), "text/event-plain")
+
+
+def json_event(headers: dict) -> bytes:
+    return _frame(json.dumps(headers).encode(), "text/event-json")
+
+
+def reader_for(*chunks: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    return reader
+
+
+@pytest.mark.asyncio
+async def test_framed_messages_and_url_decoded_headers():
+    reader = reader_for(
+        b"Content-Type: command/reply\nReply-Text: +OK accepted\n\n",
+        plain_event(
+            {"Event-Name": "BACKGROUND_JOB", "Job-UUID": "j-1", "Job-Command": "uuid_kill"},
+            body="+OK\nsecond: line\n\n",
+        ),
+        json_event({"Event-Name": "CHANNEL_ANSWER", "Unique-ID": "c-1", "_body": "hi"}),
+    )
+
+    reply = await read_message(reader)
+    assert reply.content_type == "command/reply"
+    assert parse_event(reply) is None
+
+    job = parse_event(await read_message(reader))
+    assert (job.name, job.uuid, job.get("Job-UUID")) == ("BACKGROUND_JOB", None, "j-1")
+    # A body containing blank lines and header-like text stays intact
+    assert job.body == "+OK\nsecond: line\n\n"
+
+    answer = parse_event(await read_message(reader))
+    assert (answer.name, answer.uuid, answer.body) == ("CHANNEL_ANSWER", "c-1", "hi")
+
+    with pytest.raises(asyncio.IncompleteReadError):
+        await read_message(reader)
+
+
+@pytest.mark.asyncio
+async def test_plain_headers_are_decoded_on_lookup():
+    reader = reader_for(plain_event({"Event-Name": "CHANNEL_CREATE", "Caller-Caller-ID-Name": "Help Desk: 2"}))
+    event = parse_event(await read_message(reader))
+
+    assert event.headers["Caller-Caller-ID-Name"] == "Help%20Desk%3A%202"
+    assert event.get("Caller-Caller-ID-Name") == "Help Desk: 2"
+    assert event.get("Missing", "default") == "default"
+
+
+class RecordingCallHandler:
+    def __init__(self):
+        self.applied = []
+
+    async def create_call(self, caller_id, destination, source_language=None, call_id=None):
+        # Slow enough that a naive dispatcher would let the hangup overtake it
+        await asyncio.sleep(0.01)
+        self.applied.append(("create", call_id, caller_id, destination))
+        return call_id
+
+    async def update_call(self, call_id, updates):
+        self.applied.append(("update", call_id, updates["status"]))
+
+    async def terminate_call(self, call_id):
+        self.applied.append(("terminate", call_id))
+        return True
+
+
+@pytest.mark.asyncio
+async def test_events_dispatch_by_name_in_order_per_channel():
+    call_handler = RecordingCallHandler()
+    esl = ESLIntegration(call_handler=call_handler, events=["CHANNEL_CREATE"], event_format="json")
+    esl.reader = reader_for(
+        json_event({
+            "Event-Name": "CHANNEL_CREATE", "Unique-ID": "a",
+            "Caller-Caller-ID-Number": "1001", "Caller-Destination-Number": "it-team",
+        }),
+        plain_event({"Event-Name": "CHANNEL_ANSWER", "Unique-ID": "a"}),
+        plain_event({"Event-Name": "HEARTBEAT"}),
+        json_event({"Event-Name": "CHANNEL_HANGUP", "Unique-ID": "a", "Hangup-Cause": "NORMAL_CLEARING"}),
+        json_event({"Event-Name": "CHANNEL_HANGUP", "Unique-ID": "b"}),
+    )
+    esl.is_connected = True
+
+    await esl.listen_for_events()
+    assert not esl.is_connected
+    # Intake never waited on a handler
+    assert call_handler.applied == []
+    await asyncio.gather(*esl._channel_tasks.values())
+
+    assert [op for op in call_handler.applied if op[1] == "a"] == [
+        ("create", "a", "1001", "it-team"),
+        ("update", "a", "answered"),
+        ("terminate", "a"),
+    ]
+    assert ("terminate", "b") in call_handler.applied
+    assert esl._channel_tasks == {}
+
+
+async def _until(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_command_pool_runs_bgapi_jobs_concurrently():
+    async with FakeFreeSWITCH(job_delay=0.05) as fs:
+        fs.channels = {f"c{i}" for i in range(40)}
+        pool = ESLCommandPool("127.0.0.1", fs.port, "ClueCon", size=2, timeout=2)
+        task = asyncio.create_task(pool.run())
+        await _until(lambda: pool.connected == 2)
+
+        started = time.perf_counter()
+        outputs = await asyncio.gather(*(pool.bgapi(f"uuid_kill c{i}") for i in range(40)))
+        # 40 jobs of 50 ms each, overlapped rather than one after another
+        assert time.perf_counter() - started < 1.0
+        assert outputs == ["+OK\n"] * 40
+        assert fs.channels == set()
+
+        with pytest.raises(ESLCommandError, match="No such channel"):
+            await pool.bgapi("uuid_kill missing")
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_mass_hangup_does_not_stall_event_intake():
+    async with FakeFreeSWITCH(job_delay=0.2) as fs:
+        fs.channels = {f"c{i}" for i in range(20)}
+        call_handler = RecordingCallHandler()
+        esl = ESLIntegration("127.0.0.1", fs.port, call_handler=call_handler, event_format="plain")
+        task = asyncio.create_task(esl.run())
+        await _until(lambda: esl.is_connected and esl.commands.connected)
+
+        hangups = asyncio.ensure_future(esl.hangup_channels([f"c{i}" for i in range(20)] + ["gone"]))
+        await _until(lambda: len(fs.commands) == 21)
+        fs.emit("CHANNEL_CREATE", "new", **{"Caller-Caller-ID-Number": "1002"})
+        await _until(lambda: any(op[1] == "new" for op in call_handler.applied))
+        assert not hangups.done()
+
+        assert await hangups == 20
+        await _until(lambda: sum(op[0] == "terminate" for op in call_handler.applied) == 20)
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
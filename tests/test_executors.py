@@ -0,0 +1,43 @@
+"""
+Tests for the per-engine bounded executors
+"""
+import asyncio
+import threading
+import time
+import pytest
+from executors import EngineExecutor
+
+
+@pytest.mark.asyncio
+async def test_max_in_flight_is_enforced():
+    executor = EngineExecutor("test", workers=4, max_in_flight=2)
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def work():
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.02)
+        with lock:
+            running["now"] -= 1
+        return threading.current_thread().name
+
+    names = await asyncio.gather(*[executor.run(work) for _ in range(6)])
+    executor.shutdown()
+
+    assert running["peak"] == 2
+    assert all(name.startswith("test-") for name in names)
+
+
+@pytest.mark.asyncio
+async def test_exceptions_release_the_slot():
+    executor = EngineExecutor("test", workers=1, max_in_flight=1)
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await executor.run(fail)
+    assert await executor.run(lambda: 42) == 42
+    executor.shutdown()
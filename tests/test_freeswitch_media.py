@@ -0,0 +1,228 @@
+"""
+Tests for FreeSWITCH media ingestion, driven end to end by the fake FreeSWITCH
+"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import main
+from admission import AdmissionController
+from audio_buffer import BufferClosed
+from audio_codec import AudioTranscoder
+from config import settings
+from esl_integration import ESLIntegration
+from fake_freeswitch import FakeFreeSWITCH
+from websocket_stream import AudioStreamManager, MediaLeg
+
+
+class FakeCallHandler:
+    def __init__(self):
+        self.calls = {}
+        self.terminated = []
+
+    async def create_call(self, caller_id, destination, source_language=None, call_id=None):
+        self.calls[call_id] = {"caller_id": caller_id, "status": "active"}
+        return call_id
+
+    async def update_call(self, call_id, updates):
+        self.calls[call_id].update(updates)
+
+    async def terminate_call(self, call_id):
+        self.terminated.append(call_id)
+        return True
+
+    def record_stat(self, call_id, field, amount=1):
+        pass
+
+    def termination_event(self, call_id):
+        return asyncio.Event()
+
+    def release(self, call_id):
+        pass
+
+
+class FakeMediaSocket:
+    """The server side of the WebSocket FreeSWITCH opens for uuid_audio_stream."""
+
+    def __init__(self):
+        self.inbound: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def receive(self):
+        return await self.inbound.get()
+
+    async def send_bytes(self, data):
+        self.sent.append(bytes(data))
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=""):
+        self.close_code = code
+
+    def frame(self, pcm: bytes):
+        self.inbound.put_nowait({"type": "websocket.receive", "bytes": pcm})
+
+    def hang_up(self):
+        self.inbound.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+
+async def _until(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_answered_channel_streams_media_into_the_stream_manager(monkeypatch):
+    call_handler = FakeCallHandler()
+    stream_manager = AudioStreamManager(call_handler)
+    monkeypatch.setattr(main.state, "call_handler", call_handler)
+    monkeypatch.setattr(main.state, "stream_manager", stream_manager)
+    monkeypatch.setattr(main.state, "admission", AdmissionController(None, max_calls=10))
+    monkeypatch.setattr(settings, "FREESWITCH_MEDIA_STREAM_URL", "ws://gateway/ws/freeswitch")
+
+    streams = {}
+    sessions = []
+
+    def open_media_stream(channel_id, url, sample_rate):
+        socket = FakeMediaSocket()
+        streams[channel_id] = (socket, url, sample_rate)
+        sessions.append(asyncio.ensure_future(main.freeswitch_media_handler(socket, channel_id)))
+
+    async with FakeFreeSWITCH() as fs:
+        fs.on_audio_stream = open_media_stream
+        esl = ESLIntegration("127.0.0.1", fs.port, call_handler=call_handler)
+        task = asyncio.create_task(esl.run())
+        await _until(lambda: esl.is_connected and esl.commands.connected)
+
+        fs.emit("CHANNEL_CREATE", "leg-1", **{"Caller-Caller-ID-Number": "1001"})
+        fs.emit("CHANNEL_ANSWER", "leg-1")
+        await _until(lambda: "leg-1" in stream_manager.connections)
+
+        socket, url, sample_rate = streams["leg-1"]
+        assert (url, sample_rate) == ("ws://gateway/ws/freeswitch/leg-1", 8000)
+        assert call_handler.calls["leg-1"]["status"] == "answered"
+
+        # 20 ms telephony frames arrive upsampled to the pipeline rate
+        for _ in range(3):
+            socket.frame(np.zeros(160, dtype=np.int16).tobytes())
+        received = 0
+        while received < 3 * 640:
+            chunk = await stream_manager.get_audio_chunk("leg-1")
+            assert chunk is not None
+            received += len(chunk)
+        assert received == 3 * 640
+
+        # TTS audio goes back on the same leg at 8 kHz
+        leg = stream_manager.connections["leg-1"]
+        await leg.send_bytes(np.ones(441, dtype=np.int16).tobytes())
+        assert len(socket.sent[-1]) == 160 * 2
+
+        socket.hang_up()
+        await asyncio.gather(*sessions)
+        assert "leg-1" not in stream_manager.connections
+        assert call_handler.terminated == ["leg-1"]
+        assert main.state.admission.calls == set()
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_media_stream_over_capacity_is_refused_and_hung_up(monkeypatch):
+    call_handler = FakeCallHandler()
+    stream_manager = AudioStreamManager(call_handler)
+    admission = AdmissionController(None, max_calls=1, max_backlog=0)
+    await admission.admit("busy")
+    monkeypatch.setattr(main.state, "call_handler", call_handler)
+    monkeypatch.setattr(main.state, "stream_manager", stream_manager)
+    monkeypatch.setattr(main.state, "admission", admission)
+
+    async with FakeFreeSWITCH() as fs:
+        fs.channels = {"leg-2"}
+        esl = ESLIntegration("127.0.0.1", fs.port, call_handler=call_handler)
+        monkeypatch.setattr(main.state, "esl_integration", esl)
+        task = asyncio.create_task(esl.run())
+        await _until(lambda: esl.is_connected and esl.commands.connected)
+
+        socket = FakeMediaSocket()
+        await main.freeswitch_media_handler(socket, "leg-2")
+        assert socket.close_code == 1013
+        assert "leg-2" not in stream_manager.connections
+        assert [c for c in fs.commands if c.startswith("uuid_kill leg-2")]
+        await _until(lambda: call_handler.terminated == ["leg-2"])
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_partials_reach_clients_but_not_freeswitch():
+    partial = {"type": "partial", "text": "namaste", "committed": ""}
+
+    freeswitch_socket = FakeMediaSocket()
+    await MediaLeg.freeswitch(freeswitch_socket, tts_sample_rate=22050).send_json(partial)
+    assert freeswitch_socket.sent == []
+
+    client_socket = FakeMediaSocket()
+    client = MediaLeg(client_socket, AudioTranscoder("ulaw", tts_sample_rate=22050))
+    await client.send_json(partial)
+    assert client_socket.sent == [partial]
+
+
+class DrainingPipeline:
+    """Reads the call's audio until the stream closes, like VoicePipeline._ingest."""
+
+    instances = []
+
+    def __init__(self, call_id, stream_manager, call_handler):
+        self.call_id = call_id
+        self.stream_manager = stream_manager
+        self.received = 0
+        self.drained = False
+        DrainingPipeline.instances.append(self)
+
+    async def run(self):
+        while True:
+            try:
+                chunk = await self.stream_manager.get_audio_chunk(self.call_id, timeout=0.05)
+            except BufferClosed:
+                break
+            if chunk is not None:
+                self.received += len(chunk)
+        await asyncio.sleep(0.01)  # the last utterance going through the stages
+        self.drained = True
+
+
+@pytest.mark.asyncio
+async def test_hangup_lets_the_pipeline_drain_before_terminating(monkeypatch):
+    call_handler = FakeCallHandler()
+    stream_manager = AudioStreamManager(call_handler)
+    monkeypatch.setattr(main.state, "call_handler", call_handler)
+    monkeypatch.setattr(main.state, "stream_manager", stream_manager)
+    monkeypatch.setattr(main.state, "admission", AdmissionController(None, max_calls=10))
+    monkeypatch.setattr(main, "VoicePipeline", DrainingPipeline)
+    DrainingPipeline.instances = []
+
+    socket = FakeMediaSocket()
+    socket.frame(bytes(640))
+    socket.hang_up()
+    await main._stream_call(socket, "leg-3", object())
+
+    pipeline = DrainingPipeline.instances[0]
+    assert pipeline.received == 640
+    assert pipeline.drained
+    assert call_handler.terminated == ["leg-3"]
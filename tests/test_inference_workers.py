@@ -0,0 +1,81 @@
+"""
+Tests for the inference worker IPC channel and shared-memory audio transfer
+(engines replaced by fakes, worker served in-process)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import os
+import numpy as np
+import pytest
+
+from inference_workers import WorkerServer, WorkerClient, RemoteSTT, RemoteTTS
+
+
+class FakeEngine:
+    async def transcribe_with_language(self, audio_array, language=None, prompt=None):
+        text = f"{len(audio_array)}:{audio_array.dtype}:{float(audio_array.sum()):.1f}:{language}"
+        return text, language or "ta", None if language else 0.9
+
+    async def synthesize_stream(self, text, language):
+        for word in text.split():
+            await asyncio.sleep(0)
+            yield word.encode() * 100
+
+
+def _shm_names():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+@asynccontextmanager
+async def _worker(tmp_path):
+    path = str(tmp_path / "engine.sock")
+    server_task = asyncio.ensure_future(WorkerServer(FakeEngine()).serve(path))
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    client = WorkerClient("fake", path)
+    try:
+        yield client
+    finally:
+        await client.close()
+        server_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_audio_round_trips_through_shared_memory(tmp_path):
+    before = _shm_names()
+    audio = np.full(16000, 0.5, dtype=np.float32)
+
+    async with _worker(tmp_path) as worker:
+        stt = RemoteSTT(worker)
+        results = await asyncio.gather(stt.transcribe_streaming(audio, "ta"), stt.transcribe_streaming(audio[:10]))
+        detailed = await stt.transcribe_with_language(audio[:10])
+
+    assert results == ["16000:float32:8000.0:ta", "10:float32:5.0:None"]
+    assert detailed == ("10:float32:5.0:None", "ta", 0.9)
+    assert _shm_names() == before
+
+
+@pytest.mark.asyncio
+async def test_streamed_chunks_arrive_in_order(tmp_path):
+    before = _shm_names()
+
+    async with _worker(tmp_path) as worker:
+        tts = RemoteTTS(worker)
+        chunks = [bytes(pcm) async for pcm in tts.synthesize_stream("one two three", "en")]
+
+    assert chunks == [b"one" * 100, b"two" * 100, b"three" * 100]
+    assert _shm_names() == before
+
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_frees_shared_memory(tmp_path):
+    before = _shm_names()
+
+    async with _worker(tmp_path) as worker:
+        tts = RemoteTTS(worker)
+        stream = tts.synthesize_stream("a b c d e f", "en")
+        assert bytes(await stream.__anext__()) == b"a" * 100
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+
+    assert _shm_names() == before
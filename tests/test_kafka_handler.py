@@ -0,0 +1,279 @@
+"""
+Tests for the Kafka call event producer and consumer (aiokafka replaced by fakes)
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+pytest.importorskip("aiokafka")
+
+import kafka_handler
+from aiokafka import TopicPartition
+from kafka_handler import CallEventProducer, KafkaCallEventHandler
+
+
+class FakeProducer:
+    """Records sends; delivery futures resolve when the test acknowledges them."""
+
+    instances = []
+    fail_starts = 0
+
+    def __init__(self, **config):
+        self.config = config
+        self.sent = []
+        self.deliveries = []
+        self.stopped = False
+        FakeProducer.instances.append(self)
+
+    async def start(self):
+        if FakeProducer.fail_starts:
+            FakeProducer.fail_starts -= 1
+            raise ConnectionError("broker unreachable")
+
+    async def stop(self):
+        self.stopped = True
+
+    async def send(self, topic, value=None, key=None):
+        self.sent.append((topic, key.decode(), json.loads(value)))
+        delivery = asyncio.get_running_loop().create_future()
+        self.deliveries.append(delivery)
+        return delivery
+
+
+class FakeConsumer:
+    """Serves queued batches from getmany(), empty fetches otherwise; records commits."""
+
+    def __init__(self, *topics, **config):
+        self.topics = topics
+        self.config = config
+        self.batches = []
+        self.commits = []
+        self.highwaters = {}
+        self.stopped = False
+        self.drained = asyncio.Event()
+        FakeConsumer.instance = self
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.stopped = True
+
+    async def getmany(self, timeout_ms=0, max_records=None):
+        if not self.batches:
+            self.drained.set()
+            await _real_sleep(0.001)
+            return {}
+        return self.batches.pop(0)
+
+    async def commit(self, offsets):
+        self.commits.append(offsets)
+
+    def assignment(self):
+        return set(self.highwaters)
+
+    def highwater(self, tp):
+        return self.highwaters[tp]
+
+    async def position(self, tp):
+        committed = [offsets[tp] for offsets in self.commits if tp in offsets]
+        return committed[-1] if committed else 0
+
+
+class RecordingCallHandler:
+    """Applies events slowly enough that lanes interleave."""
+
+    def __init__(self):
+        self.calls = {}
+        self.applied = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _apply(self, op, call_id):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await _real_sleep(0)
+        self.in_flight -= 1
+        self.applied.append((op, call_id))
+
+    async def get_call(self, call_id):
+        return self.calls.get(call_id)
+
+    async def create_call(self, caller_id, destination, source_language=None, call_id=None):
+        await self._apply("create", call_id)
+        self.calls[call_id] = {"caller_id": caller_id, "destination": destination}
+        return call_id
+
+    async def terminate_call(self, call_id):
+        if call_id == "poison":
+            raise RuntimeError("redis down")
+        await self._apply("terminate", call_id)
+        return True
+
+
+def _record(tp, offset, event):
+    value = event if isinstance(event, bytes) else json.dumps(event).encode()
+    return SimpleNamespace(topic=tp.topic, partition=tp.partition, offset=offset, value=value)
+
+
+@pytest.fixture
+def fake_producer(monkeypatch):
+    FakeProducer.instances = []
+    FakeProducer.fail_starts = 0
+    monkeypatch.setattr(kafka_handler, "AIOKafkaProducer", FakeProducer)
+    monkeypatch.setattr(kafka_handler.asyncio, "sleep", _no_sleep)
+    return FakeProducer
+
+
+_real_sleep = asyncio.sleep
+
+
+async def _no_sleep(delay):
+    await _real_sleep(0)
+
+
+def _delivery_failures():
+    return REGISTRY.get_sample_value("kafka_producer_errors_total", {"reason": "delivery"}) or 0
+
+
+async def _settle():
+    for _ in range(5):
+        await _real_sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_publish_buffers_without_a_broker_and_drops_oldest():
+    producer = CallEventProducer(["localhost:9092"], topic="events", max_buffered=2)
+
+    assert producer.publish("call.created", "a")
+    assert producer.publish("call.created", "b")
+    assert not producer.publish("call.created", "c")
+
+    assert [call_id for _, call_id, _ in producer._buffer] == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_events_are_keyed_by_call_and_sent_in_order(fake_producer):
+    fake_producer.fail_starts = 1
+    producer = CallEventProducer(["localhost:9092"], topic="events", compression="gzip", linger_ms=5)
+    for i in range(3):
+        producer.publish("call.stats", f"call-{i % 2}", {"seq": i})
+
+    task = asyncio.create_task(producer.run())
+    await _settle()
+
+    kafka = fake_producer.instances[-1]
+    assert len(fake_producer.instances) == 2
+    assert kafka.config["compression_type"] == "gzip"
+    assert kafka.config["linger_ms"] == 5
+    assert [(key, event["data"]["seq"]) for _, key, event in kafka.sent] == [
+        ("call-0", 0), ("call-1", 1), ("call-0", 2),
+    ]
+    assert {topic for topic, _, _ in kafka.sent} == {"events"}
+
+    failed_before = _delivery_failures()
+    kafka.deliveries[0].set_result(None)
+    kafka.deliveries[1].set_exception(ConnectionError("not leader"))
+    await _settle()
+    assert _delivery_failures() == failed_before + 1
+
+    producer.publish("call.terminated", "call-1")
+    await _settle()
+    _, key, event = kafka.sent[-1]
+    assert (key, event["event_type"]) == ("call-1", "call.terminated")
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert kafka.stopped
+
+
+def test_published_events_go_to_a_topic_the_gateway_does_not_consume():
+    handler = KafkaCallEventHandler(["localhost:9092"])
+    assert handler.producer.topic == "voice-gateway-events"
+    assert handler.producer.topic not in handler.topics
+    with pytest.raises(ValueError):
+        KafkaCallEventHandler(["localhost:9092"], topics=["voice-calls", "voice-gateway-events"])
+
+
+@pytest.mark.asyncio
+async def test_consumer_keeps_per_call_order_and_commits_after_processing(monkeypatch):
+    monkeypatch.setattr(kafka_handler, "AIOKafkaConsumer", FakeConsumer)
+    calls = TopicPartition("calls", 0)
+    events = TopicPartition("events", 0)
+    call_handler = RecordingCallHandler()
+    handler = KafkaCallEventHandler(
+        ["localhost:9092"], call_handler, topics=["calls", "events"], workers=4,
+    )
+
+    task = asyncio.create_task(handler.consume_events())
+    await _settle()
+    consumer = FakeConsumer.instance
+    assert consumer.topics == ("calls", "events")
+    assert consumer.config["enable_auto_commit"] is False
+    consumer.highwaters = {calls: 4, events: 9}
+    consumer.batches.append({
+        calls: [
+            _record(calls, 0, {"event_type": "call.created", "call_id": "a", "caller_id": "1001"}),
+            _record(calls, 1, {"event_type": "call.created", "call_id": "b", "data": {"caller_id": "1002"}}),
+            _record(calls, 2, b"not json"),
+            _record(calls, 3, {"event_type": "call.created", "call_id": "a"}),
+        ],
+        events: [
+            _record(events, 7, {"event_type": "call.terminated", "call_id": "a"}),
+            _record(events, 8, {"event_type": "call.terminated", "call_id": "poison"}),
+        ],
+    })
+    consumer.drained.clear()
+    await asyncio.wait_for(consumer.drained.wait(), 1)
+
+    # The redelivered call.created for "a" is skipped; "a" terminates after it was created
+    applied = call_handler.applied
+    assert sorted(applied) == [("create", "a"), ("create", "b"), ("terminate", "a")]
+    assert applied.index(("create", "a")) < applied.index(("terminate", "a"))
+    assert call_handler.max_in_flight > 1
+    assert call_handler.calls["b"]["caller_id"] == "1002"
+    assert consumer.commits == [{calls: 4, events: 9}]
+    assert REGISTRY.get_sample_value("kafka_consumer_lag", {"topic": "events", "partition": "0"}) == 0
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert consumer.stopped
+
+
+@pytest.mark.asyncio
+async def test_consumer_skips_records_without_a_string_call_id(monkeypatch):
+    monkeypatch.setattr(kafka_handler, "AIOKafkaConsumer", FakeConsumer)
+    calls = TopicPartition("calls", 0)
+    call_handler = RecordingCallHandler()
+    handler = KafkaCallEventHandler(["localhost:9092"], call_handler, topics=["calls"], workers=2)
+    invalid_before = REGISTRY.get_sample_value("kafka_consumer_events_total", {"result": "invalid"}) or 0
+
+    task = asyncio.create_task(handler.consume_events())
+    await _settle()
+    consumer = FakeConsumer.instance
+    consumer.highwaters = {calls: 5}
+    consumer.batches.append({
+        calls: [
+            _record(calls, 0, {"event_type": "call.created", "call_id": 123}),
+            _record(calls, 1, {"event_type": "call.created", "call_id": ["a"]}),
+            _record(calls, 2, {"event_type": "call.created", "call_id": ""}),
+            _record(calls, 3, [{"call_id": "a"}]),
+            _record(calls, 4, {"event_type": "call.created", "call_id": "a"}),
+        ],
+    })
+    consumer.drained.clear()
+    await asyncio.wait_for(consumer.drained.wait(), 1)
+
+    assert call_handler.applied == [("create", "a")]
+    assert REGISTRY.get_sample_value("kafka_consumer_events_total", {"result": "invalid"}) == invalid_before + 4
+    assert consumer.commits == [{calls: 5}]
+    assert not task.done()
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
@@ -0,0 +1,94 @@
+"""
+Tests for per-call language resolution with hysteresis and pinning
+"""
+import pytest
+from language_resolver import CallLanguage
+
+
+class FakeDetector:
+    def __init__(self, result=("hindi", 0.8)):
+        self.result = result
+        self.calls = 0
+
+    async def detect_with_confidence(self, text):
+        self.calls += 1
+        return self.result
+
+
+def _resolver(detector=None, **overrides):
+    params = dict(min_confidence=0.6, switch_margin=0.25, smoothing=0.5, pin_after=3, recheck_every=4)
+    params.update(overrides)
+    return CallLanguage(detector or FakeDetector(), **params)
+
+
+@pytest.mark.asyncio
+async def test_confident_whisper_language_skips_fasttext():
+    detector = FakeDetector()
+    lang = _resolver(detector)
+
+    assert await lang.resolve("vanakkam", "ta", 0.95) == "tamil"
+    assert detector.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_low_confidence_falls_back_to_fasttext():
+    detector = FakeDetector(("marathi", 0.9))
+    lang = _resolver(detector)
+
+    assert await lang.resolve("namaskar", "hi", 0.3) == "marathi"
+    # Languages outside the supported set also defer to fastText
+    assert await lang.resolve("namaskar", "ur", 0.99) == "marathi"
+    assert detector.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_single_outlier_does_not_flip_the_call():
+    lang = _resolver(pin_after=10)
+    for _ in range(3):
+        await lang.resolve("x", "ta", 0.9)
+
+    assert await lang.resolve("ok", "en", 0.9) == "tamil"
+    assert await lang.resolve("x", "ta", 0.9) == "tamil"
+    # A sustained change does switch
+    assert await lang.resolve("y", "te", 0.9) == "tamil"
+    assert await lang.resolve("y", "te", 0.9) == "telugu"
+
+
+@pytest.mark.asyncio
+async def test_stable_language_is_pinned_with_periodic_recheck():
+    lang = _resolver()
+    assert lang.stt_language() is None
+    for _ in range(3):
+        await lang.resolve("x", "ta", 0.9)
+
+    assert lang.pinned
+    hints = [lang.stt_language() for _ in range(4)]
+    assert hints == ["ta", "ta", "ta", None]
+    # Pinned decodes report no probability and keep the call language
+    assert await lang.resolve("x", "ta", None) == "tamil"
+
+
+@pytest.mark.asyncio
+async def test_partial_decodes_do_not_advance_recheck():
+    lang = _resolver()
+    for _ in range(3):
+        await lang.resolve("x", "ta", 0.9)
+
+    hints = []
+    for _ in range(4):
+        assert [lang.stt_language(final=False) for _ in range(5)] == ["ta"] * 5
+        hints.append(lang.stt_language())
+    assert hints == ["ta", "ta", "ta", None]
+
+
+@pytest.mark.asyncio
+async def test_switch_unpins():
+    lang = _resolver()
+    for _ in range(3):
+        await lang.resolve("x", "ta", 0.9)
+    await lang.resolve("y", "kn", 0.95)
+    await lang.resolve("y", "kn", 0.95)
+
+    assert lang.language == "kannada"
+    assert not lang.pinned
+    assert lang.stt_language() is None
@@ -0,0 +1,249 @@
+"""
+Tests for the overlapped per-call pipeline stages (models replaced by fakes)
+"""
+import asyncio
+import numpy as np
+import pytest
+
+import pipeline
+from audio_buffer import BufferClosed
+
+SAMPLE_RATE = 16000
+
+
+def _utterance() -> bytes:
+    t = np.arange(int(SAMPLE_RATE * 0.5)) / SAMPLE_RATE
+    tone = (np.sin(2 * np.pi * 220 * t) * 0.3 * 32767).astype(np.int16)
+    return tone.tobytes() + np.zeros(int(SAMPLE_RATE * 0.4), dtype=np.int16).tobytes()
+
+
+class FakeCallHandler:
+    def __init__(self):
+        self.ended = asyncio.Event()
+        self.transcript = []
+
+    async def get_call(self, call_id):
+        return {"status": "active", "target_language": "hindi"}
+
+    async def update_language(self, call_id, language):
+        return True
+
+    def termination_event(self, call_id):
+        return self.ended
+
+    def release(self, call_id):
+        pass
+
+    def record_stat(self, call_id, field, amount=1):
+        pass
+
+    def append_transcript(self, call_id, entry):
+        self.transcript.append(entry)
+
+
+class FakeStreamManager:
+    """Plays the packets, then hangs up once the trailing silence has been read."""
+
+    def __init__(self, packets, ws, call_handler):
+        self.packets = list(packets)
+        self.connections = {"call-1": ws}
+        self.call_handler = call_handler
+        self.drained = False
+
+    async def get_audio_chunk(self, call_id, timeout=1.0):
+        if self.packets:
+            return self.packets.pop(0)
+        if self.drained:
+            self.call_handler.ended.set()
+        self.drained = True
+        await asyncio.sleep(0.01)
+        return None
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_bytes(self, data):
+        self.sent.append(bytes(data))
+
+
+class FakeSTT:
+    def __init__(self, events):
+        self.events = events
+        self.count = 0
+
+    async def transcribe_with_language(self, audio, language=None, prompt=None):
+        self.count += 1
+        n = self.count
+        self.events.append(("stt", n))
+        await asyncio.sleep(0.01)
+        return f"utt{n}", "ta", 0.95
+
+    async def transcribe_segments(self, audio, language=None, prompt=None):
+        self.events.append(("segments", language, prompt))
+        for i in range(3):
+            self.events.append(("segment", i))
+            await asyncio.sleep(0.02)
+            yield f"seg{i}", "mr", 0.97
+
+
+class FakeDetector:
+    def __init__(self):
+        self.calls = 0
+
+    async def detect_with_confidence(self, text):
+        self.calls += 1
+        return "tamil", 0.9
+
+
+class FakeTranslator:
+    async def translate(self, text, source_lang, target_lang):
+        return text.upper()
+
+
+class FakeTTS:
+    def __init__(self, events):
+        self.events = events
+
+    async def synthesize_stream(self, text, language):
+        # TTS is the slow stage: first utterance takes longest
+        await asyncio.sleep(0.1 if text == "UTT1" else 0.01)
+        self.events.append(("tts-done", text))
+        yield text.encode()
+
+
+@pytest.mark.asyncio
+async def test_stages_overlap_and_preserve_order(monkeypatch):
+    events = []
+    ws = FakeWebSocket()
+    monkeypatch.setattr(pipeline, "_models_loaded", True)
+    monkeypatch.setattr(pipeline, "_stt", FakeSTT(events))
+    monkeypatch.setattr(pipeline, "_detector", FakeDetector())
+    monkeypatch.setattr(pipeline, "_translator", FakeTranslator())
+    monkeypatch.setattr(pipeline, "_tts", FakeTTS(events))
+
+    handler = FakeCallHandler()
+    vp = pipeline.VoicePipeline(
+        "call-1", FakeStreamManager([_utterance() for _ in range(3)], ws, handler), handler
+    )
+    await asyncio.wait_for(vp.run(), timeout=5)
+
+    assert ws.sent == [b"UTT1", b"UTT2", b"UTT3"]
+    assert [(e["source_text"], e["translation"]) for e in handler.transcript] == [
+        ("utt1", "UTT1"), ("utt2", "UTT2"), ("utt3", "UTT3"),
+    ]
+    assert set(handler.transcript[0]["timings"]) == {"stt_ms", "translation_ms", "tts_ms"}
+    # Later segments were transcribed while the first was still synthesizing
+    assert events.index(("stt", 3)) < events.index(("tts-done", "UTT1"))
+    assert vp.stage_depths() == {"stt": 0, "translate": 0, "tts": 0}
+
+
+@pytest.mark.asyncio
+async def test_long_utterance_forwards_segments_as_they_decode(monkeypatch):
+    events = []
+    ws = FakeWebSocket()
+    monkeypatch.setattr(pipeline, "_models_loaded", True)
+    monkeypatch.setattr(pipeline, "_stt", FakeSTT(events))
+    monkeypatch.setattr(pipeline, "_detector", FakeDetector())
+    monkeypatch.setattr(pipeline, "_translator", FakeTranslator())
+    monkeypatch.setattr(pipeline, "_tts", FakeTTS(events))
+    monkeypatch.setattr(pipeline.settings, "STT_SEGMENT_STREAM_SECONDS", 0.25)
+
+    handler = FakeCallHandler()
+    vp = pipeline.VoicePipeline("call-1", FakeStreamManager([_utterance()], ws, handler), handler)
+    await asyncio.wait_for(vp.run(), timeout=5)
+
+    assert ws.sent == [b"SEG0", b"SEG1", b"SEG2"]
+    # The first segment was synthesized before the last one finished decoding
+    assert events.index(("tts-done", "SEG0")) < events.index(("segment", 2))
+
+
+@pytest.mark.asyncio
+async def test_long_utterance_language_comes_from_whisper(monkeypatch):
+    events = []
+    detector = FakeDetector()
+    languages = []
+    monkeypatch.setattr(pipeline, "_models_loaded", True)
+    monkeypatch.setattr(pipeline, "_stt", FakeSTT(events))
+    monkeypatch.setattr(pipeline, "_detector", detector)
+    monkeypatch.setattr(pipeline, "_translator", FakeTranslator())
+    monkeypatch.setattr(pipeline, "_tts", FakeTTS(events))
+    monkeypatch.setattr(pipeline.settings, "STT_SEGMENT_STREAM_SECONDS", 0.25)
+
+    handler = FakeCallHandler()
+
+    async def update_language(call_id, language):
+        languages.append(language)
+        return True
+
+    handler.update_language = update_language
+    vp = pipeline.VoicePipeline("call-1", FakeStreamManager([_utterance()], FakeWebSocket(), handler), handler)
+    segments = await vp._transcribe(_utterance(), prompt="earlier context")
+    text, source_lang, _ = await asyncio.wait_for(segments.__anext__(), timeout=5)
+    await segments.aclose()
+
+    assert (text, source_lang) == ("seg0", "marathi")
+    assert ("segments", None, "earlier context") in events
+    # Whisper's confident language ID was used; fastText was never consulted
+    assert detector.calls == 0
+    assert languages == ["marathi"]
+
+
+@pytest.mark.asyncio
+async def test_blip_dropped_by_the_endpointer_closes_the_partial_utterance(monkeypatch):
+    events = []
+    ws = FakeWebSocket()
+    monkeypatch.setattr(pipeline, "_models_loaded", True)
+    monkeypatch.setattr(pipeline, "_stt", FakeSTT(events))
+    monkeypatch.setattr(pipeline, "_detector", FakeDetector())
+    monkeypatch.setattr(pipeline, "_translator", FakeTranslator())
+    monkeypatch.setattr(pipeline, "_tts", FakeTTS(events))
+    monkeypatch.setattr(pipeline.settings, "STT_STREAMING", True)
+    monkeypatch.setattr(pipeline.settings, "STT_PARTIAL_INTERVAL_MS", 60_000)
+
+    t = np.arange(int(SAMPLE_RATE * 0.06)) / SAMPLE_RATE
+    blip = (np.sin(2 * np.pi * 220 * t) * 0.3 * 32767).astype(np.int16).tobytes()
+    blip += np.zeros(int(SAMPLE_RATE * 0.5), dtype=np.int16).tobytes()
+
+    handler = FakeCallHandler()
+    vp = pipeline.VoicePipeline("call-1", FakeStreamManager([blip, _utterance()], ws, handler), handler)
+    utterances = []
+    end_utterance = vp.transcriber.end_utterance
+
+    def recording_end_utterance():
+        utterances.append(vp.transcriber.utterance)
+        return end_utterance()
+
+    vp.transcriber.end_utterance = recording_end_utterance
+    await asyncio.wait_for(vp.run(), timeout=5)
+
+    # The blip was dropped inside feed(), yet its utterance was still closed
+    assert utterances == [0, 1]
+    assert ws.sent == [b"UTT1"]
+
+
+@pytest.mark.asyncio
+async def test_closed_stream_ends_the_pipeline_with_the_last_utterance(monkeypatch):
+    events = []
+    ws = FakeWebSocket()
+    monkeypatch.setattr(pipeline, "_models_loaded", True)
+    monkeypatch.setattr(pipeline, "_stt", FakeSTT(events))
+    monkeypatch.setattr(pipeline, "_detector", FakeDetector())
+    monkeypatch.setattr(pipeline, "_translator", FakeTranslator())
+    monkeypatch.setattr(pipeline, "_tts", FakeTTS(events))
+
+    class ClosingStreamManager(FakeStreamManager):
+        async def get_audio_chunk(self, call_id, timeout=1.0):
+            if self.packets:
+                return self.packets.pop(0)
+            raise BufferClosed()
+
+    # Hung up mid-sentence: no trailing silence, and the call is never marked ended
+    speech = _utterance()[:SAMPLE_RATE]
+    handler = FakeCallHandler()
+    vp = pipeline.VoicePipeline("call-1", ClosingStreamManager([speech], ws, handler), handler)
+    await asyncio.wait_for(vp.run(), timeout=5)
+
+    assert ws.sent == [b"UTT1"]
+    assert not handler.ended.is_set()
@@ -0,0 +1,61 @@
+"""
+Tests for incremental transcription with local-agreement commits
+"""
+import numpy as np
+import pytest
+from streaming_stt import StreamingTranscriber
+
+
+class ScriptedSTT:
+    def __init__(self, hypotheses):
+        self.hypotheses = list(hypotheses)
+        self.prompts = []
+
+    async def transcribe_streaming(self, audio_array, language=None, prompt=None):
+        self.prompts.append(prompt)
+        return self.hypotheses.pop(0)
+
+    async def transcribe_with_language(self, audio_array, language=None, prompt=None):
+        return await self.transcribe_streaming(audio_array, language, prompt), "en", 0.9
+
+
+AUDIO = np.zeros(8000, dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_commits_agreed_prefix_only():
+    stt = ScriptedSTT(["my lap", "my laptop is", "my laptop is not working."])
+    tr = StreamingTranscriber(stt, prompt_max_chars=200)
+
+    assert await tr.update(0, AUDIO) == ("my lap", "")
+    assert await tr.update(0, AUDIO) == ("my laptop is", "my")
+    assert await tr.update(0, AUDIO) == ("my laptop is not working.", "my laptop is")
+    # Not at a sentence end yet, so nothing is forwarded to translation
+    assert tr.take_forwardable() is None
+
+
+@pytest.mark.asyncio
+async def test_forwarded_sentence_is_skipped_by_final_decode():
+    stt = ScriptedSTT([
+        "Hello. My",
+        "Hello. My laptop",
+        "Hello. My laptop is broken.",
+    ])
+    tr = StreamingTranscriber(stt, prompt_max_chars=200)
+    await tr.update(0, AUDIO)
+    await tr.update(0, AUDIO)
+
+    assert tr.take_forwardable() == "Hello."
+    forwarded, prompt = tr.end_utterance()
+    assert (forwarded, prompt) == (1, None)
+    assert await tr.finalize(AUDIO, forwarded, prompt) == ("My laptop is broken.", "en", 0.9)
+    # Committed text is carried forward as prompt context
+    assert tr.prompt == "Hello. My laptop is broken."
+
+
+@pytest.mark.asyncio
+async def test_stale_partial_is_discarded():
+    stt = ScriptedSTT(["late result"])
+    tr = StreamingTranscriber(stt, prompt_max_chars=200)
+    tr.end_utterance()
+    assert await tr.update(0, AUDIO) is None
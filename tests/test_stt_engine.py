@@ -0,0 +1,144 @@
+"""
+Tests for WhisperSTT segment streaming (model replaced by a fake)
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from executors import EngineExecutor
+from stt_engine import WhisperSTT
+
+SEGMENT_SECONDS = 0.05
+
+
+class FakeWhisperModel:
+    """Mimics faster-whisper: transcribe() returns a lazy generator that decodes while iterated."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.decoded = 0
+
+    def transcribe(self, audio, language=None, beam_size=5, vad_filter=False, initial_prompt=None):
+        def segments():
+            for text in self.texts:
+                time.sleep(SEGMENT_SECONDS)  # blocking decode work
+                self.decoded += 1
+                yield SimpleNamespace(text=f" {text}")
+        return segments(), SimpleNamespace(language=language or "ta", language_probability=0.93)
+
+
+def _make_stt(model) -> WhisperSTT:
+    stt = WhisperSTT.__new__(WhisperSTT)
+    stt.model = model
+    stt.executor = EngineExecutor("stt", 1, 1)
+    return stt
+
+
+@pytest.mark.asyncio
+async def test_segment_iteration_does_not_block_event_loop():
+    stt = _make_stt(FakeWhisperModel([f"seg{i}" for i in range(6)]))
+    stalls = []
+    running = True
+
+    async def heartbeat():
+        while running:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - t0)
+
+    beat = asyncio.create_task(heartbeat())
+    received = []
+    async for text, language, probability in stt.transcribe_segments(np.zeros(16000, dtype=np.float32)):
+        assert (language, probability) == ("ta", 0.93)
+        received.append((text, time.perf_counter()))
+    running = False
+    await beat
+
+    assert [text for text, _ in received] == [f"seg{i}" for i in range(6)]
+    # Six 50ms segments decoded off-loop: the loop never stalls for a segment
+    assert max(stalls) < SEGMENT_SECONDS
+    # Segments arrive as they decode, not all at the end
+    assert received[-1][1] - received[0][1] >= SEGMENT_SECONDS * 4
+
+
+@pytest.mark.asyncio
+async def test_segment_stream_stops_decoding_when_consumer_leaves():
+    model = FakeWhisperModel([f"seg{i}" for i in range(20)])
+    stt = _make_stt(model)
+
+    stream = stt.transcribe_segments(np.zeros(16000, dtype=np.float32))
+    assert await stream.__anext__() == ("seg0", "ta", 0.93)
+    await stream.aclose()
+    await asyncio.sleep(SEGMENT_SECONDS * 3)
+
+    assert model.decoded < 20
+
+
+@pytest.mark.asyncio
+async def test_segment_stream_surfaces_decode_errors():
+    class BrokenModel:
+        def transcribe(self, *args, **kwargs):
+            raise RuntimeError("decoder exploded")
+
+    stt = _make_stt(BrokenModel())
+    with pytest.raises(RuntimeError, match="decoder exploded"):
+        async for _ in stt.transcribe_segments(np.zeros(16000, dtype=np.float32)):
+            pass
+
+
+class FakeBatchedPipeline:
+    """
+    Mimics BatchedInferencePipeline with clip_timestamps: clip bounds in seconds
+    are truncated to samples, and each clip decodes to one segment starting at
+    its offset rounded to the millisecond. A clip's text names the owner whose
+    audio (filled with the owner's number) it covers.
+    """
+
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.batch_sizes = []
+
+    def transcribe(self, audio, language=None, beam_size=5, batch_size=8, vad_filter=False,
+                   clip_timestamps=None, without_timestamps=True, initial_prompt=None):
+        self.batch_sizes.append(batch_size)
+        segments = []
+        for clip in clip_timestamps:
+            start, end = int(clip["start"] * self.sample_rate), int(clip["end"] * self.sample_rate)
+            owners = sorted({int(value) for value in audio[start:end]})
+            segments.append(SimpleNamespace(
+                start=round(start / self.sample_rate, 3),
+                text=" " + "+".join(f"owner{owner}" for owner in owners),
+            ))
+        return iter(segments), SimpleNamespace(language=language)
+
+
+def test_clip_decodes_map_back_to_their_owners():
+    stt = _make_stt(None)
+    stt.batched_model = FakeBatchedPipeline()
+    stt.sample_rate = 16000
+    lengths = [
+        16000,       # owner0: 1 s
+        0,           # owner1: empty, shares its offset with owner2
+        8000,        # owner2: starts exactly on the boundary after owner0
+        10,          # owner3: under a millisecond, too short to decode
+        16000 * 31,  # owner4: split into a 30 s and a 1 s clip
+        4007,        # owner5: starts off the millisecond grid
+    ]
+    audio_arrays = [np.full(n, owner, dtype=np.float32) for owner, n in enumerate(lengths)]
+
+    texts = stt._decode_clips_sync(audio_arrays, "ta")
+
+    assert texts == ["owner0", "", "owner2", "", "owner4 owner4", "owner5"]
+    assert stt.batched_model.batch_sizes == [5]
+
+
+def test_no_decodable_audio_skips_the_model():
+    stt = _make_stt(None)
+    stt.batched_model = FakeBatchedPipeline()
+    stt.sample_rate = 16000
+
+    assert stt._decode_clips_sync([np.zeros(0, dtype=np.float32), np.zeros(5, dtype=np.float32)], "ta") == ["", ""]
+    assert stt.batched_model.batch_sizes == []
@@ -0,0 +1,36 @@
+"""
+Tests for the two-tier translation cache (local LRU tier)
+"""
+import pytest
+from translation_cache import TranslationCache
+
+
+@pytest.mark.asyncio
+async def test_normalized_hit():
+    cache = TranslationCache("nllb", max_entries=10, max_bytes=10_000, ttl_seconds=60)
+    cache.put("My laptop  is not working", "eng_Latn", "hin_Deva", "translated")
+
+    assert await cache.get("my laptop is not working ", "eng_Latn", "hin_Deva") == "translated"
+    assert await cache.get("my laptop is not working", "eng_Latn", "tam_Taml") is None
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_by_entries():
+    cache = TranslationCache("nllb", max_entries=2, max_bytes=10_000, ttl_seconds=60)
+    cache.put("one", "a", "b", "1")
+    cache.put("two", "a", "b", "2")
+    await cache.get("one", "a", "b")  # refresh "one"
+    cache.put("three", "a", "b", "3")
+
+    assert len(cache) == 2
+    assert await cache.get("two", "a", "b") is None
+    assert await cache.get("one", "a", "b") == "1"
+
+
+@pytest.mark.asyncio
+async def test_byte_budget():
+    cache = TranslationCache("nllb", max_entries=1000, max_bytes=300, ttl_seconds=60)
+    for i in range(20):
+        cache.put(f"phrase {i}", "a", "b", "x" * 40)
+    assert cache._bytes <= 300
+    assert await cache.get("phrase 19", "a", "b") == "x" * 40
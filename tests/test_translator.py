@@ -0,0 +1,131 @@
+"""
+Tests for NLLB request encoding and cross-call batching (tokenizer and model replaced by fakes)
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("transformers")
+
+from batching import DynamicBatcher
+from translation_cache import TranslationCache
+from translator import TranslationEngine
+
+EOS, PAD = 2, 1
+LANG_IDS = {"tam_Taml": 901, "hin_Deva": 902, "eng_Latn": 903}
+# The fake model "translates" a word by shifting its id; decode upper-cases shifted ids
+TRANSLATED = 10000
+
+
+class FakeBatch(dict):
+    def to(self, device):
+        return self
+
+
+class FakeNLLBTokenizer:
+    def __init__(self, legacy_behaviour=False):
+        self.legacy_behaviour = legacy_behaviour
+        self.eos_token_id = EOS
+        self.pad_token_id = PAD
+        self.words = []
+
+    def __call__(self, text, add_special_tokens=True):
+        assert not add_special_tokens
+        ids = []
+        for word in text.split():
+            if word not in self.words:
+                self.words.append(word)
+            ids.append(10 + self.words.index(word))
+        return {"input_ids": ids}
+
+    def convert_tokens_to_ids(self, token):
+        return LANG_IDS[token]
+
+    def pad(self, encoded, padding=True, return_tensors=None):
+        rows = encoded["input_ids"]
+        width = max(len(row) for row in rows)
+        return FakeBatch(
+            input_ids=[row + [PAD] * (width - len(row)) for row in rows],
+            attention_mask=[[1] * len(row) + [0] * (width - len(row)) for row in rows],
+        )
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        specials = {EOS, PAD, *LANG_IDS.values()}
+        return [
+            " ".join(self.words[i - TRANSLATED - 10].upper() for i in row if i not in specials)
+            for row in sequences
+        ]
+
+
+class FakeNLLBModel:
+    def __init__(self):
+        self.batches = []
+
+    def generate(self, input_ids, attention_mask, forced_bos_token_id, **kwargs):
+        self.batches.append((input_ids, attention_mask, forced_bos_token_id))
+        specials = {EOS, PAD, *LANG_IDS.values()}
+        return [
+            [EOS, forced_bos_token_id] + [TRANSLATED + i for i in row if i not in specials] + [EOS]
+            for row in input_ids
+        ]
+
+
+def _make_engine(legacy_behaviour=False) -> TranslationEngine:
+    engine = TranslationEngine.__new__(TranslationEngine)
+    engine.device = "cpu"
+    engine.tokenizer = FakeNLLBTokenizer(legacy_behaviour)
+    engine.model = FakeNLLBModel()
+    engine.lang_codes = {"tamil": "tam_Taml", "hindi": "hin_Deva", "english": "eng_Latn"}
+    engine.cache = TranslationCache("nllb", max_entries=100, max_bytes=100_000, ttl_seconds=60)
+    engine.coalescer = DynamicBatcher("translation", engine._translate_batch_sync, max_batch_size=8, max_wait_ms=20)
+    return engine
+
+
+@pytest.mark.parametrize("legacy_behaviour, expected", [
+    (False, [LANG_IDS["tam_Taml"], 10, 11, EOS]),
+    (True, [10, 11, EOS, LANG_IDS["tam_Taml"]]),
+])
+def test_language_code_and_eos_follow_the_tokenizer_mode(legacy_behaviour, expected):
+    engine = _make_engine(legacy_behaviour)
+    assert engine._encode("laptop broken", "tam_Taml") == expected
+
+
+@pytest.mark.asyncio
+async def test_padded_batch_results_return_to_their_callers():
+    engine = _make_engine()
+    texts = ["printer", "my laptop is broken", "reset my password please"]
+
+    results = await asyncio.gather(*(engine.translate(text, "tamil", "english") for text in texts))
+
+    assert results == [text.upper() for text in texts]
+    assert len(engine.model.batches) == 1
+    input_ids, attention_mask, forced_bos = engine.model.batches[0]
+    assert forced_bos == LANG_IDS["eng_Latn"]
+    assert len({len(row) for row in input_ids}) == 1
+    assert [sum(mask) for mask in attention_mask] == [3, 6, 6]
+    assert input_ids[0] == [LANG_IDS["tam_Taml"], 10, EOS, PAD, PAD, PAD]
+
+
+@pytest.mark.asyncio
+async def test_language_pairs_never_share_a_batch():
+    engine = _make_engine()
+    requests = [
+        ("vanakkam", "tamil", "english"),
+        ("namaste", "hindi", "english"),
+        ("nandri", "tamil", "english"),
+        ("dhanyavaad", "hindi", "tamil"),
+    ]
+
+    results = await asyncio.gather(*(engine.translate(*request) for request in requests))
+
+    assert results == ["VANAKKAM", "NAMASTE", "NANDRI", "DHANYAVAAD"]
+    pairs = []
+    for input_ids, _, forced_bos in engine.model.batches:
+        sources = {row[0] for row in input_ids}
+        assert len(sources) == 1
+        pairs.append((sources.pop(), forced_bos, len(input_ids)))
+    assert sorted(pairs) == sorted([
+        (LANG_IDS["tam_Taml"], LANG_IDS["eng_Latn"], 2),
+        (LANG_IDS["hin_Deva"], LANG_IDS["eng_Latn"], 1),
+        (LANG_IDS["hin_Deva"], LANG_IDS["tam_Taml"], 1),
+    ])
@@ -0,0 +1,73 @@
+"""
+Tests for the memory-mapped TTS audio cache
+"""
+import threading
+
+import pytest
+from tts_cache import AudioCache
+
+
+def test_hit_is_zero_copy_view(tmp_path):
+    cache = AudioCache("glow-tts", 22050, directory=str(tmp_path), max_bytes=1_000_000)
+    cache.put_sync("Please hold", "hin_Deva", b"\x01\x02" * 100)
+
+    view = cache.get("Please hold", "hin_Deva")
+    assert isinstance(view, memoryview)
+    assert view.tobytes() == b"\x01\x02" * 100
+    assert cache.get("Please hold", "tam_Taml") is None
+
+
+def test_lru_eviction_by_size(tmp_path):
+    cache = AudioCache("glow-tts", 22050, directory=str(tmp_path), max_bytes=250)
+    cache.put_sync("a", "x", b"a" * 100)
+    cache.put_sync("b", "x", b"b" * 100)
+    assert cache.get("a", "x") is not None  # refresh "a"
+    cache.put_sync("c", "x", b"c" * 100)
+
+    assert cache.contains("a", "x")
+    assert not cache.contains("b", "x")
+    assert len(list(tmp_path.glob("*.pcm"))) == 2
+
+
+def test_index_survives_restart(tmp_path):
+    AudioCache("glow-tts", 22050, directory=str(tmp_path)).put_sync("Hello", "x", b"pcm")
+    reopened = AudioCache("glow-tts", 22050, directory=str(tmp_path))
+    assert reopened.get("Hello", "x").tobytes() == b"pcm"
+
+
+@pytest.mark.asyncio
+async def test_async_put(tmp_path):
+    cache = AudioCache("glow-tts", 22050, directory=str(tmp_path))
+    writer_threads = []
+    write_file = cache._write_file
+
+    def recording_write(key, pcm):
+        writer_threads.append(threading.current_thread().name)
+        return write_file(key, pcm)
+
+    cache._write_file = recording_write
+    await cache.put("Hello", "x", b"pcm")
+    assert cache.contains("Hello", "x")
+    assert writer_threads[0].startswith("tts-cache")
+
+
+def test_presynthesis_thread_and_callers_keep_the_index_consistent(tmp_path):
+    cache = AudioCache("glow-tts", 22050, directory=str(tmp_path), max_bytes=2_000)
+    errors = []
+
+    def presynthesize():
+        try:
+            for i in range(500):
+                cache.put_sync(f"prompt {i % 40}", "x", b"p" * 100)
+        except Exception as e:
+            errors.append(e)
+
+    preload = threading.Thread(target=presynthesize)
+    preload.start()
+    while preload.is_alive():
+        for i in range(40):
+            cache.get(f"prompt {i}", "x")
+    preload.join()
+
+    assert not errors
+    assert cache._bytes == sum(cache._index.values()) <= 2_000
@@ -0,0 +1,121 @@
+"""
+Tests for TTS sentence splitting and streaming synthesis (synthesizer replaced by a stub)
+"""
+import asyncio
+
+import pytest
+
+from tts_engine import CoquiTTS, split_sentences
+
+
+def test_splits_on_sentence_ends():
+    assert split_sentences("Hello there. How can I help?  Please hold!") == [
+        "Hello there.", "How can I help?", "Please hold!",
+    ]
+
+
+def test_splits_on_danda():
+    assert split_sentences("नमस्ते। आपकी क्या सहायता कर सकता हूँ?") == [
+        "नमस्ते।", "आपकी क्या सहायता कर सकता हूँ?",
+    ]
+
+
+def test_long_sentence_broken_at_clauses():
+    clause = "my laptop is not working after the update"
+    text = ", ".join([clause] * 6) + "."
+    units = split_sentences(text)
+    assert len(units) > 1
+    assert all(len(u) <= 120 for u in units)
+    assert " ".join(units) == text
+
+
+def test_empty_text():
+    assert split_sentences("   ") == []
+
+
+class StubSynthesizer:
+    """synthesize_view stand-in: each sentence takes its own time and returns its text as PCM."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.started = []
+        self.cancelled = []
+
+    async def synthesize_view(self, text, language):
+        self.started.append(text)
+        try:
+            await asyncio.sleep(self.delays.get(text, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        return text.encode()
+
+
+def _make_engine(synthesizer) -> CoquiTTS:
+    engine = CoquiTTS.__new__(CoquiTTS)
+    engine.synthesize_view = synthesizer.synthesize_view
+    return engine
+
+
+TEXT = "One. Two. Three."
+
+
+@pytest.mark.asyncio
+async def test_stream_keeps_sentence_order():
+    # Later sentences finish faster than earlier ones
+    engine = _make_engine(StubSynthesizer({"One.": 0.03, "Two.": 0.01, "Three.": 0}))
+    chunks = [bytes(pcm) async for pcm in engine.synthesize_stream(TEXT, "hindi")]
+    assert chunks == [b"One.", b"Two.", b"Three."]
+
+
+@pytest.mark.asyncio
+async def test_next_sentence_is_prefetched_while_current_plays():
+    synthesizer = StubSynthesizer({"Two.": 0.05})
+    engine = _make_engine(synthesizer)
+    stream = engine.synthesize_stream(TEXT, "hindi")
+
+    assert await stream.__anext__() == b"One."
+    await asyncio.sleep(0)
+    # "Two." is already synthesizing while "One." is handed to playback
+    assert synthesizer.started == ["One.", "Two."]
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    await asyncio.sleep(0.04)  # playing "One."
+    assert await stream.__anext__() == b"Two."
+    assert loop.time() - t0 < 0.09
+    await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_closing_mid_stream_cancels_the_prefetch():
+    synthesizer = StubSynthesizer({"Two.": 5})
+    engine = _make_engine(synthesizer)
+    stream = engine.synthesize_stream(TEXT, "hindi")
+
+    assert await stream.__anext__() == b"One."
+    await asyncio.sleep(0)
+    await stream.aclose()
+    await asyncio.sleep(0)
+    assert synthesizer.cancelled == ["Two."]
+    assert "Three." not in synthesizer.started
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_consumer_cancels_the_prefetch():
+    synthesizer = StubSynthesizer({"Two.": 5})
+    engine = _make_engine(synthesizer)
+    received = []
+
+    async def consume():
+        async for pcm in engine.synthesize_stream(TEXT, "hindi"):
+            received.append(pcm)
+
+    task = asyncio.ensure_future(consume())
+    while synthesizer.started != ["One.", "Two."]:
+        await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert received == [b"One."]
+    assert synthesizer.cancelled == ["Two."]
+    assert not [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
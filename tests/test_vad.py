@@ -0,0 +1,76 @@
+"""
+Tests for the streaming VAD endpointer
+"""
+import numpy as np
+from vad import UtteranceEndpointer
+
+SAMPLE_RATE = 16000
+
+
+def _tone(seconds: float, amplitude: float = 0.3) -> bytes:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * 220 * t) * amplitude * 32767).astype(np.int16).tobytes()
+
+
+def _silence(seconds: float) -> bytes:
+    return np.zeros(int(SAMPLE_RATE * seconds), dtype=np.int16).tobytes()
+
+
+def _endpointer(**overrides):
+    params = dict(
+        sample_rate=SAMPLE_RATE, frame_ms=30, hangover_ms=300,
+        min_speech_ms=250, max_speech_ms=8000,
+    )
+    params.update(overrides)
+    return UtteranceEndpointer(**params)
+
+
+def test_segment_released_on_pause():
+    """A pause longer than the hangover closes the segment without waiting for more audio"""
+    ep = _endpointer()
+    segments = ep.feed(_silence(0.5) + _tone(1.0) + _silence(0.4))
+    assert len(segments) == 1
+    # speech + pre-roll + hangover, well under a fixed 2s buffer
+    assert len(segments[0]) < 2 * SAMPLE_RATE * 1.6
+
+
+def test_silence_and_blips_are_dropped():
+    """Pure silence and sub-min-speech blips never reach STT"""
+    ep = _endpointer()
+    assert ep.feed(_silence(2.0)) == []
+    assert ep.feed(_tone(0.06) + _silence(0.5)) == []
+
+
+def test_on_close_reports_blips_and_segments_in_order():
+    closed = []
+    ep = _endpointer(on_close=closed.append)
+    segments = ep.feed(_tone(0.06) + _silence(0.5) + _tone(0.6) + _silence(0.4))
+    assert len(segments) == 1
+    assert closed == [False, True]
+
+
+def test_max_speech_cap():
+    """Continuous speech is split at the max-segment cap"""
+    ep = _endpointer(max_speech_ms=1000)
+    segments = ep.feed(_tone(3.5))
+    assert len(segments) == 3
+    assert all(len(s) <= 2 * SAMPLE_RATE for s in segments)
+
+
+def test_packets_split_across_frames():
+    """Arbitrary packet sizes produce the same segmentation as one large write"""
+    audio = _silence(0.3) + _tone(0.8) + _silence(0.5)
+    ep = _endpointer()
+    segments = []
+    for i in range(0, len(audio), 321 * 2):
+        segments.extend(ep.feed(audio[i:i + 321 * 2]))
+    assert len(segments) == 1
+
+
+def test_flush_on_stream_gap():
+    """flush() releases an in-progress utterance"""
+    ep = _endpointer()
+    assert ep.feed(_tone(0.6)) == []
+    assert ep.in_speech
+    assert ep.flush()
+    assert ep.flush() is None